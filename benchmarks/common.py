@@ -0,0 +1,90 @@
+import argparse
+import json
+import math
+import resource
+import sys
+from typing import Dict, List, Tuple, Union
+
+from sn.kb import KnowledgeBase
+from sn.sqlite_kb import SQLiteKnowledgeBase
+from benchmarks.drivers import CountingDriver
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank `p` percentile (0-100) of `values`, or `nan` if there are none."""
+
+    if len(values) == 0:
+        return math.nan
+
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """Summary of a list of latencies, in seconds. The output is in milliseconds."""
+
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": (sum(latencies) / len(latencies) * 1000) if len(latencies) > 0 else math.nan,
+        "max_ms": max(latencies) * 1000 if len(latencies) > 0 else math.nan,
+    }
+
+
+def write_report(report: dict, path: str=None):
+    """Write `report` as JSON to `path`, or to the standard output if not provided."""
+
+    output = json.dumps(report, indent=2)
+    if path is None:
+        print(output)
+    else:
+        with open(path, "w") as f:
+            f.write(output + "\n")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process, in megabytes."""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, whereas macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def add_backend_arguments(parser: argparse.ArgumentParser, default: str="stub"):
+    parser.add_argument("--backend", choices=["stub", "neo4j", "sqlite"], default=default,
+                        help="knowledge base backend: an offline stub driver, a Neo4j server or an SQLite database")
+    parser.add_argument("--sqlite-path", default="benchmark.sqlite", help="database file of the sqlite backend")
+    parser.add_argument("--wipe", action="store_true",
+                        help="run even if the knowledge base holds declarations, which are then deleted")
+    parser.add_argument("--uri", default=None, help="defaults to NEO4J_URI, or bolt://localhost:7687")
+    parser.add_argument("--db-user", default=None, help="defaults to NEO4J_USER, or neo4j")
+    parser.add_argument("--db-password", default=None, help="defaults to NEO4J_PASSWORD")
+    parser.add_argument("--namespace", default=None, help="slice of the database to use, defaults to SN_NAMESPACE, or default")
+
+
+def create_knowledge_base(args: argparse.Namespace) -> Union[KnowledgeBase, SQLiteKnowledgeBase]:
+    """Knowledge base of the backend chosen with `add_backend_arguments`."""
+
+    if args.backend == "sqlite":
+        return SQLiteKnowledgeBase(args.sqlite_path)
+    if args.backend == "neo4j":
+        return KnowledgeBase(args.uri, args.db_user, args.db_password, namespace=args.namespace)
+    return KnowledgeBase(driver=CountingDriver(), create_indexes=False)
+
+
+def kb_counters(kb: Union[KnowledgeBase, SQLiteKnowledgeBase]) -> Tuple[int, int]:
+    """Number of transactions and statements run by `kb` so far, according to its metrics."""
+
+    methods = kb.stats()["methods"].values()
+    return sum(method["calls"] for method in methods), sum(method["statements"] for method in methods)
+
+
+def prepare_knowledge_base(kb: KnowledgeBase, args: argparse.Namespace):
+    """Empty the knowledge base before a benchmark, which deletes everything it wrote once it's done.
+    Exits if the knowledge base holds declarations, unless `--wipe` was given, so that real data isn't deleted by accident."""
+
+    if len(kb.get_all_declarators()) > 0 and not args.wipe:
+        raise SystemExit("(!) The knowledge base isn't empty. Pass --wipe to delete its data and run the benchmark anyway.")
+    kb.delete_all()
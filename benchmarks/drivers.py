@@ -0,0 +1,78 @@
+from typing import Any, Callable
+
+
+class _StubRecord:
+    """Record of a stub result: every field is empty, and existence checks are false."""
+
+    def __getitem__(self, key):
+        return None
+
+    def value(self, key=0, default=None):
+        return False
+
+
+class _StubResult:
+    def __iter__(self):
+        return iter(())
+
+    def single(self):
+        return _StubRecord()
+
+
+class _CountingTransaction:
+    def __init__(self, tx, driver: 'CountingDriver'):
+        self._tx = tx
+        self._driver = driver
+
+    def run(self, query: str, *args, **kwargs):
+        self._driver.statements += 1
+        return self._tx.run(query, *args, **kwargs) if self._tx is not None else _StubResult()
+
+
+class _CountingSession:
+    def __init__(self, session, driver: 'CountingDriver'):
+        self._session = session
+        self._driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self._session is not None:
+            self._session.close()
+
+    def _execute(self, execute: Callable, transaction_function: Callable, *args, **kwargs) -> Any:
+        self._driver.transactions += 1
+        if self._session is None:
+            return transaction_function(_CountingTransaction(None, self._driver), *args, **kwargs)
+        return execute(lambda tx, *args, **kwargs: transaction_function(_CountingTransaction(tx, self._driver), *args, **kwargs), *args, **kwargs)
+
+    def execute_read(self, transaction_function: Callable, *args, **kwargs) -> Any:
+        return self._execute(self._session.execute_read if self._session is not None else None, transaction_function, *args, **kwargs)
+
+    def execute_write(self, transaction_function: Callable, *args, **kwargs) -> Any:
+        return self._execute(self._session.execute_write if self._session is not None else None, transaction_function, *args, **kwargs)
+
+
+class CountingDriver:
+    """Driver wrapper that counts the transactions and Cypher statements issued through it.
+
+    Without a wrapped driver, it acts as an offline stub: statements aren't executed and all results are empty.
+
+    Parameters
+    ----------
+    driver : Driver = None
+        The Neo4j driver to wrap, or `None` to act as a stub
+    """
+
+    def __init__(self, driver=None):
+        self._driver = driver
+        self.transactions = 0
+        self.statements = 0
+
+    def session(self, **kwargs) -> _CountingSession:
+        return _CountingSession(self._driver.session(**kwargs) if self._driver is not None else None, self)
+
+    def close(self):
+        if self._driver is not None:
+            self._driver.close()
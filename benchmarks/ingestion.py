@@ -0,0 +1,118 @@
+import argparse
+import platform
+import random
+import time
+from typing import Iterable, List, Tuple
+
+import spacy
+
+from nlp.main import init
+from nlp.engine import AnswerEngine, STAGES
+from wikipedia_declarator import DECLARATOR, DOG, sentences
+from benchmarks.common import add_backend_arguments, create_knowledge_base, kb_counters, peak_rss_mb, prepare_knowledge_base, write_report
+
+
+_NAMES = ["Diogo", "Lucius", "Martinho", "Dinis", "Joana", "Maria"]
+_TYPES = ["dog", "wolf", "cat", "person", "mammal", "animal", "bird", "fish", "carnivore", "species"]
+_THINGS = ["bananas", "meat", "water", "rice", "beans", "games", "bones", "fish", "milk", "vegetables"]
+_ADJECTIVES = ["big", "small", "domestic", "wild", "green", "old"]
+_VERBS = ["likes", "eats", "drinks", "hates", "wants"]
+
+_TEMPLATES = [
+    lambda r: f"The {r.choice(_TYPES)} is a {r.choice(_TYPES)}",
+    lambda r: f"{r.choice(_NAMES)} is a {r.choice(_TYPES)}",
+    lambda r: f"{r.choice(_NAMES)} {r.choice(_VERBS)} {r.choice(_THINGS)}",
+    lambda r: f"The {r.choice(_TYPES)} {r.choice(_VERBS)} {r.choice(_THINGS)}",
+    lambda r: f"The {r.choice(_ADJECTIVES)} {r.choice(_TYPES)} {r.choice(_VERBS)} {r.choice(_ADJECTIVES)} {r.choice(_THINGS)}",
+    lambda r: f"{r.choice(_NAMES)}'s {r.choice(_TYPES)} {r.choice(_VERBS)} {r.choice(_THINGS)}",
+    lambda r: f"{r.choice(_NAMES)} doesn't like {r.choice(_NAMES)}'s {r.choice(_ADJECTIVES)} {r.choice(_TYPES)}",
+]
+
+
+def synthetic_article(sentences_n: int, seed: int=0) -> List[str]:
+    """Deterministic article of `sentences_n` simple sentences, as lines of a few sentences each."""
+
+    r = random.Random(seed)
+    article = [f"{r.choice(_TEMPLATES)(r)}." for _ in range(sentences_n)]
+    return [" ".join(article[i:i + 5]) for i in range(0, len(article), 5)]
+
+
+def ingest(title: str, lines: Iterable[str], engine: AnswerEngine, kb) -> dict:
+    """Declare an article through the same stages as `wikipedia_declarator.py | python3 -m nlp.main`."""
+
+    timings = dict.fromkeys(("declarator",) + STAGES, 0.0)
+    sentences_n = understood_n = triples_n = kb_calls = 0
+    transactions, statements = kb_counters(kb)
+
+    start = time.perf_counter()
+    declarator_sentences = sentences(lines)
+    while True:
+        declarator_start = time.perf_counter()
+        sentence = next(declarator_sentences, None)
+        timings["declarator"] += time.perf_counter() - declarator_start
+        if sentence is None:
+            break
+
+        answer = engine.tell(DECLARATOR, sentence)
+
+        sentences_n += 1
+        understood_n += answer.understood
+        triples_n += len(answer.triples)
+        kb_calls += answer.kb_calls
+        for stage, elapsed in answer.timings.items():
+            timings[stage] += elapsed
+    duration = time.perf_counter() - start
+    transactions_end, statements_end = kb_counters(kb)
+
+    return {
+        "article": title,
+        "sentences": sentences_n,
+        "understood_sentences": understood_n,
+        "triples": triples_n,
+        "duration_s": duration,
+        "sentences_per_s": sentences_n / duration if duration > 0 else 0.0,
+        "triples_per_s": triples_n / duration if duration > 0 else 0.0,
+        "kb_calls": kb_calls,
+        "kb_transactions": transactions_end - transactions,
+        "kb_statements": statements_end - statements,
+        "confidence_update_s": timings["confidence"],
+        "stages_s": timings,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion throughput of Wikipedia articles into the knowledge base.")
+    add_backend_arguments(parser)
+    parser.add_argument("--synthetic-sentences", type=int, default=2000, help="size of the synthetic article")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    kb = create_knowledge_base(args)
+    try:
+        prepare_knowledge_base(kb, args)
+        engine = AnswerEngine(kb, init())
+        engine.confidence_table.register_declarator(DECLARATOR, static_confidence=1.0)
+
+        articles: List[Tuple[str, Iterable[str]]] = [
+            ("dog", DOG.splitlines()),
+            ("synthetic", synthetic_article(args.synthetic_sentences, args.seed)),
+        ]
+        results = [ingest(title, lines, engine, kb) for title, lines in articles]
+        kb.delete_all()
+    finally:
+        kb.close()
+
+    write_report({
+        "benchmark": "ingestion",
+        "backend": args.backend,
+        "python": platform.python_version(),
+        "spacy": spacy.__version__,
+        "fast_path": engine.fast_path.stats(),
+        "articles": results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
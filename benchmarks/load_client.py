@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+from benchmarks.common import latency_summary, write_report
+
+
+DEFAULT_MESSAGES = [
+    "Diogo is a person",
+    "Diogo likes bananas",
+    "Lucius likes Dinis's green house",
+    "What does Diogo like?",
+    "Does Diogo like bananas?",
+    "What does the dog eat?",
+]
+
+
+async def _client(user: str, messages: List[str], requests: int, host: str, port: int, unix_path: str,
+                  latencies: List[float], errors: List[str]):
+    if unix_path is not None:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    try:
+        for i in range(requests):
+            start = time.perf_counter()
+            writer.write(json.dumps({"user": user, "text": messages[i % len(messages)]}).encode() + b"\n")
+            await writer.drain()
+            line = await reader.readline()
+            if len(line) == 0:
+                errors.append("Connection closed by the server")
+                break
+            reply = json.loads(line)
+            latencies.append(time.perf_counter() - start)
+
+            if "error" in reply:
+                errors.append(reply["error"])
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run(clients: int, requests: int, messages: List[str]=DEFAULT_MESSAGES,
+              host: str="localhost", port: int=8765, unix_path: str=None) -> dict:
+    """Simulate `clients` concurrent users, each sending `requests` messages one after the other.
+    Reports the requests per second and the latency percentiles observed by the clients."""
+
+    latencies = []
+    errors = []
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(f"user{i}", messages, requests, host, port, unix_path, latencies, errors)
+        for i in range(clients)
+    ))
+    duration = time.perf_counter() - start
+
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "duration_s": duration,
+        "requests_per_s": len(latencies) / duration if duration > 0 else 0.0,
+        "latency": latency_summary(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate load on the chatbot server.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None, help="connect to this Unix socket path instead of TCP")
+    parser.add_argument("--clients", type=int, default=16, help="number of concurrent users")
+    parser.add_argument("--requests", type=int, default=50, help="number of messages sent by each user")
+    parser.add_argument("--messages", default=None, help="file with one message per line, sent in a loop")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    messages = DEFAULT_MESSAGES
+    if args.messages is not None:
+        with open(args.messages) as f:
+            messages = [line.strip() for line in f if line.strip()]
+
+    report = asyncio.run(run(args.clients, args.requests, messages, args.host, args.port, args.unix))
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
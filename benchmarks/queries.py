@@ -0,0 +1,165 @@
+import argparse
+import itertools
+import random
+import time
+from typing import Callable, Dict, List, Tuple
+
+from sn.kb import EntityType, KnowledgeBase, RelType, Relation
+from nlp.main import init
+from nlp.engine import AnswerEngine
+from benchmarks.common import add_backend_arguments, create_knowledge_base, latency_summary, prepare_knowledge_base, write_report
+
+
+RELATION = "eat"
+
+
+class Taxonomy:
+    """Synthetic type hierarchy, where every type inherits from its parent and has a few attributes.
+
+    Types are named `Kind<level>x<index>`, the root being `Kind0x0`, and attributes are named `food<index>`.
+    Declarations (both inheritance and attributes) are evenly distributed among `user<index>` declarators.
+
+    Parameters
+    ----------
+    depth : int
+        Number of inheritance levels below the root
+    branching : int
+        Number of children of each non-leaf type
+    attributes : int
+        Number of attributes of each type
+    declarators : int
+        Number of declarators
+    seed : int = 0
+        Seed of the attributes' targets and polarities
+    """
+
+    def __init__(self, depth: int, branching: int, attributes: int, declarators: int, seed: int=0):
+        self.depth = depth
+        self.branching = branching
+        self.attributes = attributes
+        self.declarators = declarators
+
+        r = random.Random(seed)
+        declarator = itertools.cycle([f"user{i}" for i in range(declarators)])
+
+        self.levels: List[List[str]] = [["Kind0x0"]]
+        self.declarations: Dict[str, List[Relation]] = {}
+
+        def declare(relation: Relation):
+            self.declarations.setdefault(next(declarator), []).append(relation)
+
+        for level in range(1, depth + 1):
+            self.levels.append([])
+            for parent in self.levels[level - 1]:
+                for _ in range(branching):
+                    child = f"Kind{level}x{len(self.levels[level])}"
+                    self.levels[level].append(child)
+                    declare(Relation(child, EntityType.TYPE, parent, EntityType.TYPE, "is", RelType.INHERITS))
+
+        foods = max(1, attributes * 4)
+        for kind in itertools.chain.from_iterable(self.levels):
+            for _ in range(attributes):
+                declare(Relation(kind, EntityType.TYPE, f"food{r.randrange(foods)}", EntityType.TYPE, RELATION, RelType.OTHER,
+                                 not_=r.random() < 0.2))
+
+    @property
+    def root(self) -> str:
+        return self.levels[0][0]
+
+    @property
+    def leaves(self) -> List[str]:
+        return self.levels[-1]
+
+    def load(self, kb: KnowledgeBase) -> int:
+        """Write the taxonomy into `kb`, returning the number of declarations."""
+
+        return sum(kb.add_knowledge_batch(declarator, relations) for declarator, relations in self.declarations.items())
+
+
+def measure(function: Callable, arguments: List[Tuple]) -> Dict[str, float]:
+    latencies = []
+    for args in arguments:
+        start = time.perf_counter()
+        function(*args)
+        latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies)
+
+
+def run(kb: KnowledgeBase, engine: AnswerEngine, taxonomy: Taxonomy, samples: int, seed: int=0) -> dict:
+    r = random.Random(seed)
+
+    kb.delete_all()
+    start = time.perf_counter()
+    declarations = taxonomy.load(kb)
+    load_duration = time.perf_counter() - start
+
+    for declarator in taxonomy.declarations:
+        engine.confidence_table.register_declarator(declarator)
+    engine.confidence_table.update_confidences()
+
+    leaves = [r.choice(taxonomy.leaves) for _ in range(samples)]
+    foods = [f"food{r.randrange(max(1, taxonomy.attributes * 4))}" for _ in range(samples)]
+    # Ancestors at every level, so that descendant queries cover subtrees of every size
+    ancestors = [r.choice(taxonomy.levels[r.randrange(len(taxonomy.levels))]) for _ in range(samples)]
+
+    return {
+        "depth": taxonomy.depth,
+        "branching": taxonomy.branching,
+        "attributes": taxonomy.attributes,
+        "declarators": taxonomy.declarators,
+        "types": sum(len(level) for level in taxonomy.levels),
+        "declarations": declarations,
+        "load_s": load_duration,
+        "latency": {
+            "query_inheritance_relation": measure(kb.query_inheritance_relation,
+                [(leaf, RELATION) for leaf in leaves]),
+            "query_inheritance_relation_page": measure(kb.query_inheritance_relation_page,
+                [(leaf, RELATION) for leaf in leaves]),
+            "assert_relation_inheritance": measure(kb.assert_relation_inheritance,
+                [(Relation(leaf, None, food, None, RELATION, None),) for leaf, food in zip(leaves, foods)]),
+            "query_descendants_relation": measure(kb.query_descendants_relation,
+                [(ancestor, RELATION, RelType.OTHER) for ancestor in ancestors]),
+            "open_question": measure(engine.ask,
+                [("benchmark", f"What does {leaf} {RELATION}?") for leaf in leaves]),
+            "boolean_question": measure(engine.ask,
+                [("benchmark", f"Does {leaf} {RELATION} {food}?") for leaf, food in zip(leaves, foods)]),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark query latency over synthetic taxonomies of several sizes.")
+    # The stub driver returns no rows, so it would only measure the Python overhead of each query
+    add_backend_arguments(parser, default="neo4j")
+    parser.add_argument("--depths", type=int, nargs="+", default=[2, 4, 6])
+    parser.add_argument("--branching", type=int, nargs="+", default=[2, 3])
+    parser.add_argument("--attributes", type=int, nargs="+", default=[2])
+    parser.add_argument("--declarators", type=int, nargs="+", default=[3])
+    parser.add_argument("--samples", type=int, default=200, help="queries measured per method and taxonomy")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    kb = create_knowledge_base(args)
+    try:
+        prepare_knowledge_base(kb, args)
+        engine = AnswerEngine(kb, init())
+        results = []
+        for depth, branching, attributes, declarators in itertools.product(args.depths, args.branching, args.attributes, args.declarators):
+            taxonomy = Taxonomy(depth, branching, attributes, declarators, args.seed)
+            results.append(run(kb, engine, taxonomy, args.samples, args.seed))
+        kb.delete_all()
+    finally:
+        kb.close()
+
+    write_report({
+        "benchmark": "queries",
+        "backend": args.backend,
+        # Without a database, traversals return nothing and latencies only cover the Python overhead
+        "query_latency": args.backend != "stub",
+        "taxonomies": results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,478 @@
+import multiprocessing
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Union
+
+import spacy
+from spacy.tokens import Doc, Span
+
+from sn.kb import KnowledgeBase, Relation
+from sn.confidence import ConfidenceTable
+from sn.declaration_sets import DeclarationSets
+from nlp.main import OPEN_ANSWERS, extract_knowledge, init, init_confidence_table, query_knowledge, store_knowledge
+from nlp.fast_path import FastPathParser
+from nlp.responses import bool_response, complex_response, new_knowledge_response
+from sn.tracing import tracer
+
+
+STAGES = ("parse", "extract", "kb", "confidence", "response")
+
+NOT_UNDERSTOOD_RESPONSE = "Sorry, I didn't understand that. Maybe try rephrasing your sentence?"
+
+# "does" at the start of a sentence
+_DOES = re.compile(r"(^|[.!?]\s+)d(?=oes)", re.IGNORECASE)
+
+
+# Parser of a parsing process (see `AnswerEngine`)
+_process_parser: FastPathParser = None
+
+
+def _init_parse_process(config, data: bytes):
+    global _process_parser
+    _process_parser = FastPathParser(spacy.util.load_model_from_config(config).from_bytes(data))
+
+
+def _parse_in_process(text: str) -> bytes:
+    return _process_parser.parse(text).to_bytes()
+
+
+def _is_question(sentence: str) -> bool:
+    word = sentence.split(" ")[0]
+    return word.lower() in ["what", "where", "who"] or sentence[-1:] == "?"
+
+
+@dataclass
+class Answer:
+    """Result of handling a message.
+
+    Parameters
+    ----------
+    response : str
+        The chatbot's response
+    understood : bool
+        Whether the message could be parsed
+    question : bool
+        Whether the message was a question or a statement
+    triples : list
+        The triples extracted from a statement, or the relations whose confidence was considered to answer a question
+    query : tuple | None
+        The query extracted from a question, as returned by `query_knowledge`
+    confidence : float | None
+        The confidence of the answer to a question, or `None` if there is no information about it
+    after : int | None
+        For open questions with more answers than the ones given, the continuation to pass to `AnswerEngine.more`
+    timings : Dict[str, float]
+        Time spent in each stage, in seconds. Stages don't include the time spent in the knowledge base (`"kb"`)
+    kb_calls : int
+        Number of knowledge base round trips
+    sentences : list
+        The answers to each sentence, if the message has several. The message's answer holds the timings and knowledge base round trips of all of them
+    """
+
+    response:   str
+    understood: bool
+    question:   bool
+    triples:    list                    = field(default_factory=list)
+    query:      Union[tuple, None]      = None
+    confidence: Union[float, None]      = None
+    after:      Union[int, None]        = None
+    timings:    Dict[str, float]        = field(default_factory=lambda: dict.fromkeys(STAGES, 0.0))
+    kb_calls:   int                     = 0
+    sentences:  List['Answer']          = field(default_factory=list)
+
+
+class _StageTimer:
+    """Accumulates the time spent on each stage of a call, as well as on the knowledge base."""
+
+    def __init__(self, answer: Answer):
+        self._answer = answer
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        kb_start = self._answer.timings["kb"]
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._answer.timings[name] += elapsed - (self._answer.timings["kb"] - kb_start)
+
+    def record_kb(self, elapsed: float):
+        self._answer.timings["kb"] += elapsed
+        self._answer.kb_calls += 1
+
+
+_current_timer: ContextVar[Union[_StageTimer, None]] = ContextVar("_current_timer", default=None)
+
+
+@contextmanager
+def _timed(answer: Answer):
+    """Record the time spent on each stage and on the knowledge base, within the block, in `answer`."""
+
+    timer = _StageTimer(answer)
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+class _TimedKnowledgeBase:
+    """Proxy of a knowledge base that records the duration of each method call in the current call's timer."""
+
+    def __init__(self, knowledge_base: KnowledgeBase):
+        self._kb = knowledge_base
+
+    def __getattr__(self, name):
+        attribute = getattr(self._kb, name)
+        if not callable(attribute):
+            return attribute
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                timer = _current_timer.get()
+                if timer is not None:
+                    timer.record_kb(time.perf_counter() - start)
+        return timed
+
+
+class AnswerEngine:
+    """Question answering and knowledge declaration, independent of the chatbot's front end.
+
+    Every call returns an `Answer` with the time spent in each stage, in order to find where latency goes.
+    The engine can be shared between threads.
+
+    Parameters
+    ----------
+    knowledge_base : KnowledgeBase
+        The knowledge base to query and declare knowledge to
+    nlp : spacy.Language = None
+        The spaCy pipeline. If `None`, it's loaded with `init`
+    confidence_table : ConfidenceTable = None
+        The confidence table of the declarators. If `None`, a confidence table with the default parameters
+        is created, whose knowledge base calls are also timed
+    max_user_declarations : int = 100000
+        Users' declarations are held in memory (see `sn.declaration_sets`), to tell whether they're asking about
+        something they declared without querying the knowledge base, unless they made more declarations than this
+    defer_confidence_updates : bool = False
+        Whether the confidences are updated by a background thread after declarations, instead of before replying to them.
+        Declarations are then acknowledged without waiting for the update, which reads every declaration, and so waits
+        for the writes of a write-behind knowledge base (see `sn.write_behind`). The engine must then be closed
+    parse_processes : int = 0
+        The number of processes messages are parsed in, each with a copy of the pipeline. Parsing holds the GIL, so
+        threads sharing the engine parse one message at a time otherwise. The dependency parser, which only the slow path
+        runs, still runs in the calling thread. If positive, the engine must be closed
+    """
+
+    def __init__(self, knowledge_base: KnowledgeBase, nlp: spacy.Language=None, confidence_table: ConfidenceTable=None,
+                 max_user_declarations: int=100000, defer_confidence_updates: bool=False, parse_processes: int=0):
+        nlp = nlp if nlp is not None else init()
+        self._kb = _TimedKnowledgeBase(knowledge_base)
+        self._vocab = nlp.vocab
+        self._fast_path = FastPathParser(nlp)
+        self._confidence_table = confidence_table if confidence_table is not None else init_confidence_table(self._kb)
+        self._user_declarations = DeclarationSets(self._kb, max_declarations=max_user_declarations)
+        self._kb.add_listener(self._user_declarations.apply)
+
+        # Set by declarations, and cleared by the background thread before each update, so that updates are coalesced
+        self._confidences_stale = threading.Event()
+        self._closed = False
+        self._confidence_updater = None
+        if defer_confidence_updates:
+            self._confidence_updater = threading.Thread(target=self._run_confidence_updates, name="sn-confidences", daemon=True)
+            self._confidence_updater.start()
+
+        self._parse_pool = None
+        if parse_processes > 0:
+            # Spawned rather than forked, since the engine's process runs other threads
+            self._parse_pool = ProcessPoolExecutor(parse_processes, mp_context=multiprocessing.get_context("spawn"),
+                                                   initializer=_init_parse_process, initargs=(nlp.config, nlp.to_bytes()))
+
+    def close(self):
+        """Stop updating the confidences in the background, if deferred, and the parsing processes."""
+
+        self._closed = True
+        self._confidences_stale.set()
+        if self._confidence_updater is not None:
+            self._confidence_updater.join()
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=True)
+
+    @property
+    def fast_path(self) -> FastPathParser:
+        return self._fast_path
+
+    @property
+    def confidence_table(self) -> ConfidenceTable:
+        return self._confidence_table
+
+    @tracer.traced()
+    def handle(self, user: str, text: str) -> Answer:
+        """Handle a message from `user`, made of statements and questions.
+
+        The message is parsed once, and each of its sentences is handled as either a statement or a question.
+        The triples of consecutive statements are declared in a single batch, before answering the following question.
+        If the message has several sentences, the answer joins the responses to each one, which are kept in `sentences`.
+        """
+
+        # don't ask why
+        text = _DOES.sub(lambda match: match.group(1) + "D", text)
+
+        answer = Answer(response=NOT_UNDERSTOOD_RESPONSE, understood=False, question=False)
+        sentences = []
+        with _timed(answer) as timer:
+            with timer.stage("parse"):
+                doc = self._parse(text)
+
+            statements = []
+            for sentence in doc.sents:
+                sentence_answer = Answer(response=NOT_UNDERSTOOD_RESPONSE, understood=False, question=_is_question(sentence.text))
+                sentences.append(sentence_answer)
+
+                if sentence_answer.question:
+                    self._declare(user, statements, timer)
+                    statements = []
+                    self._ask(user, sentence, sentence_answer, timer)
+                elif self._extract(sentence, sentence_answer, timer):
+                    statements.append(sentence_answer)
+            self._declare(user, statements, timer)
+
+        if len(sentences) == 1:
+            sentences[0].timings, sentences[0].kb_calls = answer.timings, answer.kb_calls
+            return sentences[0]
+
+        answer.sentences = sentences
+        answer.understood = any(sentence.understood for sentence in sentences)
+        answer.question = any(sentence.question for sentence in sentences)
+        answer.triples = [triple for sentence in sentences for triple in sentence.triples]
+        if len(sentences) > 0:
+            answer.response = " ".join(sentence.response for sentence in sentences)
+        return answer
+
+    @tracer.traced()
+    def ask(self, user: str, text: str) -> Answer:
+        """Answer a question from `user`."""
+
+        answer = Answer(response=NOT_UNDERSTOOD_RESPONSE, understood=False, question=True)
+        with _timed(answer) as timer:
+            with timer.stage("parse"):
+                doc = self._parse(text)
+            self._ask(user, doc[:], answer, timer)
+        return answer
+
+    @tracer.traced()
+    def tell(self, user: str, text: str) -> Answer:
+        """Declare the knowledge stated by `user`."""
+
+        answer = Answer(response=NOT_UNDERSTOOD_RESPONSE, understood=False, question=False)
+        with _timed(answer) as timer:
+            with timer.stage("parse"):
+                doc = self._parse(text)
+            if self._extract(doc[:], answer, timer):
+                self._declare(user, [answer], timer)
+        return answer
+
+    @tracer.traced()
+    def more(self, user: str, previous: Answer) -> Answer:
+        """Give the next answers to the open question answered by `previous`, whose `after` mustn't be `None`."""
+
+        if previous.after is None:
+            raise ValueError("The answer has no more answers to give.")
+
+        answer = Answer(response=NOT_UNDERSTOOD_RESPONSE, understood=True, question=True)
+        with _timed(answer) as timer:
+            entity1, rel, _, ent, _ = previous.query
+            with timer.stage("extract"):
+                query, after = self._kb.query_inheritance_relation_page(ent, str(rel), after=previous.after, limit=OPEN_ANSWERS)
+            answer.query = (entity1, rel, query, ent, after)
+
+            with timer.stage("confidence"):
+                answer.confidence, answer.triples = self._open_confidence(user, answer.query)
+                answer.after = after
+
+            with timer.stage("response"):
+                answer.response = complex_response(answer.query, answer.confidence)
+        return answer
+
+    def _parse(self, text: str) -> Doc:
+        """Parse `text` with `FastPathParser.parse`, in a parsing process if there are any."""
+
+        if self._parse_pool is None:
+            return self._fast_path.parse(text)
+        return Doc(self._vocab).from_bytes(self._parse_pool.submit(_parse_in_process, text).result())
+
+    def _ask(self, user: str, sentence: Span, answer: Answer, timer: _StageTimer):
+        """Answer a question, unless it can't be parsed."""
+
+        try:
+            with timer.stage("extract"):
+                content = self._fast_path.query_knowledge(user, sentence, self._kb)
+
+            if content is None:
+                with timer.stage("parse"):
+                    self._fast_path.complete(sentence.doc)
+                with timer.stage("extract"):
+                    content = query_knowledge(user, sentence, self._kb)
+        except Exception:
+            return
+
+        answer.understood = True
+        answer.query, bool_query = content
+
+        with timer.stage("confidence"):
+            if bool_query:
+                answer.confidence, answer.triples = self._bool_confidence(user, answer.query)
+            else:
+                answer.confidence, answer.triples = self._open_confidence(user, answer.query)
+                answer.after = answer.query[4]
+
+        with timer.stage("response"):
+            if bool_query:
+                answer.response = bool_response(answer.confidence)
+            else:
+                answer.response = complex_response(answer.query, answer.confidence)
+
+    def _extract(self, sentence: Span, answer: Answer, timer: _StageTimer) -> bool:
+        """Obtain the triples of a statement, returning whether it could be parsed."""
+
+        try:
+            with timer.stage("extract"):
+                knowledge = self._fast_path.extract_knowledge(sentence)
+
+            if knowledge is None:
+                with timer.stage("parse"):
+                    self._fast_path.complete(sentence.doc)
+                with timer.stage("extract"):
+                    knowledge = extract_knowledge(sentence)
+        except Exception:
+            return False
+
+        answer.triples = knowledge
+        return True
+
+    def _declare(self, user: str, statements: List[Answer], timer: _StageTimer):
+        """Declare the triples of statements in a single batch."""
+
+        if len(statements) == 0:
+            return
+
+        try:
+            with timer.stage("extract"):
+                relations = store_knowledge(user, [triple for statement in statements for triple in statement.triples], self._kb)
+                # Already recorded if the knowledge base notified the write, but not if it's written behind
+                self._user_declarations.add(user, relations)
+
+            with timer.stage("confidence"):
+                self._confidence_table.register_declarator(user)
+                if self._confidence_updater is not None:
+                    self._confidences_stale.set()
+                else:
+                    self._confidence_table.update_confidences()
+        except Exception:
+            return
+
+        with timer.stage("response"):
+            for statement in statements:
+                statement.understood = True
+                statement.response = new_knowledge_response()
+
+    def _run_confidence_updates(self):
+        while True:
+            self._confidences_stale.wait()
+            if self._closed:
+                return
+            self._confidences_stale.clear()
+            try:
+                self._confidence_table.update_confidences()
+            except Exception:
+                # E.g. the database is unavailable: try again later
+                time.sleep(1)
+                self._confidences_stale.set()
+
+    def _bool_confidence(self, user: str, content: tuple):
+        """Confidence of a boolean question, and the relations it's based upon."""
+
+        confidence = 0
+        confidence_n = 0
+        relations = []
+        entity1, rel, entity2, negated, query = content
+
+        # We can perform these boolean queries in two ways:
+        # - Unknown -> then it's False: if no declarations are present, then include inverse relations
+        # - Unknown -> conclude nothing: if no declarations are present, then don't bother with inverse relations
+        # For instance, if we say "person doesn't like beans" and ask "does person like beans?" we will get "No" and "Don't know" respectively.
+        # The code below, which includes the results from the inverse query, implements the first case.
+        inverse_query = self._kb.assert_relation_inheritance(Relation(
+            ent1=str(entity1),
+            ent1_type=None,
+            ent2=str(entity2),
+            ent2_type=None,
+            name=str(rel),
+            type_=None,
+            not_=not negated
+        ))
+
+        for (entity1_parent, length) in (query | inverse_query):
+            relation = Relation(
+                ent1=str(entity1_parent),
+                ent1_type=None,
+                ent2=str(entity2),
+                ent2_type=None,
+                name=str(rel),
+                type_=None,
+                not_=negated
+            )
+            relations.append(relation)
+
+            # We completely trust the user if they are asking about something that they declared
+            if self._user_declarations.declared(user, relation):
+                # If it was a local assertion, then we have complete confidence
+                if length == 0:
+                    confidence = 1.0
+                    confidence_n = 1
+                    break
+                else:
+                    confidence += 1.0
+            else:
+                confidence += self._confidence_table.get_relation_confidence(relation)
+            confidence_n += 1
+
+        return (confidence / confidence_n if confidence_n > 0 else None), relations
+
+    def _open_confidence(self, user: str, content: tuple):
+        """Confidence of an open question, and the relations it's based upon."""
+
+        confidence = 0
+        confidence_n = 0
+        relations = []
+        rel = content[1]
+
+        for entity1, (entity2s, length) in content[2].items():
+            for entity2, positive in entity2s:
+                relation = Relation(
+                        ent1=entity1,
+                        ent1_type=None,
+                        ent2=entity2,
+                        ent2_type=None,
+                        name=rel,
+                        type_=None,
+                        not_=not positive
+                    )
+                relations.append(relation)
+
+                # We completely trust the user if they are asking about something that they declared
+                if self._user_declarations.declared(user, relation):
+                    confidence += 1.0
+                else:
+                    confidence += self._confidence_table.get_relation_confidence(relation)
+                confidence_n += 1
+
+        return (confidence / confidence_n if confidence_n > 0 else None), relations
@@ -0,0 +1,180 @@
+import threading
+
+import spacy
+from spacy.matcher import Matcher
+from spacy.pipeline import Sentencizer
+from spacy.tokens import Doc, Span
+from typing import List, Tuple, Union
+
+from sn.kb import KnowledgeBase
+from nlp.objects import Entity, Triples
+from nlp.normalisation import singularize
+from nlp.main import OPEN_ANSWERS, query_boolean, store_knowledge
+from sn.tracing import tracer
+
+
+# Pipeline components that the fast path doesn't run. They are only run if the sentence falls back to the slow path.
+SKIPPED_PIPES = ("parser", "ner")
+
+_DET = {"POS": "DET", "OP": "?"}
+_NOUN = {"POS": {"IN": ["NOUN", "PROPN"]}}
+_VERB = {"POS": "VERB"}
+
+STATEMENT_TEMPLATES = {
+    # e.g.: "Diogo is a person", "Beans are great"
+    "IS_A": [_DET, _NOUN, {"LEMMA": "be"}, _DET, {"POS": {"IN": ["NOUN", "PROPN", "ADJ"]}}, {"ORTH": ".", "OP": "?"}],
+    # e.g.: "Diogo likes bananas"
+    "VERB_OBJECT": [_DET, _NOUN, _VERB, _DET, _NOUN, {"ORTH": ".", "OP": "?"}],
+}
+
+QUESTION_TEMPLATES = {
+    # e.g.: "Does Diogo eat rice?"
+    "DOES_X_VERB_Y": [{"LOWER": "does"}, _DET, _NOUN, _VERB, _DET, _NOUN, {"ORTH": "?"}],
+    # e.g.: "What does Diogo eat?"
+    "WHAT_DOES_X_VERB": [{"LOWER": "what"}, {"LOWER": "does"}, _DET, _NOUN, _VERB, {"ORTH": "?"}],
+}
+
+
+class FastPathParser:
+    """Recogniser of the most common sentence templates, which only requires the tagger and lemmatizer.
+
+    Sentences that fit one of the templates are converted to triples (statements) or queries (questions)
+    without running the dependency parser, producing the same output as `add_knowledge` and `query_knowledge`.
+    Otherwise, the remaining pipeline components can be run on the same document with `complete`, so that
+    the slow path doesn't have to tag the sentence again.
+
+    Documents are split into sentences by punctuation when parsed, so that a message with several sentences is parsed
+    once and each of its sentences (`doc.sents`) is handled on its own. The dependency parser keeps these boundaries.
+
+    Parameters
+    ----------
+    nlp : spacy.Language
+        The full spaCy pipeline, as returned by `init`
+    """
+
+    def __init__(self, nlp: spacy.Language):
+        self._nlp = nlp
+        self._fast_pipes = [(name, pipe) for name, pipe in nlp.pipeline if name not in SKIPPED_PIPES]
+        self._slow_pipes = [(name, pipe) for name, pipe in nlp.pipeline if name in SKIPPED_PIPES]
+        self._sentencizer = Sentencizer()
+
+        self._statement_matcher = Matcher(nlp.vocab)
+        for name, pattern in STATEMENT_TEMPLATES.items():
+            self._statement_matcher.add(name, [pattern])
+
+        self._question_matcher = Matcher(nlp.vocab)
+        for name, pattern in QUESTION_TEMPLATES.items():
+            self._question_matcher.add(name, [pattern])
+
+        # The parser may be shared by several worker threads
+        self._hits_lock = threading.Lock()
+        self.fast_path_hits = 0
+        self.slow_path_hits = 0
+
+    @tracer.traced()
+    def parse(self, text: str) -> Doc:
+        """Tokenize, tag and split `text` into sentences, without running the dependency parser."""
+
+        doc = self._nlp.make_doc(text)
+        for _, pipe in self._fast_pipes:
+            doc = pipe(doc)
+        return self._sentencizer(doc)
+
+    @tracer.traced()
+    def complete(self, doc: Doc) -> Doc:
+        """Run the pipeline components skipped by `parse`, so that `doc` can be handled by the slow path.
+        Documents are changed in place, so their sentences can be handled by the slow path as well. Completed documents are left as they are."""
+
+        if doc.has_annotation("DEP"):
+            return doc
+        for _, pipe in self._slow_pipes:
+            doc = pipe(doc)
+        return doc
+
+    @tracer.traced()
+    def add_knowledge(self, user: str, doc: Union[Doc, Span], kb: KnowledgeBase) -> Union[List[Triples], None]:
+        """Fast path of `nlp.main.add_knowledge`. Returns `None` if `doc` doesn't fit any statement template."""
+
+        knowledge = self.extract_knowledge(doc)
+        if knowledge is None:
+            return None
+
+        store_knowledge(user, knowledge, kb)
+
+        return knowledge
+
+    @tracer.traced()
+    def extract_knowledge(self, doc: Union[Doc, Span]) -> Union[List[Triples], None]:
+        """Fast path of `nlp.main.extract_knowledge`. Returns `None` if `doc` doesn't fit any statement template."""
+
+        template = self._match(self._statement_matcher, doc)
+        if template is None:
+            return None
+
+        subject, verb, obj = self._roles(doc, template)
+
+        return [Triples(Entity(subject), Entity(obj), verb.lemma_)]
+
+    @tracer.traced()
+    def query_knowledge(self, user: str, doc: Union[Doc, Span], kb: KnowledgeBase) -> Union[Tuple[tuple, bool], None]:
+        """Fast path of `nlp.main.query_knowledge`. Returns `None` if `doc` doesn't fit any question template."""
+
+        template = self._match(self._question_matcher, doc)
+        if template is None:
+            return None
+
+        subject, verb, obj = self._roles(doc, template)
+        rel = verb.lemma_
+
+        ent1 = singularize(subject.text, subject)
+        if subject.pos_ == "PROPN" and ent1.lower() == subject.text.lower():
+            ent1 = ent1.capitalize()
+
+        if obj is None:
+            query, after = kb.query_inheritance_relation_page(ent1, str(rel), limit=OPEN_ANSWERS)
+            return (subject, rel, query, ent1, after), False
+
+        ent2 = singularize(obj.text, obj)
+        if subject.pos_ == "PROPN" and ent2.lower() == subject.text.lower():
+            ent2 = ent2.capitalize()
+
+        query = query_boolean(ent1, rel, ent2, kb, False)
+        return (ent1, rel, ent2, False, query), True
+
+    def stats(self) -> dict:
+        """Number of sentences handled by the fast and slow paths."""
+
+        with self._hits_lock:
+            fast_path_hits, slow_path_hits = self.fast_path_hits, self.slow_path_hits
+
+        total = fast_path_hits + slow_path_hits
+        return {
+            "fast_path_hits": fast_path_hits,
+            "slow_path_hits": slow_path_hits,
+            "fast_path_rate": (fast_path_hits / total) if total > 0 else 0.0,
+        }
+
+    def _match(self, matcher: Matcher, doc: Union[Doc, Span]) -> Union[str, None]:
+        """Obtain the template that covers the whole document or sentence, if any, and count the hit."""
+
+        for match_id, start, end in matcher(doc):
+            if start == 0 and end == len(doc):
+                with self._hits_lock:
+                    self.fast_path_hits += 1
+                return self._nlp.vocab.strings[match_id]
+
+        with self._hits_lock:
+            self.slow_path_hits += 1
+        return None
+
+    @staticmethod
+    def _roles(doc: Union[Doc, Span], template: str):
+        """Obtain the subject, verb and object tokens of a document that fits `template`.
+        The object is `None` for templates without one."""
+
+        words = [token for token in doc if not token.is_punct]
+        subject_i = next(i for i, token in enumerate(words) if token.pos_ in ("NOUN", "PROPN"))
+        subject = words[subject_i]
+        verb = words[subject_i + 1]
+        obj = words[-1] if template != "WHAT_DOES_X_VERB" else None
+        return subject, verb, obj
@@ -1,6 +1,6 @@
 import spacy
+from collections import deque
 from spacy import displacy
-from textblob import Word
 from typing import Dict, List
 
 
@@ -12,10 +12,15 @@ from typing import Dict, List
 # Como corre
 from sn.kb import EntityType, KnowledgeBase, RelType, Relation
 from sn.confidence import ConfidenceTable
-from copy import copy
 from nlp.objects import Entity, Triples
+from nlp.normalisation import singularize
+from sn.tracing import tracer
 from nlp.responses import *
 
+# Number of answers given to open questions, the rest being available through the continuation returned with them
+OPEN_ANSWERS = 10
+
+@tracer.traced()
 def init() -> spacy.Language:
     nlp = spacy.load("en_core_web_sm")
     #lemmatizer = nlp.get_pipe("lemmatizer")
@@ -37,15 +42,25 @@ def build_entity(token) -> str:
     return output
 
 
-def main():
-    user = input("Please insert your username: ")
-    kb = KnowledgeBase("bolt://localhost:7687", "neo4j", "Sussy_baka123321")
-    # kb.delete_all()
+def init_confidence_table(kb: KnowledgeBase) -> ConfidenceTable:
     confidence_table = ConfidenceTable(kb, saf_weight=0.5, nsaf_weight=0.5, base_confidence=0.8)
     confidence_table.register_declarator('Wikipedia', static_confidence=1.0)
     for declarator in kb.get_all_declarators():
         confidence_table.register_declarator(declarator)
-    nlp = init()
+    kb.add_listener(confidence_table.on_change)
+    return confidence_table
+
+
+def main():
+    # Imported here, since the answer engine builds upon this module
+    from nlp.engine import AnswerEngine
+
+    user = input("Please insert your username: ")
+    # Connection settings are read from the NEO4J_* environment variables
+    kb = KnowledgeBase()
+    kb.warm_up()
+    # kb.delete_all()
+    engine = AnswerEngine(kb, init())
     print("(!) Hello, how can I help you? (q! - quit)")
     while True:
         text = input("# ")
@@ -55,122 +70,16 @@ def main():
         if len(text.strip()) == 0:
             continue
 
-        # don't ask why
-        if text.lower().startswith("does"):
-            text = text[0].upper() + text[1:]
-
-        # Do stuff with text
-        doc = nlp(text)
+        print(engine.handle(user, text).response)
 
-        # --------- DEBUG: SHOW TREE ---------
-        # displacy.serve(doc, auto_select_port=True, style="dep")
-
-        # Check if phrase is a question or not
-        
-        # If is a question
-        
-        word = text.split(" ")[0]
 
-        respond_to_query = True
-        bool_query = False
-        
-        try:
-            #print(f"{word.lower() = }")
-            if word.lower() in ["what", "where", "who"] or text[-1].lower() in ["?"]:
-                content, bool_query = query_knowledge(user, doc, kb)
-                #print(content)
-            else:
-                respond_to_query = False
-                knowledge = add_knowledge(user, doc, kb)
-                #print(knowledge)
-                confidence_table.register_declarator(user)
-                confidence_table.update_confidences()
-        except Exception as e:
-            #print(e)
-            print("Sorry, I didn't understand that. Maybe try rephrasing your sentence?")
-        else:
-            # Output text based on stuff that was done
-            if respond_to_query:
-                if bool_query:
-                    confidence = 0
-                    confidence_n = 0
-                    entity1, rel, entity2, negated, query = content
-                    
-                    # We can perform these boolean queries in two ways:
-                    # - Unknown -> then it's False: if no declarations are present, then include inverse relations
-                    # - Unknown -> conclude nothing: if no declarations are present, then don't bother with inverse relations
-                    # For instance, if we say "person doesn't like beans" and ask "does person like beans?" we will get "No" and "Don't know" respectively.
-                    # The code below, which includes the results from the inverse query, implements the first case.
-                    inverse_query = kb.assert_relation_inheritance(Relation(
-                        ent1=str(entity1),
-                        ent1_type=None,
-                        ent2=str(entity2),
-                        ent2_type=None,
-                        name=str(rel),
-                        type_=None,
-                        not_=not negated
-                    ))
-
-                    for (entity1_parent, length) in (query | inverse_query):
-                        relation = Relation(
-                            ent1=str(entity1_parent),
-                            ent1_type=None,
-                            ent2=str(entity2),
-                            ent2_type=None,
-                            name=str(rel),
-                            type_=None,
-                            not_=negated
-                        )
-                    
-                        # We completely trust the user if they are asking about something that they declared
-                        if kb.assert_relation(relation, declarator=user):
-                            # If it was a local assertion, then we have complete confidence
-                            if length == 0:
-                                confidence = 1.0
-                                confidence_n = 1
-                                break
-                            else:
-                                confidence += 1.0
-                        else:
-                            confidence += confidence_table.get_relation_confidence(relation)
-                        confidence_n += 1
-
-                    response = bool_response(confidence / confidence_n if confidence_n > 0 else None)
-
-                else:
-                    confidence = 0
-                    confidence_n = 0
-                    rel = content[1]
-                    for entity1, (entity2s, length) in content[2].items():
-                        for entity2, positive in entity2s:
-                            relation = Relation(
-                                    ent1=entity1,
-                                    ent1_type=None,
-                                    ent2=entity2,
-                                    ent2_type=None,
-                                    name=rel,
-                                    type_=None,
-                                    not_=not positive
-                                )
-                            
-                            # We completely trust the user if they are asking about something that they declared
-                            if kb.assert_relation(relation, declarator=user):
-                                confidence += 1.0
-                            else:
-                                confidence += confidence_table.get_relation_confidence(relation)
-                            confidence_n += 1
-
-                    response = complex_response(content, confidence / confidence_n if confidence_n > 0 else None)
-            else:
-                response = new_knowledge_response()
-            print(response)
-        
 # What Diogo like?
 # What does Diogo like?
 # What Diogo's dog eat?
 
 # What does <entity> <rel>?
 # Does <entity1> <rel> <entity2>? Example: does Joana eat bananas?
+@tracer.traced()
 def query_knowledge(user:str, doc, kb: KnowledgeBase):
     bool_query = False
     
@@ -238,10 +147,10 @@ def query_knowledge(user:str, doc, kb: KnowledgeBase):
 
         #print(f"Question dupla: {ent}, {rel}")
         
-        query = kb.query_inheritance_relation(ent, str(rel))
+        query, after = kb.query_inheritance_relation_page(ent, str(rel), limit=OPEN_ANSWERS)
         #print(query)
         
-        return (entity1, rel, query, ent), bool_query
+        return (entity1, rel, query, ent, after), bool_query
     else:
         ent1 = extract_entity(Entity(entity1), nsubject, [])
         ent2 = extract_entity(Entity(entity2[0]), entity2[0], [])
@@ -265,7 +174,19 @@ def query_boolean(ent1, rel, ent2, kb:KnowledgeBase, not_:bool=False):
     #print(f"{relation=}")
     return kb.assert_relation_inheritance(relation)
 
+@tracer.traced()
 def add_knowledge(user:str, doc, kb: KnowledgeBase):
+    knowledge = extract_knowledge(doc)
+
+    store_knowledge(user, knowledge, kb)
+
+    return knowledge
+
+
+@tracer.traced()
+def extract_knowledge(doc) -> List[Triples]:
+    """Obtain the triples stated by a sentence, which is either a parsed document or one of its sentences (`doc.sents`)."""
+
     # print("TEST")
     ###### RULES OF (not) WACKY STUFF ######
 
@@ -319,63 +240,69 @@ def add_knowledge(user:str, doc, kb: KnowledgeBase):
     extract_entity(entity2, nobj, knowledge)
     # print('Negated?', 'Yes' if relation_negated else 'No')
 
-    base_triplet = Triples(entity1, entity2, relation)
-    base_triplet.not_ = relation_negated
-    knowledge.append(base_triplet)
+    knowledge.append(Triples(entity1, entity2, relation, relation_negated))
 
-    
+    return knowledge
+
+
+@tracer.traced()
+def store_knowledge(user:str, knowledge:List[Triples], kb: KnowledgeBase) -> List[Relation]:
+    """Declare the triples extracted from one or more sentences in a single batch, returning the declared relations."""
+
+    relations = knowledge_relations(knowledge)
+    if len(relations) > 0:
+        kb.add_knowledge_batch(user, relations)
+    return relations
+
+
+def knowledge_relations(knowledge:List[Triples]) -> List[Relation]:
+    """Convert extracted triples into the relations to declare."""
+
+    relations = []
     for k in knowledge:
         # print(k)
         kb_type = RelType.INHERITS if str(k.rel) in ["be", "Instance"] else RelType.OTHER
         
         # singularize simple entities
-        new_ent1 = str(k.ent1)
-        if len(new_ent1.split(" ")) == 1:
-            new_ent1 = Word(new_ent1).singularize()
-        new_ent2 = str(k.ent2)
-        if len(new_ent2.split(" ")) == 1:
-            new_ent2 = Word(new_ent2).singularize()
+        new_ent1 = singularize(str(k.ent1), k.ent1.token)
+        new_ent2 = singularize(str(k.ent2), k.ent2.token)
 
 
-        # TODO: lowercase entity names if they are TYPEs? ('Beans' and 'beans' will be different)
+        # Case and plural variants ('Beans' and 'beans') are declared about the same entity, see `canonical_key`
         new_relation = Relation(new_ent1, k.ent1.type_, new_ent2.strip(), k.ent2.type_, str(k.rel), kb_type, not_=k.not_)
         #print(new_relation)
-        kb.add_knowledge(user, new_relation)
+        relations.append(new_relation)
 
-    return knowledge
+    return relations
 
 
-def extract_entity(entity, subject, knowledge):
-    children = list(reversed(list(subject.children)))
-    for child in children:
+def extract_entity(entity: Entity, subject, knowledge: List[Triples]) -> str:
+    """Add the modifiers of the `subject` token to `entity`, and append the triples stated by its possessives to `knowledge`.
+    Returns the singularized name of the entity. \n
+    Modifiers are added as tokens, so the entity's name is only rendered once, when it's first read.
+    """
+
+    # The subject's children are visited from right to left, followed by the children of its modifiers
+    children = deque()
+    children.extendleft(subject.children)
+    while children:
+        child = children.popleft()
         # print(f"{child} {child.pos_} {child.dep_}")
         if child.dep_ == "poss":
-            ent2 = copy(entity)
-            entity = entity.prefix(Entity(child).append([c for c in child.children if c.dep_ == "case"][0]))
+            # "Diogo's dog" is an instance of "dog", which Diogo has
+            owned = entity.rendered()
+            case = [c for c in child.children if c.dep_ == "case"][0]
+            entity.prefix(f"{child.text}{case.text}")
             entity.type_ = EntityType.INSTANCE if child.pos_ == 'PROPN' else EntityType.TYPE
-            rel = "Instance"
-            triplet = Triples(ent1=entity, ent2=ent2, rel=rel)
-            triplet.not_ = False
-            knowledge.append(triplet)
-
-            ent1 = Entity(child)
-            ent2 = entity#.prefix(child)
-            rel = "have"
-            triplet = Triples(ent1=ent1, ent2=ent2, rel=rel)
-            triplet.not_ = False
-            knowledge.append(triplet)
+            knowledge.append(Triples(ent1=entity, ent2=owned, rel="Instance"))
+            knowledge.append(Triples(ent1=Entity(child), ent2=entity, rel="have"))
         elif child.dep_ in ["amod", "npadvmod", "nummod"]:
             entity.prefix(child)
-            new_children = child.children
-            children.extend(new_children)
+            children.extend(child.children)
         elif subject.dep_ == "xcomp" and child.dep_ == "dobj":
             entity.sufix(child)
-    
-    entity_str = str(entity)
-    if len(entity_str.split(" ")) == 1:
-        return Word(entity_str).singularize()
-    return str(entity)
 
+    return singularize(entity.name, entity.token)
 
 
 if __name__ == '__main__':
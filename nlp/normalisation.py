@@ -0,0 +1,65 @@
+from functools import lru_cache
+from textblob import Word
+
+
+# Penn Treebank tags of plural nouns, whose spaCy lemma is already the singular form
+PLURAL_NOUN_TAGS = {"NNS", "NNPS"}
+
+# Maximum number of distinct words whose singular form is memoised
+CACHE_SIZE = 8192
+
+_lemma_reuses = 0
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _singularize_word(word: str) -> str:
+    return str(Word(word).singularize())
+
+
+def singularize(entity: str, token=None) -> str:
+    """Singularize a simple (single-word) entity name. Compound entities are returned untouched.
+
+    If the spaCy `token` the entity was built from is provided and tagged as a plural noun,
+    its lemma is reused. Otherwise, TextBlob's inflection rules are applied and memoised,
+    so recurring vocabulary is resolved with a single dictionary lookup.
+    """
+
+    global _lemma_reuses
+
+    if len(entity.split(" ")) != 1:
+        return entity
+
+    if token is not None and token.text == entity and token.tag_ in PLURAL_NOUN_TAGS and token.lemma_:
+        _lemma_reuses += 1
+        lemma = token.lemma_
+        # spaCy lowercases lemmas, while TextBlob keeps the original capitalization
+        return lemma[0].upper() + lemma[1:] if entity[0].isupper() else lemma
+
+    return _singularize_word(entity)
+
+
+def stats() -> dict:
+    """Statistics of the singularization cache. \n
+    Output: `{"hits": ..., "misses": ..., "lemma_reuses": ..., "size": ..., "max_size": ..., "hit_rate": ...}`
+    """
+
+    info = _singularize_word.cache_info()
+    lookups = info.hits + info.misses + _lemma_reuses
+
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "lemma_reuses": _lemma_reuses,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+        "hit_rate": ((info.hits + _lemma_reuses) / lookups) if lookups > 0 else 0.0,
+    }
+
+
+def clear():
+    """Clear the singularization cache and its statistics."""
+
+    global _lemma_reuses
+
+    _singularize_word.cache_clear()
+    _lemma_reuses = 0
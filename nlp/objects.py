@@ -6,44 +6,71 @@ def get_entity_type(token) -> EntityType:
 
 
 class Triples:
-    def __init__(self, ent1, ent2, rel) -> None:
+    __slots__ = ("ent1", "ent2", "rel", "not_")
+
+    def __init__(self, ent1, ent2, rel, not_: bool=False) -> None:
         self.ent1 = ent1
         self.ent2 = ent2
         self.rel = rel
+        self.not_ = not_
 
     def __hash__(self) -> int:
         return hash(self.ent1) + hash(self.ent2) + hash(self.rel)
-    
+
     def __eq__(self, __o: object) -> bool:
         return self.rel == __o.rel and (
             (self.ent1 == __o.ent1 and self.ent2 == __o.ent2) or
             (self.ent1 == __o.ent2 and self.ent2 == __o.ent1)
         )
-    
+
     def __repr__(self) -> str:
         return f"{self.ent1} -- {self.rel} -> {self.ent2}"
 
-    
+
 class Entity:
+    """Entity named after a spaCy token, or after a string if `pos` is `False`. \n
+    The words of the modifiers found while extracting it (tokens, or strings such as possessives) are added with `prefix`
+    and `sufix`, and only joined into its `name` when it's first read, instead of concatenating strings per word.
+    """
+
+    __slots__ = ("token", "pos_", "type_", "_head", "_before", "_after", "_name")
+
     def __init__(self, name, pos=True, type_=None) -> None:
-        self.name = str(name)
+        self.token = name if pos else None
         self.pos_ = name.pos_ if pos else None
         self.type_ = get_entity_type(self) if type_ is None else type_
+        self._head = str(name)
+        # Words before the head, in the order they were added, and so in the reverse order they're rendered in
+        self._before = []
+        self._after = []
+        self._name = self._head
 
-    def prefix(self, val):
-        self.name = f"{val} {self.name}"
-        return self
+    @property
+    def name(self) -> str:
+        if self._name is None:
+            words = [*reversed(self._before), self._head, *self._after]
+            self._name = " ".join([str(word) for word in words])
+        return self._name
 
-    def sufix(self, val):
-        self.name = f"{self.name} {val}"
+    def prefix(self, word):
+        self._before.append(word)
+        self._name = None
         return self
-    
-    def append(self, val):
-        self.name = f"{self.name}{val}"
+
+    def sufix(self, word):
+        self._after.append(word)
+        self._name = None
         return self
 
+    def rendered(self) -> 'Entity':
+        """Entity with the name and type this entity has now, which doesn't follow the words added to it later."""
+
+        entity = Entity(self.name, False, self.type_)
+        entity.token, entity.pos_ = self.token, self.pos_
+        return entity
+
     def __repr__(self) -> str:
         return self.name
-    
+
     def __eq__(self, __o: object) -> bool:
-        return self.name == __o.name
\ No newline at end of file
+        return self.name == __o.name
@@ -80,6 +80,9 @@ def complex_response(content, confidence):
     else:
         target_entities = [object for entity in content[2].keys() for object in content[2][entity][0]]
         target_entities_string = str(target_entities[0][0]) if len(target_entities) == 1 else ''.join([("" if target_entities[i][1] else "not ") + str(target_entities[i][0]) + ", " for i in range(len(target_entities)-1)]) + "and " + str(target_entities[-1][0])
+        # Only the best answers are given, if there are more
+        if len(content) > 4 and content[4] is not None:
+            target_entities_string += ", among others"
         if confidence > 0.85:
             choices = [
                 f"I am quite sure {entity} does {relationship} {target_entities_string}.",
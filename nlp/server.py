@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import spacy
+
+from sn.kb import KnowledgeBase
+from sn.tracing import tracer
+from sn.write_behind import WriteBehindKnowledgeBase
+from nlp.engine import AnswerEngine
+
+
+class ChatbotServer:
+    """Chatbot server for several concurrent users.
+
+    Clients connect through a TCP or Unix socket and exchange newline-delimited JSON messages:
+    - request: `{"user": "Diogo", "text": "What does Diogo like?"}`
+    - response: `{"user": "Diogo", "response": "...", "elapsed": 0.012, "timings": {...}}`, or `{"error": "..."}`
+    if the request is malformed or couldn't be handled
+
+    Messages are handled in a pool of worker threads, which share the same answer engine, and therefore the spaCy
+    pipeline, the knowledge base (and its driver's connection pool) and the confidence table. Since parsing holds the GIL,
+    messages can be parsed in a pool of processes instead, each with a copy of the pipeline.
+
+    Parameters
+    ----------
+    knowledge_base : KnowledgeBase
+        The knowledge base shared by all users
+    workers : int = 4
+        The number of worker threads handling messages
+    defer_confidence_updates : bool = False
+        Whether declarations are acknowledged before the confidences are updated (see `AnswerEngine`)
+    parse_processes : int = 0
+        The number of processes parsing messages, or 0 to parse them in the worker threads (see `AnswerEngine`)
+    nlp : spacy.Language = None
+        The spaCy pipeline. If `None`, it's loaded with `nlp.main.init`
+    """
+
+    def __init__(self, knowledge_base: KnowledgeBase, workers: int=4, defer_confidence_updates: bool=False,
+                 parse_processes: int=0, nlp: spacy.Language=None):
+        self._engine = AnswerEngine(knowledge_base, nlp, defer_confidence_updates=defer_confidence_updates, parse_processes=parse_processes)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chatbot")
+
+    def answer(self, user: str, text: str) -> dict:
+        """Handle a message from `user`, blocking until the reply is obtained."""
+
+        start = time.perf_counter()
+        answer = self._engine.handle(user, text)
+        return {"user": user, "response": answer.response, "elapsed": time.perf_counter() - start,
+                "timings": answer.timings, "kb_calls": answer.kb_calls}
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+
+        try:
+            while line := await reader.readline():
+                if len(line.strip()) == 0:
+                    continue
+
+                try:
+                    message = json.loads(line)
+                    user, text = str(message["user"]), str(message["text"])
+                except (ValueError, KeyError, TypeError) as e:
+                    reply = {"error": f"Malformed request: {e}"}
+                else:
+                    try:
+                        reply = await loop.run_in_executor(self._executor, self.answer, user, text)
+                    except Exception as e:
+                        # E.g. the database is unavailable: reply anyway, so that the client isn't left waiting
+                        reply = {"error": f"Failed to handle the message: {type(e).__name__}: {e}"}
+
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def serve(self, host: str="localhost", port: int=8765, unix_path: str=None):
+        """Serve clients until cancelled, on `unix_path` if provided or on `host`:`port` otherwise."""
+
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host=host, port=port)
+
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._engine.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the chatbot to several concurrent users.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None, help="serve on this Unix socket path instead of TCP")
+    parser.add_argument("--workers", type=int, default=4, help="number of worker threads handling messages")
+    parser.add_argument("--parse-processes", type=int, default=0, help="number of processes parsing messages, instead of the worker threads")
+    parser.add_argument("--uri", default=None, help="defaults to NEO4J_URI, or bolt://localhost:7687")
+    parser.add_argument("--db-user", default=None, help="defaults to NEO4J_USER, or neo4j")
+    parser.add_argument("--db-password", default=None, help="defaults to NEO4J_PASSWORD")
+    parser.add_argument("--namespace", default=None, help="slice of the database to use, defaults to SN_NAMESPACE, or default")
+    parser.add_argument("--trace", default=None, help="write tracing spans as JSON lines to this file")
+    parser.add_argument("--metrics-port", type=int, default=None, help="expose knowledge base metrics in the Prometheus text format on this port")
+    parser.add_argument("--write-behind", type=float, default=None, metavar="SECONDS",
+                        help="acknowledge declarations immediately, updating the confidences in the background, "
+                             "and write them in batches at most this many seconds later")
+    args = parser.parse_args()
+
+    if args.trace is not None:
+        tracer.enable(args.trace)
+
+    kb = KnowledgeBase(args.uri, args.db_user, args.db_password, namespace=args.namespace)
+    kb.warm_up()
+    if args.metrics_port is not None:
+        kb.serve_metrics(args.host, args.metrics_port)
+    if args.write_behind is not None:
+        kb = WriteBehindKnowledgeBase(kb, flush_interval=args.write_behind)
+    # Otherwise, updating the confidences after each declaration would wait for it to be written
+    server = ChatbotServer(kb, workers=args.workers, defer_confidence_updates=args.write_behind is not None,
+                           parse_processes=args.parse_processes)
+    print(f"(!) Serving on {args.unix if args.unix is not None else f'{args.host}:{args.port}'}")
+
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print("(!) Bye bye!")
+    finally:
+        server.close()
+        kb.close()
+
+
+if __name__ == '__main__':
+    main()
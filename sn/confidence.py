@@ -1,7 +1,11 @@
-from typing import Dict, Set, TYPE_CHECKING, Union
+from threading import Lock, RLock
+from typing import Dict, Iterable, Set, Tuple, TYPE_CHECKING, Union
+from sn.kb import DELETE_ALL, PURGE, canonical_key
+from sn.tracing import tracer
 
 if TYPE_CHECKING:
-    from kb import KnowledgeBase, Relation
+    from kb import Change, Declaration, KnowledgeBase, Relation
+    from journal import Journal
 
 
 class ConfidenceTable:
@@ -25,6 +29,9 @@ class ConfidenceTable:
     If `saf_weight + nsaf_weight > 1`, then the non-static declarator's confidence can overshoot and
     undershoot, and thus be greater than 1 or lower than 0. In practice, the value is clamped.
 
+    The table can be shared between threads. Knowledge base queries are performed outside of the table's lock,
+    so confidence reads aren't blocked by a concurrent update, and concurrent updates are serialized.
+
     Parameters
     ----------
     knowledge_base : KnowledgeBase
@@ -35,13 +42,18 @@ class ConfidenceTable:
         The weight of the non-static agreement factor when calculating the confidence of a non-static declarator
     base_confidence : float = 0.5
         The base confidence of a non-static declarator
+    journal : Journal = None
+        A journal of every write to the knowledge base (see `sn.journal`). If provided, the declarations are kept
+        in memory and updated from the journal's new records before each computation, instead of being queried
+        from the knowledge base. The journal must hold every write since the knowledge base was empty
     """
 
     def __init__(self,
                  knowledge_base: 'KnowledgeBase',
                  saf_weight: float=0.5,
                  nsaf_weight: float=0.5,
-                 base_confidence: float=0.5):
+                 base_confidence: float=0.5,
+                 journal: 'Journal'=None):
 
         self._kb = knowledge_base
         self._saf_weight = saf_weight
@@ -52,18 +64,98 @@ class ConfidenceTable:
         self._static_declarators:        Set[str]           = set()
         self._non_static_declarators:    Set[str]           = set()
 
+        # Guards the confidence values and declarator sets
+        self._lock = RLock()
+        # Serializes confidence updates, which are costly
+        self._update_lock = Lock()
+
+        # Declarations followed from the journal, by declarator and by relation without its types. Entities are compared
+        # by their canonical keys, as the knowledge base does, since the journal records the names they were declared with
+        self._subscription = journal.subscribe() if journal is not None else None
+        self._declarations:     Dict[str, Dict['Declaration', 'Relation']]              = {}
+        self._declarators:      Dict[Tuple[str, str, str, bool], Dict[str, 'Relation']] = {}
+        # Guards the declarations followed from the journal
+        self._journal_lock = Lock()
+
+    def _follow_journal(self):
+        """Apply the journal's records appended since the last call to the in-memory declarations."""
+
+        if self._subscription is None:
+            return
+
+        with self._journal_lock:
+            for record in self._subscription.poll():
+                if record.operation == DELETE_ALL:
+                    self._declarations = {}
+                    self._declarators = {}
+                    continue
+
+                if record.operation == PURGE:
+                    for relation in self._declarations.pop(record.declarator, {}).values():
+                        self._declarators.get(self._relation_key(relation), {}).pop(record.declarator, None)
+                    continue
+
+                relation, inverse = record.relation, record.relation.inverse()
+                declarations = self._declarations.setdefault(record.declarator, {})
+                declarations.pop(self._declaration(inverse), None)
+                declarations[self._declaration(relation)] = relation
+
+                inverse_declarators = self._declarators.get(self._relation_key(inverse))
+                if inverse_declarators is not None:
+                    inverse_declarators.pop(record.declarator, None)
+                self._declarators.setdefault(self._relation_key(relation), {})[record.declarator] = relation
+
+    @staticmethod
+    def _relation_key(relation: 'Relation') -> Tuple[str, str, str, bool]:
+        return (canonical_key(relation.ent1), relation.name, canonical_key(relation.ent2), relation.not_)
+
+    @staticmethod
+    def _declaration(relation: 'Relation') -> 'Declaration':
+        return (canonical_key(relation.ent1), relation.ent1_type.value, canonical_key(relation.ent2), relation.ent2_type.value,
+                relation.name, relation.type_.value, relation.not_)
+
+    def _stream_declarations(self, declarator: str) -> Iterable['Declaration']:
+        if self._subscription is None:
+            return self._kb.stream_declarations(declarator)
+
+        with self._journal_lock:
+            return list(self._declarations.get(declarator, {}))
+
+    def _query_declarators(self, relation: 'Relation') -> Set[str]:
+        if self._subscription is None:
+            return self._kb.query_declarators(relation)
+
+        # As with `query_declarators`, the types of `relation` are optional
+        with self._journal_lock:
+            return {declarator for declarator, declaration in self._declarators.get(self._relation_key(relation), {}).items()
+                    if (relation.ent1_type is None or relation.ent1_type == declaration.ent1_type)
+                    and (relation.ent2_type is None or relation.ent2_type == declaration.ent2_type)
+                    and (relation.type_ is None or relation.type_ == declaration.type_)}
+
+    @tracer.traced()
     def update_confidences(self):
         """Update all confidence values of non-static declarators, since they are variable.
         The update frequency is therefore left at the discretion of the user.
         """
 
-        for non_static_declarator in self._non_static_declarators:
-            saf = self._get_agreement_factor(non_static_declarator, static=True)
-            nsaf = self._get_agreement_factor(non_static_declarator, static=False)
+        with self._update_lock:
+            self._follow_journal()
+            with self._lock:
+                non_static_declarators = set(self._non_static_declarators)
+
+            confidences = {}
+            for non_static_declarator in non_static_declarators:
+                saf = self._get_agreement_factor(non_static_declarator, static=True)
+                nsaf = self._get_agreement_factor(non_static_declarator, static=False)
+
+                confidences[non_static_declarator] = max(0.0, min(1.0, self._base_confidence
+                    + (1 - self._base_confidence) * saf * self._saf_weight
+                    + (1 - self._base_confidence) * nsaf * self._nsaf_weight))
 
-            self._confidences[non_static_declarator] = max(0.0, min(1.0, self._base_confidence
-                + (1 - self._base_confidence) * saf * self._saf_weight
-                + (1 - self._base_confidence) * nsaf * self._nsaf_weight))
+            with self._lock:
+                # Declarators may have been registered as static in the meantime
+                self._confidences.update({declarator: confidence for declarator, confidence in confidences.items()
+                                          if declarator in self._non_static_declarators})
 
     def register_declarator(self, declarator: str, static_confidence: float=None):
         """Register a static/non-static declarator.
@@ -84,20 +176,38 @@ class ConfidenceTable:
             Otherwise, register as a static declarator with the given `static_confidence`.
         """
 
-        # Registered static declarator
-        if static_confidence is not None:
-            if declarator in self._non_static_declarators:
-                self._non_static_declarators.remove(declarator)
-            self._confidences[declarator] = static_confidence
-            self._static_declarators.add(declarator)
-        
-        # Registered non-static declarator
-        else:
-            if declarator in self._static_declarators:
-                self._static_declarators.remove(declarator)
-            self._confidences[declarator] = self._base_confidence
-            self._non_static_declarators.add(declarator)
+        with self._lock:
+            # Registered static declarator
+            if static_confidence is not None:
+                if declarator in self._non_static_declarators:
+                    self._non_static_declarators.remove(declarator)
+                self._confidences[declarator] = static_confidence
+                self._static_declarators.add(declarator)
+            
+            # Registered non-static declarator
+            else:
+                if declarator in self._static_declarators:
+                    self._static_declarators.remove(declarator)
+                self._confidences[declarator] = self._base_confidence
+                self._non_static_declarators.add(declarator)
+
+    def remove_declarator(self, declarator: str):
+        """Stop considering a static/non-static declarator. It's idempotent."""
+
+        with self._lock:
+            self._static_declarators.discard(declarator)
+            self._non_static_declarators.discard(declarator)
+            self._confidences.pop(declarator, None)
+
+    def on_change(self, change: 'Change'):
+        """Knowledge base listener (see `KnowledgeBase.add_listener`), which removes purged declarators
+        and updates the confidences that depended on their declarations."""
+
+        if change.operation == PURGE:
+            self.remove_declarator(change.declarator)
+            self.update_confidences()
 
+    @tracer.traced()
     def get_relation_confidence(self, relation: 'Relation') -> Union[float, None]:
         """Obtain the confidence of the given relation based on its declarators' confidence values.
         
@@ -120,19 +230,21 @@ class ConfidenceTable:
             The declaration's confidence, or `None` the relation wasn't declared
         """
 
-        declarators = self._kb.query_declarators(relation)
-        adversary_declarators = self._kb.query_declarators(relation.inverse())
+        self._follow_journal()
+        declarators = self._query_declarators(relation)
+        adversary_declarators = self._query_declarators(relation.inverse())
 
         if len(declarators) == 0 and len(adversary_declarators) == 0:
             return None
 
         obtain_confidences = lambda ds, filter_ds: {self._confidences[declarator] for declarator in ds if declarator in filter_ds}
 
-        static_confidences = obtain_confidences(declarators, self._static_declarators)
-        non_static_confidences = obtain_confidences(declarators, self._non_static_declarators)
+        with self._lock:
+            static_confidences = obtain_confidences(declarators, self._static_declarators)
+            non_static_confidences = obtain_confidences(declarators, self._non_static_declarators)
 
-        adversary_static_confidences = obtain_confidences(adversary_declarators, self._static_declarators)
-        adversary_non_static_confidences = obtain_confidences(adversary_declarators, self._non_static_declarators)
+            adversary_static_confidences = obtain_confidences(adversary_declarators, self._static_declarators)
+            adversary_non_static_confidences = obtain_confidences(adversary_declarators, self._non_static_declarators)
 
         if len(static_confidences) > 0:
             if len(adversary_static_confidences) > 0:
@@ -152,6 +264,7 @@ class ConfidenceTable:
         
         return max(greatest_static_confidence, greatest_non_static_confidence)
 
+    @tracer.traced()
     def _get_agreement_factor(self, declarator: str, static: bool) -> float:
         """Calculate the agreement factor of a declarator, which represents the degree of
         agreement with other declarators on the knowledge base.
@@ -176,19 +289,23 @@ class ConfidenceTable:
             Whether to consider only static or non-static declarators
         """
 
-        other_declarators = (self._static_declarators if static else self._non_static_declarators) - {declarator}
+        with self._lock:
+            other_declarators = (self._static_declarators if static else self._non_static_declarators) - {declarator}
         
-        our_declarations = set(self._kb.query_declarations(declarator))
-        our_declarations_adversary = {relation.inverse() for relation in our_declarations}
+        our_declarations = set(self._stream_declarations(declarator))
+        our_declarations_adversary = {(*declaration[:6], not declaration[6]) for declaration in our_declarations}
 
         other_declarations_n = 0
         agreement_n = 0
         disagreement_n = 0
 
         for other_declarator in other_declarators:
-            their_declarations = set(self._kb.query_declarations(other_declarator))
-            other_declarations_n += len(their_declarations)
-            agreement_n += len(their_declarations & our_declarations)
-            disagreement_n += len(their_declarations & our_declarations_adversary)
+            # Their declarations are counted as they're streamed, without holding them in memory
+            for declaration in self._stream_declarations(other_declarator):
+                other_declarations_n += 1
+                if declaration in our_declarations:
+                    agreement_n += 1
+                elif declaration in our_declarations_adversary:
+                    disagreement_n += 1
         
         return ((agreement_n - disagreement_n) / other_declarations_n) if other_declarations_n > 0 else 0
@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Set, Union
+
+from sn.kb import ADD, DELETE_ALL, PURGE, Change, Relation, canonical_key
+
+
+def _hash(ent1: str, name: str, ent2: str, not_: bool) -> int:
+    return hash((canonical_key(ent1), name, canonical_key(ent2), bool(not_)))
+
+
+class DeclarationSets:
+    """In-process sets of the declarations of recently active declarators, such as the chatbot's users, to test whether
+    a declarator declared a relation without querying the knowledge base.
+
+    A declarator's declarations are loaded on their first test, and kept current as a knowledge base listener
+    (`kb.add_listener(declaration_sets.apply)`) or with `add`. Declarations are stored as the hashes of their entity keys,
+    name and polarity, so their types are ignored, as with `assert_relation` given a relation without types.
+
+    Parameters
+    ----------
+    kb : KnowledgeBase
+        The knowledge base holding the declarations
+    max_declarations : int = 100000
+        Declarators with more declarations aren't held in memory, and are tested with `kb.assert_relation` instead
+    max_declarators : int = 1000
+        Number of declarators whose declarations are held, the least recently tested ones being dropped
+    max_held_declarations : int = 1000000
+        Total number of declarations held, the declarations of the least recently tested declarators being dropped
+    """
+
+    def __init__(self, kb, max_declarations: int=100000, max_declarators: int=1000, max_held_declarations: int=1000000):
+        self._kb = kb
+        self.max_declarations = max_declarations
+        self.max_declarators = max_declarators
+        self.max_held_declarations = max_held_declarations
+
+        # Hashes of each declarator's declarations, in least recently tested order. `None` for declarators with too many
+        self._sets: 'OrderedDict[str, Union[Set[int], None]]' = OrderedDict()
+        # Total size of the sets
+        self._held = 0
+        # Changes of the declarators being loaded, applied once they're loaded
+        self._loading: Dict[str, List[Change]] = {}
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def declared(self, declarator: str, relation: Relation) -> bool:
+        """Whether `declarator` declared `relation`. Types are ignored."""
+
+        declarations = self._declarations(declarator)
+        if declarations is None:
+            return self._kb.assert_relation(relation, declarator=declarator)
+        return _hash(relation.ent1, relation.name, relation.ent2, relation.not_) in declarations
+
+    def _declarations(self, declarator: str) -> Union[Set[int], None]:
+        with self._lock:
+            if declarator in self._sets:
+                self._hits += 1
+                self._sets.move_to_end(declarator)
+                return self._sets[declarator]
+            self._misses += 1
+            self._loading.setdefault(declarator, [])
+
+        declarations = set()
+        for ent1, _, ent2, _, name, _, not_ in self._kb.stream_declarations(declarator):
+            declarations.add(_hash(ent1, name, ent2, not_))
+            if len(declarations) > self.max_declarations:
+                declarations = None
+                break
+
+        with self._lock:
+            pending = self._loading.pop(declarator, None)
+            if pending is None:
+                # Purged while loading, or loaded by another thread meanwhile
+                return declarations
+            if declarations is not None:
+                for change in pending:
+                    self._add(declarations, change.relation)
+            self._sets[declarator] = declarations
+            self._held += len(declarations) if declarations is not None else 0
+            self._evict()
+            return declarations
+
+    def _evict(self):
+        while len(self._sets) > self.max_declarators or self._held > self.max_held_declarations:
+            _, declarations = self._sets.popitem(last=False)
+            self._held -= len(declarations) if declarations is not None else 0
+
+    def add(self, declarator: str, relations: Iterable[Relation]):
+        """Record declarations of `declarator`, e.g. before they're written by a write-behind knowledge base."""
+
+        for relation in relations:
+            self.apply(Change(ADD, declarator, relation))
+
+    def apply(self, change: Change):
+        """Apply a change written to the knowledge base. Can be used as a knowledge base listener."""
+
+        with self._lock:
+            if change.operation == DELETE_ALL:
+                self._sets.clear()
+                self._loading.clear()
+                self._held = 0
+            elif change.operation == PURGE:
+                declarations = self._sets.pop(change.declarator, None)
+                self._held -= len(declarations) if declarations is not None else 0
+                self._loading.pop(change.declarator, None)
+            elif change.declarator in self._loading:
+                self._loading[change.declarator].append(change)
+            elif self._sets.get(change.declarator) is not None:
+                self._held += self._add(self._sets[change.declarator], change.relation)
+                self._evict()
+
+    @staticmethod
+    def _add(declarations: Set[int], relation: Relation) -> int:
+        """Add `relation` to `declarations`, returning the change in their size."""
+
+        size = len(declarations)
+        # Declarations replace the declarations of their inverses
+        declarations.discard(_hash(relation.ent1, relation.name, relation.ent2, not relation.not_))
+        declarations.add(_hash(relation.ent1, relation.name, relation.ent2, relation.not_))
+        return len(declarations) - size
+
+    def stats(self) -> dict:
+        """Output: `{"declarators": ..., "declarations": ..., "hits": ..., "misses": ...}`, where declarations are the ones held,
+        and misses are the tests which loaded a declarator's declarations."""
+
+        with self._lock:
+            return {"declarators": len(self._sets), "declarations": self._held, "hits": self._hits, "misses": self._misses}
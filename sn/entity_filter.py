@@ -0,0 +1,91 @@
+import hashlib
+import math
+import threading
+from typing import Iterable
+
+from sn.kb import ADD, DELETE_ALL, Change, canonical_key
+
+
+class EntityFilter:
+    """Bloom filter of the entity names of a knowledge base, to answer queries about unknown entities without querying the database.
+
+    Names are compared by their canonical keys (see `canonical_key`), as in the knowledge base.
+    `might_contain` never returns `False` for a known name, but may return `True` for an unknown one, with a probability
+    given by `false_positive_rate`. Names are added as a knowledge base listener (`kb.add_listener(entity_filter.apply)`),
+    and are never removed, since deleted entities only cost a query, as without the filter.
+
+    Parameters
+    ----------
+    capacity : int = 100000
+        The expected number of names. Adding more names raises the false positive rate above `error_rate`
+    error_rate : float = 0.01
+        The false positive rate once `capacity` names are added
+    """
+
+    def __init__(self, capacity: int=100000, error_rate: float=0.01):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self._size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hashes = max(1, round(self._size / self.capacity * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+        self._lookups = 0
+        self._negatives = 0
+        # Guards the bits against concurrent additions to the same byte, and the counters
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load(kb, error_rate: float=0.01, headroom: float=2.0) -> 'EntityFilter':
+        """Filter of the entity names of `kb`, with room for `headroom` times as many names."""
+
+        count = kb.count_entities()
+        entity_filter = EntityFilter(max(100000, int(count * headroom)), error_rate)
+        entity_filter.update(kb.stream_entity_names())
+        return entity_filter
+
+    def _positions(self, name: str) -> Iterable[int]:
+        # Double hashing of a single digest, instead of computing one hash per position
+        digest = hashlib.blake2b(canonical_key(name).encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self._size for i in range(self._hashes))
+
+    def add(self, name: str):
+        with self._lock:
+            for position in self._positions(name):
+                self._bits[position >> 3] |= 1 << (position & 7)
+
+    def update(self, names: Iterable[str]):
+        for name in names:
+            self.add(name)
+
+    def might_contain(self, name: str) -> bool:
+        bits = self._bits
+        found = all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(name))
+        with self._lock:
+            self._lookups += 1
+            self._negatives += not found
+        return found
+
+    def apply(self, change: Change):
+        """Add the entities of a change written to the knowledge base. Can be used as a knowledge base listener."""
+
+        if change.operation == ADD:
+            self.add(change.relation.ent1)
+            self.add(change.relation.ent2)
+        elif change.operation == DELETE_ALL:
+            with self._lock:
+                self._bits = bytearray(len(self._bits))
+
+    def false_positive_rate(self) -> float:
+        """Probability that `might_contain` returns `True` for an unknown name, given the bits set so far."""
+
+        with self._lock:
+            bits_set = bin(int.from_bytes(self._bits, "little")).count("1")
+        return (bits_set / self._size) ** self._hashes
+
+    def stats(self) -> dict:
+        """Output: `{"lookups": ..., "negatives": ..., "false_positive_rate": ...}`,
+        where negatives are the lookups answered without querying the database."""
+
+        false_positive_rate = self.false_positive_rate()
+        with self._lock:
+            return {"lookups": self._lookups, "negatives": self._negatives, "false_positive_rate": false_positive_rate}
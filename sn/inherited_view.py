@@ -0,0 +1,120 @@
+import threading
+from typing import Dict, List, Set, Tuple, Union
+
+from sn.kb import ADD, DELETE_ALL, PURGE, Change, RelType, canonical_key
+from sn.taxonomy import Taxonomy
+
+# Answers of an inheritance query, as `(subject, characteristic, not, distance)` rows in rank order
+Rows = List[Tuple[str, str, bool, int]]
+
+
+class InheritedView:
+    """Materialised view of the answers of inheritance queries, keyed by entity and relation name, so that repeated
+    questions such as "What does Diogo eat?" are answered with a single lookup instead of traversing the taxonomy.
+
+    Entries are materialised on first query with `kb.query_ranked_inheritance_relation`, and kept current as a knowledge
+    base listener (`kb.add_listener(view.apply)`), so they only see the writes made through this process. A relation
+    declared about an entity invalidates the entries of that relation for the entity and its descendants, and an
+    INHERITS relation invalidates every entry of the child and its descendants, which are materialised again when
+    next queried. Purges and deletes empty the view.
+
+    Parameters
+    ----------
+    kb : KnowledgeBase
+        The knowledge base to materialise the answers of
+    taxonomy : Taxonomy = None
+        Copy of the knowledge base's INHERITS relations, kept current by the knowledge base, which resolves the descendants
+        of the written entities. If not provided, the view loads and maintains its own
+    """
+
+    def __init__(self, kb, taxonomy: Taxonomy=None):
+        self._kb = kb
+        self._own_taxonomy = taxonomy is None
+        self.taxonomy = taxonomy if taxonomy is not None else Taxonomy.load(kb)
+
+        # Rows of each `(entity key, relation)`, per declarator filter
+        self._entries: Dict[Tuple[str, str], Dict[Union[str, None], Rows]] = {}
+        # Relations materialised for each entity key, to invalidate all of an entity's entries
+        self._relations: Dict[str, Set[str]] = {}
+        # Name each entity key was queried with, since keys can't be canonicalized again
+        self._names: Dict[str, str] = {}
+        # Incremented by every invalidation, so that rows queried concurrently with a write aren't stored
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def ranked(self, ent: str, relation: str, declarator: str=None) -> Rows:
+        """Answers of `kb.query_ranked_inheritance_relation(ent, relation, declarator)`, from the view if materialised."""
+
+        key = canonical_key(ent)
+        with self._lock:
+            rows = self._entries.get((key, relation), {}).get(declarator)
+            if rows is not None:
+                self._hits += 1
+                return rows
+            self._misses += 1
+            generation = self._generation
+
+        rows = self._kb.query_ranked_inheritance_relation(ent, relation, declarator)
+        # Not stored if empty, as with the unknown entities of `Taxonomy.ancestors`
+        if len(rows) > 0:
+            with self._lock:
+                if generation == self._generation:
+                    self._entries.setdefault((key, relation), {})[declarator] = rows
+                    self._relations.setdefault(key, set()).add(relation)
+                    self._names.setdefault(key, ent)
+        return rows
+
+    def apply(self, change: Change):
+        """Invalidate the entries affected by a change written to the knowledge base. Can be used as a knowledge base listener."""
+
+        if self._own_taxonomy:
+            self.taxonomy.apply(change)
+
+        with self._lock:
+            self._generation += 1
+            if change.operation in (DELETE_ALL, PURGE):
+                self._entries = {}
+                self._relations = {}
+                self._names = {}
+            elif change.operation == ADD:
+                relation = change.relation
+                keys = {canonical_key(relation.ent1)} | {canonical_key(name) for name in self.taxonomy.descendants(relation.ent1)}
+                for key in keys:
+                    if relation.type_ == RelType.INHERITS:
+                        for name in self._relations.pop(key, ()):
+                            self._entries.pop((key, name), None)
+                    elif self._entries.pop((key, relation.name), None) is not None:
+                        self._relations[key].discard(relation.name)
+
+    def check(self) -> List[Tuple[str, str, Union[str, None]]]:
+        """Compare every materialised entry with the answers queried from the knowledge base, returning the
+        `(entity, relation, declarator)` of the entries which differ, such as entries missing writes made by other processes.
+        The differing entries are invalidated."""
+
+        with self._lock:
+            entries = [(key, self._names[key], relation, declarator, rows) for (key, relation), by_declarator in self._entries.items()
+                       for declarator, rows in by_declarator.items()]
+
+        stale = []
+        for key, ent, relation, declarator, rows in entries:
+            if self._kb.query_ranked_inheritance_relation(ent, relation, declarator) != rows:
+                stale.append((key, ent, relation, declarator))
+
+        with self._lock:
+            self._generation += 1
+            for key, _, relation, declarator in stale:
+                self._entries.get((key, relation), {}).pop(declarator, None)
+        return [(ent, relation, declarator) for _, ent, relation, declarator in stale]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(by_declarator) for by_declarator in self._entries.values())
+
+    def stats(self) -> dict:
+        """Output: `{"entries": ..., "hits": ..., "misses": ...}`."""
+
+        entries = len(self)
+        with self._lock:
+            return {"entries": entries, "hits": self._hits, "misses": self._misses}
@@ -0,0 +1,212 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Iterator, List, Union
+
+from sn.kb import ADD, DELETE_ALL, PURGE, Change, EntityType, RelType, Relation
+
+
+@dataclass(frozen=True)
+class JournalRecord:
+    """A change written to a knowledge base, numbered by its position in the journal."""
+
+    seq:                int
+    operation:          str
+    declarator:         Union[str, None]        = None
+    relation:           Union[Relation, None]   = None
+    replaced_inverse:   bool                    = False
+
+    def change(self) -> Change:
+        return Change(self.operation, self.declarator, self.relation, self.replaced_inverse)
+
+
+def _encode(seq: int, change: Change) -> str:
+    if change.operation == DELETE_ALL:
+        return json.dumps([seq, DELETE_ALL])
+    if change.operation == PURGE:
+        return json.dumps([seq, PURGE, change.declarator], ensure_ascii=False)
+
+    relation = change.relation
+    return json.dumps([seq, ADD, change.declarator, relation.ent1, relation.ent1_type.value, relation.ent2, relation.ent2_type.value,
+                       relation.name, relation.type_.value, relation.not_, change.replaced_inverse], ensure_ascii=False)
+
+def _decode(line: str) -> JournalRecord:
+    fields = json.loads(line)
+    if fields[1] == DELETE_ALL:
+        return JournalRecord(fields[0], DELETE_ALL)
+    if fields[1] == PURGE:
+        return JournalRecord(fields[0], PURGE, fields[2])
+
+    seq, operation, declarator, ent1, ent1_type, ent2, ent2_type, name, type_, not_, replaced_inverse = fields
+    return JournalRecord(seq, operation, declarator,
+                         Relation(ent1, EntityType(ent1_type), ent2, EntityType(ent2_type), name, RelType(type_), not_),
+                         replaced_inverse)
+
+
+class Journal:
+    """Append-only log of the changes written to a knowledge base, stored as one JSON array per line.
+
+    Attach it to a knowledge base with `kb.add_listener(journal.append)`, so that every committed write is appended
+    with the next sequence number. The journal can then rebuild a knowledge base with `replay`, and caches can follow
+    the changes with `subscribe` instead of querying the knowledge base again.
+
+    Parameters
+    ----------
+    path : str
+        The journal file, which is created if it doesn't exist. A partially written last line is discarded
+    sync : bool = False
+        Whether to `fsync` every append. Otherwise, records are only flushed to the operating system
+    """
+
+    def __init__(self, path: str, sync: bool=False):
+        self.path = path
+        self.sync = sync
+        self.last_seq = self._recover()
+        self._file = open(path, "a", encoding="utf-8")
+        self._closed = False
+        # Guards appends, and wakes up blocked subscriptions
+        self._appended = threading.Condition()
+
+    def _recover(self) -> int:
+        """Truncate a partially written last line, and return the sequence number of the last record."""
+
+        if not os.path.exists(self.path):
+            return 0
+
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            # Search backwards for the end of the last complete line
+            end = size
+            while end > 0:
+                start = max(0, end - 65536)
+                f.seek(start)
+                chunk = f.read(end - start)
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end < size:
+                f.truncate(end)
+            if end == 0:
+                return 0
+
+            start = max(0, end - 65536)
+            f.seek(start)
+            lines = f.read(end - start).splitlines()
+            return json.loads(lines[-1])[0]
+
+    def append(self, change: Change) -> int:
+        """Append a change, returning its sequence number. Can be used as a knowledge base listener."""
+
+        with self._appended:
+            seq = self.last_seq + 1
+            self._file.write(_encode(seq, change) + "\n")
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+            self.last_seq = seq
+            self._appended.notify_all()
+        return seq
+
+    def records(self, from_seq: int=1) -> Iterator[JournalRecord]:
+        """All records from sequence number `from_seq` onwards, as of the call."""
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    # Being appended
+                    break
+                record = _decode(line)
+                if record.seq >= from_seq:
+                    yield record
+
+    def subscribe(self, from_seq: int=1) -> 'Subscription':
+        """Follow the records from sequence number `from_seq` onwards, including the ones appended later."""
+
+        return Subscription(self, from_seq)
+
+    def replay(self, kb, from_seq: int=1, batch_size: int=10000) -> int:
+        """Write the records from sequence number `from_seq` onwards to `kb`, rebuilding the knowledge base they were written to.
+        Consecutive declarations by the same declarator are written in batches. Returns the number of records replayed.
+
+        If `kb` has this journal as a listener, the replayed changes are appended to it again."""
+
+        n = 0
+        declarator, batch = None, []
+        for record in self.records(from_seq):
+            n += 1
+            if len(batch) > 0 and (record.operation != ADD or record.declarator != declarator or len(batch) >= batch_size):
+                kb.add_knowledge_batch(declarator, batch)
+                batch = []
+
+            if record.operation == DELETE_ALL:
+                kb.delete_all()
+            elif record.operation == PURGE:
+                kb.purge_declarator(record.declarator)
+            else:
+                declarator = record.declarator
+                batch.append(record.relation)
+
+        if len(batch) > 0:
+            kb.add_knowledge_batch(declarator, batch)
+        return n
+
+    def close(self):
+        with self._appended:
+            self._closed = True
+            self._file.close()
+            self._appended.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Subscription:
+    """Cursor over a journal's records. `poll` returns the records appended since the last call without blocking,
+    while iterating blocks until new records are appended, and stops once the subscription or the journal is closed."""
+
+    def __init__(self, journal: Journal, from_seq: int=1):
+        self._journal = journal
+        self._from_seq = from_seq
+        self._file = open(journal.path, "r", encoding="utf-8")
+        self._closed = False
+        # Last sequence number read
+        self.seq = from_seq - 1
+
+    def poll(self) -> List[JournalRecord]:
+        records = []
+        while True:
+            position = self._file.tell()
+            line = self._file.readline()
+            if not line.endswith("\n"):
+                # Nothing left, or a line being appended
+                self._file.seek(position)
+                break
+            record = _decode(line)
+            if record.seq >= self._from_seq:
+                records.append(record)
+                self.seq = record.seq
+        return records
+
+    def __iter__(self) -> Iterator[JournalRecord]:
+        journal = self._journal
+        while not self._closed:
+            records = self.poll()
+            if len(records) == 0:
+                with journal._appended:
+                    journal._appended.wait_for(lambda: journal.last_seq > self.seq or journal._closed or self._closed)
+                    if journal.last_seq <= self.seq:
+                        return
+                continue
+            yield from records
+
+    def close(self):
+        self._closed = True
+        self._file.close()
+        with self._journal._appended:
+            self._journal._appended.notify_all()
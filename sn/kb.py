@@ -1,7 +1,15 @@
-from dataclasses import dataclass
+import os
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, fields, replace
+from functools import lru_cache
 from neo4j import GraphDatabase, ManagedTransaction
 from enum import Enum
-from typing import Tuple, Dict, Union, Set
+from textblob import Word
+from typing import Callable, Tuple, Dict, Iterable, Iterator, List, NamedTuple, Union, Set
+from sn.metrics import KnowledgeBaseMetrics, serve_prometheus
+from sn.tracing import Span, TracedTransaction, tracer
 
 
 class EntityType(Enum):
@@ -12,23 +20,147 @@ class RelType(Enum):
     INHERITS = "Inherits"
     OTHER = "Other"
 
-# Decorator for read operations
-def sn_read(read_method):
+# Operations of the changes published by knowledge bases
+ADD = "add"
+DELETE_ALL = "delete_all"
+PURGE = "purge"
+
+class Change(NamedTuple):
+    """A committed write to a knowledge base, published to its listeners.
+    `replaced_inverse` tells whether an `ADD` replaced the declarator's declaration of the inverse relation.
+    A `PURGE` removed every declaration of `declarator`."""
+
+    operation:          str
+    declarator:         Union[str, None]        = None
+    relation:           Union['Relation', None] = None
+    replaced_inverse:   bool                    = False
+
+# Namespace of the knowledge bases created without one, and of the entities written before namespaces existed
+DEFAULT_NAMESPACE = "default"
+
+# Declarations streamed as `(ent1, ent1_type, ent2, ent2_type, name, type, not)` tuples, where types are their enum values.
+# Compared to `Relation`s, they're cheaper to build and hash, for consumers that process every declaration of a declarator
+Declaration = Tuple[str, str, str, str, str, str, bool]
+
+# Ranks the relations named `$relation` of the entities `e1`, `distance` inheritance relations away from the queried entity,
+# by distance and then by number of declarators, returning `(subject, characteristic, not, distance)` rows
+def _namespace_match(variable: str, where: str=None) -> str:
+    """Subquery returning the entities of the namespace (matching `where`, if given) as `variable`. Each label is matched
+    on its own, since an unlabelled match scans every node instead of using the namespace and key indexes."""
+
+    condition = f"WHERE {where} " if where is not None else ""
+    return ("CALL { " +
+            " UNION ".join(f"MATCH ({variable}:{entity_type.value} {{ns: $ns}}) {condition}RETURN {variable}" for entity_type in EntityType) +
+            " } ")
+
+def _ranked_relations(limited: bool) -> str:
+    return ("MATCH (e1)-[r {name: $relation}]->(e2) WHERE $declarator IS NULL OR r.declarator = $declarator "
+            "WITH e1.name AS subject, e2.name AS characteristic, r.not AS negated, min(distance) AS distance, count(DISTINCT r.declarator) AS support "
+            "ORDER BY distance, support DESC, subject, characteristic, negated SKIP $skip " + ("LIMIT $limit " if limited else "") +
+            "RETURN subject, characteristic, negated, distance")
+
+# Endings of singular words which TextBlob mistakes for plurals, singularizing e.g. "boss" into "bos" and "physics" into "physic"
+_SINGULAR_ENDINGS = ("ss", "us", "is", "ics")
+
+def _singular(word: str) -> str:
+    singular = str(Word(word).singularize())
+    if singular == word[:-1] and word.endswith(_SINGULAR_ENDINGS):
+        return word
+    return singular
+
+@lru_cache(maxsize=65536)
+def canonical_key(name: str) -> str:
+    """Key identifying the entities named `name` regardless of case, whitespace and number: the lowercase name, with
+    single spaces between words and its last word singularized if it's plural. E.g. "Beans", "beans" and "bean" have the
+    same key, as do "bosses" and "boss". Keys are their own keys. \n
+    Entities are stored once per key and type, under the first name they were declared with, and every lookup by name uses the key.
+    """
+
+    words = name.casefold().split()
+    if len(words) == 0:
+        return ""
+    words[-1] = _singular(words[-1])
+    return " ".join(words)
+
+class _Transaction(TracedTransaction):
+    """Transaction of a knowledge base method, which also collects the changes to publish once it's committed.
+    `changes` is `None` if the knowledge base has no listeners, so that bulk writes don't build them needlessly.
+    Every statement is given the knowledge base's namespace as the `$ns` parameter."""
+
+    __slots__ = ("changes", "namespace")
+
+    def __init__(self, tx, span: Union[Span, None], changes: Union[List[Change], None], namespace: str):
+        super().__init__(tx, span, tracer)
+        self.changes = changes
+        self.namespace = namespace
+
+    def run(self, query: str, *args, **kwargs):
+        return super().run(query, *args, ns=self.namespace, **kwargs)
+
+    def publish(self, change: Change):
+        if self.changes is not None:
+            self.changes.append(change)
+
+def _sn_transaction(method, write: bool):
+    name = method.__name__
+    span_name = f"kb.{name}"
+
+    def execute(kb: 'KnowledgeBase', span: Union[Span, None], args, kwargs):
+        attempts = 0
+        # Transaction of the last attempt, whose statements and rows are recorded in the metrics
+        transaction = None
+        changes = None
+        error = True
+        start = time.perf_counter()
+        with kb._publishing(write):
+            try:
+                with kb._session() as session:
+                    kb.metrics.session_opened()
+                    run = session.execute_write if write else session.execute_read
+
+                    def include_tx_wrapper(tx, *args, **kwargs):
+                        nonlocal attempts, transaction, changes
+                        attempts += 1
+                        changes = [] if kb.has_listeners() else None
+                        transaction = _Transaction(tx, span, changes, kb.namespace)
+                        try:
+                            return method(*args, **kwargs, tx=transaction)
+                        finally:
+                            if span is not None:
+                                # Retried attempts included
+                                span.add("statements", transaction.statements)
+                                span.add("rows", transaction.rows)
+                    result = run(include_tx_wrapper, *args, **kwargs)
+                    error = False
+            finally:
+                kb.metrics.record(name, time.perf_counter() - start,
+                                  transaction.rows if transaction is not None else 0,
+                                  transaction.statements if transaction is not None else 0,
+                                  max(attempts - 1, 0), error)
+
+            # The transaction is committed by now
+            if changes:
+                kb.publish(changes)
+        return result
+
     def wrapper(self: 'KnowledgeBase', *args, **kwargs):
-        with self.driver.session() as session:
-            def include_tx_wrapper(tx, *args, **kwargs):
-                return read_method(*args, **kwargs, tx=tx)
-            return session.execute_read(include_tx_wrapper, *args, **kwargs)
+        if not tracer.enabled:
+            return execute(self, None, args, kwargs)
+
+        with tracer.span(span_name) as span:
+            return execute(self, span, args, kwargs)
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
     return wrapper
 
+# Decorator for read operations
+def sn_read(read_method):
+    return _sn_transaction(read_method, write=False)
+
 # Decorator for write operations
 def sn_write(write_method):
-    def wrapper(self: 'KnowledgeBase', *args, **kwargs):
-        with self.driver.session() as session:
-            def include_tx_wrapper(tx, *args, **kwargs):
-                return write_method(*args, **kwargs, tx=tx)
-            return session.execute_write(include_tx_wrapper, *args, **kwargs)
-    return wrapper
+    return _sn_transaction(write_method, write=True)
 
 @dataclass(frozen=True)
 class Relation:
@@ -71,13 +203,312 @@ class Relation:
     def __str__(self) -> str:
         return f"({self.ent1}{(' :' + self.ent1_type.value) if self.ent1_type is not None else ''})-[{('not ' if self.not_ else '')}{self.name}{(' :' + self.type_.value) if self.type_ is not None else ''}]->({self.ent2}{(' :' + self.ent2_type.value) if self.ent2_type is not None else ''})"
 
-class KnowledgeBase:
+@dataclass(frozen=True)
+class DriverConfig:
+    """Settings of the Neo4j driver of a `KnowledgeBase`, and of the sessions it opens.
+
+    Parameters
+    ----------
+    uri : str = "bolt://localhost:7687"
+        The URI of the Neo4j database
+    user : str = "neo4j"
+        The database user
+    password : str | None = None
+        The database user's password
+    database : str | None = None
+        The database to use. If `None`, the server's default database, which is resolved by an extra round trip per session
+    max_connection_pool_size : int = 100
+        Maximum number of connections held by the driver, which bounds the number of concurrent transactions
+    connection_acquisition_timeout : float = 60.0
+        Seconds to wait for a connection of the pool to be free
+    fetch_size : int = 1000
+        Records fetched per round trip while iterating a result
+    keep_alive : bool = True
+        Whether to keep pooled connections alive with TCP keep-alive
+    """
+
+    uri:                            str                 = "bolt://localhost:7687"
+    user:                           str                 = "neo4j"
+    password:                       Union[str, None]    = None
+    database:                       Union[str, None]    = None
+    max_connection_pool_size:       int                 = 100
+    connection_acquisition_timeout: float               = 60.0
+    fetch_size:                     int                 = 1000
+    keep_alive:                     bool                = True
+
+    @staticmethod
+    def from_env(**overrides) -> 'DriverConfig':
+        """Settings read from the `NEO4J_<SETTING>` environment variables (e.g. `NEO4J_PASSWORD`, `NEO4J_MAX_CONNECTION_POOL_SIZE`),
+        with the defaults for the missing ones. Settings given in `overrides` take precedence, unless they're `None`."""
+
+        settings = {}
+        for field in fields(DriverConfig):
+            value = overrides.get(field.name)
+            if value is None:
+                value = os.environ.get(f"NEO4J_{field.name.upper()}")
+                if value is None:
+                    continue
+                if field.type is bool:
+                    value = value.lower() in ("1", "true", "yes")
+                elif field.type in (int, float):
+                    value = field.type(value)
+            settings[field.name] = value
+        return DriverConfig(**settings)
+
+    def driver(self):
+        return GraphDatabase.driver(self.uri, auth=(self.user, self.password), max_connection_pool_size=self.max_connection_pool_size,
+                                    connection_acquisition_timeout=self.connection_acquisition_timeout, keep_alive=self.keep_alive)
+
+class KnowledgeBaseCommon:
+    """Metrics and change listeners, shared by all knowledge base backends."""
+
+    def __init__(self):
+        self.metrics = KnowledgeBaseMetrics()
+        self._metrics_server = None
+        self._listeners: List[Callable[[Change], None]] = []
+        # Held by writers from their commit until their changes are published, while there are listeners
+        self._publish_lock = threading.RLock()
+
+    def close(self):
+        if self._metrics_server is not None:
+            self._metrics_server.shutdown()
+            self._metrics_server.server_close()
+            self._metrics_server = None
+
+    def stats(self) -> dict:
+        """Snapshot of the calls made to this knowledge base: sessions opened and, for each method, calls, errors,
+        records returned, statements run, transaction retries and latency histogram. See `KnowledgeBaseMetrics.snapshot`."""
+
+        return self.metrics.snapshot()
+
+    def serve_metrics(self, host: str="localhost", port: int=9464):
+        """Expose the metrics in the Prometheus text format at `http://host:port/metrics`, until the knowledge base is closed."""
+
+        if self._metrics_server is None:
+            self._metrics_server = serve_prometheus(self.metrics, host, port)
+
+    def add_listener(self, listener: Callable[[Change], None]):
+        """Call `listener` with every `Change` written through this knowledge base, once its transaction is committed,
+        in the order of the commits. E.g.: `kb.add_listener(journal.append)`."""
+
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Change], None]):
+        self._listeners.remove(listener)
+
+    def has_listeners(self) -> bool:
+        return len(self._listeners) > 0
+
+    def _publishing(self, write: bool):
+        """Context of a transaction, which holds the publish lock if it's a write with listeners to publish to, so that
+        changes are published in the order of the commits. Writes are serialized meanwhile."""
+
+        return self._publish_lock if write and self.has_listeners() else nullcontext()
+
+    def publish(self, changes: List[Change]):
+        for listener in self._listeners:
+            for change in changes:
+                listener(change)
+
+    def delete_all(self, batch_size: int=10000):
+        """Clean the knowledge base, deleting at most `batch_size` relations or entities per transaction,
+        so that large graphs aren't deleted in a single transaction that doesn't fit in the database's memory."""
+
+        while self._delete_relations(batch_size) == batch_size:
+            pass
+        while self._delete_orphans(batch_size) == batch_size:
+            pass
+
+        self.publish([Change(DELETE_ALL)])
+
+    def purge_declarator(self, declarator: str, batch_size: int=10000) -> int:
+        """Remove every declaration of `declarator`, and the entities left without relations, deleting at most
+        `batch_size` of them per transaction so that the knowledge base is never locked for long.
+        Listeners are notified once every declaration is removed. Returns the number of removed declarations."""
+
+        purged = 0
+        while True:
+            deleted = self._purge_relations(declarator, batch_size)
+            purged += deleted
+            if deleted < batch_size:
+                break
+        while self._delete_orphans(batch_size) == batch_size:
+            pass
 
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        if purged > 0:
+            self.publish([Change(PURGE, declarator)])
+        return purged
+
+    def migrate_keys(self, batch_size: int=1000) -> int:
+        """Set the canonical key (see `canonical_key`) of the entities written before keys existed, or whose key was
+        computed by an earlier version of `canonical_key`, at most `batch_size` entities per transaction. Entities whose key
+        is already taken by an entity of the same type are merged into it: their relations are moved to it and they're
+        deleted, so that e.g. "Beans" and "beans" become a single entity. Can be interrupted and run again.
+        Returns the number of merged entities."""
+
+        merged = 0
+        while True:
+            processed, batch_merged = self._key_entities(batch_size)
+            merged += batch_merged
+            if processed < batch_size:
+                break
+
+        # Every entity is read again in key order, as keys can't be told apart from stale ones in the database
+        for entity_type in EntityType:
+            after = ""
+            while after is not None:
+                after, batch_merged = self._rekey_entities(entity_type, after, batch_size)
+                merged += batch_merged
+        return merged
+
+    @staticmethod
+    def _ranked_answers(rows: List[Tuple[str, str, bool, int]]) -> Dict[str, Tuple[Set[Tuple[str, bool]], int]]:
+        """Answers of `query_inheritance_relation` given by `(subject, characteristic, not, distance)` rows."""
+
+        characteristics = {}
+        distances = {}
+        for subject, characteristic, negated, distance in rows:
+            characteristics.setdefault(subject, set()).add((characteristic, not negated))
+            distances[subject] = min(distance, distances.get(subject, distance))
+
+        return {subject: (frozenset(values), distances[subject]) for subject, values in characteristics.items()}
+
+
+class KnowledgeBase(KnowledgeBaseCommon):
+    """Semantic network stored in a Neo4j database.
+
+    Parameters
+    ----------
+    uri : str = None
+        The URI of the Neo4j database
+    user : str = None
+        The database user
+    password : str = None
+        The database user's password
+    driver : Driver = None
+        An already created driver to use instead, such as a stub for offline benchmarks.
+        If provided, the connection settings are ignored
+    config : DriverConfig = None
+        The driver and session settings. If `None`, they're read from the environment (see `DriverConfig.from_env`).
+        `uri`, `user` and `password` take precedence over the ones it holds, unless they're `None`
+    create_indexes : bool = True
+        Whether to create the uniqueness constraints of the entity keys and the indexes of the database, if they don't exist,
+        which MERGEs rely upon to neither scan every entity nor create duplicates under concurrent writes.
+        Stub drivers don't need them
+    namespace : str = None
+        The slice of the database this knowledge base reads and writes: its entities are tagged with the namespace, and
+        its queries, deletes and purges only see the entities tagged with it, so that e.g. test runs and benchmarks can
+        share a server. If `None`, the `SN_NAMESPACE` environment variable, or `DEFAULT_NAMESPACE`
+    taxonomy : bool = False
+        Whether to keep an in-process copy of the INHERITS relations (see `sn.taxonomy`), loaded once and kept current
+        through this knowledge base's writes. Inheritance queries then resolve ancestors and descendants locally, and
+        only look up the relations of the resolved entities in the database. Writes made by other processes aren't seen
+    entity_filter : bool = False
+        Whether to keep a Bloom filter of the entity names (see `sn.entity_filter`), loaded once and kept current through
+        this knowledge base's writes. Inheritance queries about entities which certainly don't exist then return nothing
+        without querying the database. Entities written by other processes aren't seen
+    inherited_view : bool = False
+        Whether to keep the answers of inheritance queries in an in-process materialised view (see `sn.inherited_view`),
+        updated through this knowledge base's writes. Repeated inheritance queries are then answered without querying
+        the database. Writes made by other processes aren't seen
+    """
+
+    def __init__(self, uri=None, user=None, password=None, driver=None, taxonomy: bool=False, entity_filter: bool=False,
+                 inherited_view: bool=False, config: DriverConfig=None, namespace: str=None, create_indexes: bool=True):
+        super().__init__()
+        if config is None:
+            config = DriverConfig.from_env()
+        self.config = replace(config, **{name: value for name, value in (("uri", uri), ("user", user), ("password", password)) if value is not None})
+        self.driver = driver if driver is not None else self.config.driver()
+        self.namespace = namespace if namespace is not None else os.environ.get("SN_NAMESPACE", DEFAULT_NAMESPACE)
+        if create_indexes:
+            self._create_indexes()
+
+        self.taxonomy = None
+        if taxonomy:
+            from sn.taxonomy import Taxonomy
+
+            self.taxonomy = Taxonomy.load(self)
+            self.add_listener(self.taxonomy.apply)
+
+        self.entity_filter = None
+        if entity_filter:
+            from sn.entity_filter import EntityFilter
+
+            self.entity_filter = EntityFilter.load(self)
+            self.add_listener(self.entity_filter.apply)
+
+        self.inherited_view = None
+        if inherited_view:
+            from sn.inherited_view import InheritedView
+
+            self.inherited_view = InheritedView(self, self.taxonomy)
+            self.add_listener(self.inherited_view.apply)
 
     def close(self):
+        super().close()
         self.driver.close()
+
+    def _session(self, **settings):
+        return self.driver.session(**{"database": self.config.database, "fetch_size": self.config.fetch_size, **settings})
+
+    def warm_up(self, connections: int=None):
+        """Open `connections` pooled connections (by default, the pool's size or 16 at most), and run the templates of
+        the queries used to answer questions once, so that their plans are cached by the server and the first questions
+        don't pay for connection setup, routing discovery and query planning."""
+
+        if connections is None:
+            connections = min(16, self.config.max_connection_pool_size)
+        self.driver.verify_connectivity()
+
+        # Transactions hold their connection until closed, so the pool ends up with one per session
+        sessions, transactions = [], []
+        try:
+            for _ in range(connections):
+                session = self._session()
+                sessions.append(session)
+                transactions.append(session.begin_transaction())
+                transactions[-1].run("RETURN 1").consume()
+        finally:
+            for transaction in transactions:
+                transaction.close()
+            for session in sessions:
+                session.close()
+
+        # The entity filter would answer these queries without running them
+        entity_filter, self.entity_filter = self.entity_filter, None
+        try:
+            # Entity names which aren't used, as they only need to be planned
+            ent, relation = "", ""
+            self.query_inheritance_relation(ent, relation)
+            self.query_inheritance_relation_page(ent, relation)
+            self.query_descendants_relation(ent, relation)
+            self.query_local(ent)
+            for rel_type in RelType:
+                self.query_local_relation(ent, relation, rel_type)
+            for query in [Relation(ent, None, ent, None, relation, None), Relation(ent, EntityType.INSTANCE, ent, EntityType.TYPE, relation, RelType.OTHER)]:
+                self.assert_relation(query)
+                self.assert_relation_inheritance(query)
+                self.query_declarators(query)
+            self.count_entities()
+        finally:
+            self.entity_filter = entity_filter
+
+    def stats(self) -> dict:
+        """Same as `KnowledgeBaseCommon.stats`, along with the lookups, negative lookups and false positive rate
+        of the entity filter in `"entity_filter"`, and the hits and misses of the inherited view in `"inherited_view"`, if enabled."""
+
+        stats = super().stats()
+        if self.entity_filter is not None:
+            stats["entity_filter"] = self.entity_filter.stats()
+        if self.inherited_view is not None:
+            stats["inherited_view"] = self.inherited_view.stats()
+        return stats
+
+    def _unknown(self, ent: str) -> bool:
+        """Whether `ent` certainly isn't the name of an entity, according to the entity filter."""
+
+        return self.entity_filter is not None and not self.entity_filter.might_contain(ent)
     
     # ------------------------ Query Methods --------------------------
     # Methods for interacting with the knowledge base. Any value passed to the `tx` argument is ignored.
@@ -103,34 +534,147 @@ class KnowledgeBase:
         If the declaration of the inverse relation already exists, then it is replaced by the new declaration.
         """
 
-        if relation.ent1_type is None or relation.ent2_type is None or relation.type_ is None:
-            raise ValueError("Relation and entity types shold not be None.")
-        
-        if relation.type_ == RelType.INHERITS and relation.ent2_type != EntityType.TYPE:
-            raise ValueError("Can only inherit from types entities.")
-        
-        if relation.type_ == RelType.INHERITS and relation.not_:
-            raise ValueError("'Inherits' relations can't be negated.")
+        KnowledgeBase._validate_declaration(relation)
 
         # If the inverse relation already exists, then remove it first to avoid conflicting declarations
         inverse_relation = relation.inverse()
+        replaced_inverse = False
         if KnowledgeBase._tx_assert_relation_exists(inverse_relation, tx):
-            tx.run(f"MATCH (:{inverse_relation.ent1_type.value} {{name: $ent1}})-[r:{inverse_relation.type_.value} {{declarator: $declarator, name: $relation, not: $not_}}]->(:{inverse_relation.ent2_type.value} {{name: $ent2}})" 
-                   "DELETE r", ent1=inverse_relation.ent1, declarator=declarator, relation=inverse_relation.name, not_=inverse_relation.not_, ent2=inverse_relation.ent2)
+            result = tx.run(f"MATCH (:{inverse_relation.ent1_type.value} {{ns: $ns, key: $ent1}})-[r:{inverse_relation.type_.value} {{declarator: $declarator, name: $relation, not: $not_}}]->(:{inverse_relation.ent2_type.value} {{ns: $ns, key: $ent2}})" 
+                            "DELETE r RETURN count(r)", ent1=canonical_key(inverse_relation.ent1), declarator=declarator, relation=inverse_relation.name, not_=inverse_relation.not_, ent2=canonical_key(inverse_relation.ent2))
+            replaced_inverse = result.single()[0] > 0
 
-        result = tx.run(f"MERGE (e1:{relation.ent1_type.value} {{name: $ent1}}) "
-                        f"MERGE (e2:{relation.ent2_type.value} {{name: $ent2}}) "
-                        f"MERGE (e1)-[r:{relation.type_.value} {{declarator: $declarator, name: $relation, not: $not_}}]->(e2) "
-                        "RETURN e1.name", declarator=declarator, ent1=relation.ent1, ent2=relation.ent2, relation=relation.name, not_=relation.not_)
-        
+        result = tx.run(f"MERGE (e1:{relation.ent1_type.value} {{ns: $ns, key: $ent1_key}}) ON CREATE SET e1.name = $ent1 "
+                        f"MERGE (e2:{relation.ent2_type.value} {{ns: $ns, key: $ent2_key}}) ON CREATE SET e2.name = $ent2 "
+                        f"MERGE (e1)-[r:{relation.type_.value} {{declarator: $declarator, name: $relation, not: $not_}}]->(e2) ON CREATE SET r.uid = randomUUID() "
+                        "RETURN e1.name", declarator=declarator, ent1=relation.ent1, ent2=relation.ent2, relation=relation.name, not_=relation.not_,
+                        ent1_key=canonical_key(relation.ent1), ent2_key=canonical_key(relation.ent2))
+
+        tx.publish(Change(ADD, declarator, relation, replaced_inverse))
         return result.single()[0]
     
+    @sn_write
+    @staticmethod
+    def add_knowledge_batch(declarator: str, relations: Iterable[Relation], tx: ManagedTransaction=None) -> int:
+        """`declarator` states all `relations` in a single transaction, as if `add_knowledge` was called for each one in order. \n
+        Relations are grouped by their types, so that each group is written with a couple of statements regardless of its size.
+        Returns the number of declared relations.
+        """
+
+        # A later declaration of a relation replaces an earlier declaration of its inverse
+        declarations = {}
+        for relation in relations:
+            KnowledgeBase._validate_declaration(relation)
+            declarations[relation.inverse() if relation.not_ else relation] = relation
+
+        relations = list(declarations.values())
+        groups = {}
+        for i, relation in enumerate(relations):
+            groups.setdefault((relation.ent1_type, relation.ent2_type, relation.type_), []).append(
+                {"i": i, "ent1": relation.ent1, "ent2": relation.ent2, "ent1_key": canonical_key(relation.ent1), "ent2_key": canonical_key(relation.ent2),
+                 "relation": relation.name, "not_": relation.not_, "declarator": declarator})
+
+        replaced = set()
+        for (ent1_type, ent2_type, type_), rows in groups.items():
+            replaced.update(KnowledgeBase._tx_write_rows(ent1_type, ent2_type, type_, rows, tx))
+
+        if tx.changes is not None:
+            tx.changes.extend(Change(ADD, declarator, relation, i in replaced) for i, relation in enumerate(relations))
+
+        return len(declarations)
+
+    @sn_read
+    @staticmethod
+    def export_snapshot(path: str, tx: ManagedTransaction=None) -> int:
+        """Write every declaration of the knowledge base to a snapshot file at `path` (see `sn.snapshot`).
+        Returns the number of declarations."""
+
+        # Imported here, since snapshots build upon this module
+        from sn.snapshot import SnapshotBuilder
+
+        results = tx.run(_namespace_match("e1") + "MATCH (e1)-[r]->(e2) "
+                         "RETURN r.declarator, e1.name, labels(e1)[0], e2.name, labels(e2)[0], r.name, type(r), r.not")
+
+        builder = SnapshotBuilder()
+        for declarator, ent1, ent1_type, ent2, ent2_type, name, type_, not_ in results:
+            builder.add(declarator, Relation(ent1, EntityType(ent1_type), ent2, EntityType(ent2_type), name, RelType(type_), not_))
+
+        snapshot = builder.build()
+        snapshot.write(path)
+        return len(snapshot)
+
+    def import_snapshot(self, path: str, batch_size: int=10000) -> int:
+        """Declare every declaration of the snapshot at `path`, written by `export_snapshot`, with `batch_size`
+        declarations per transaction. As with `add_knowledge`, they replace the declarations of their inverses.
+        Returns the number of declarations."""
+
+        from sn.snapshot import Snapshot
+
+        with Snapshot.read(path) as snapshot:
+            groups = {}
+            for declarator, relation in snapshot.declarations():
+                key = (relation.ent1_type, relation.ent2_type, relation.type_)
+                declarations = groups.setdefault(key, [])
+                declarations.append((declarator, relation))
+                if len(declarations) >= batch_size:
+                    self._import_declarations(*key, declarations)
+                    groups[key] = []
+
+            for key, declarations in groups.items():
+                if len(declarations) > 0:
+                    self._import_declarations(*key, declarations)
+
+            return len(snapshot)
+
+    @sn_write
+    @staticmethod
+    def _import_declarations(ent1_type: EntityType, ent2_type: EntityType, type_: RelType, declarations: List[Tuple[str, Relation]], tx: ManagedTransaction=None):
+        rows = [{"i": i, "ent1": relation.ent1, "ent2": relation.ent2, "ent1_key": canonical_key(relation.ent1), "ent2_key": canonical_key(relation.ent2),
+                 "relation": relation.name, "not_": relation.not_, "declarator": declarator}
+                for i, (declarator, relation) in enumerate(declarations)]
+        replaced = KnowledgeBase._tx_write_rows(ent1_type, ent2_type, type_, rows, tx)
+
+        if tx.changes is not None:
+            tx.changes.extend(Change(ADD, declarator, relation, i in replaced) for i, (declarator, relation) in enumerate(declarations))
+
+    @staticmethod
+    def _tx_write_rows(ent1_type: EntityType, ent2_type: EntityType, type_: RelType, rows: List[dict], tx: ManagedTransaction) -> Set[int]:
+        """Declare rows of relations of the same types, replacing the declarations of their inverses.
+        Returns the indices (`row.i`) of the rows whose inverse declaration was replaced."""
+
+        results = tx.run("UNWIND $rows AS row "
+                         f"MATCH (:{ent1_type.value} {{ns: $ns, key: row.ent1_key}})-[r:{type_.value} {{declarator: row.declarator, name: row.relation, not: NOT row.not_}}]->(:{ent2_type.value} {{ns: $ns, key: row.ent2_key}}) "
+                         "DELETE r RETURN row.i", rows=rows)
+        replaced = {i for i, in results}
+        tx.run("UNWIND $rows AS row "
+               f"MERGE (e1:{ent1_type.value} {{ns: $ns, key: row.ent1_key}}) ON CREATE SET e1.name = row.ent1 "
+               f"MERGE (e2:{ent2_type.value} {{ns: $ns, key: row.ent2_key}}) ON CREATE SET e2.name = row.ent2 "
+               f"MERGE (e1)-[r:{type_.value} {{declarator: row.declarator, name: row.relation, not: row.not_}}]->(e2) ON CREATE SET r.uid = randomUUID()", rows=rows)
+        return replaced
+
+    @sn_write
+    @staticmethod
+    def _create_indexes(tx: ManagedTransaction=None):
+        """Make entity keys unique within each namespace, which indexes them so that MERGEs and lookups don't scan every node,
+        and concurrent MERGEs don't create duplicates. Index entities by namespace, so that deletes don't scan the other
+        namespaces, and relations by declarator, so that purges don't scan every relation, and then by id, so that pages of
+        declarations are read in index order."""
+
+        for entity_type in EntityType:
+            # Keys were unique across the whole database before namespaces existed
+            tx.run(f"DROP CONSTRAINT {entity_type.value.lower()}_key IF EXISTS")
+            tx.run(f"CREATE CONSTRAINT {entity_type.value.lower()}_namespace_key IF NOT EXISTS FOR (e:{entity_type.value}) REQUIRE (e.ns, e.key) IS UNIQUE")
+            tx.run(f"CREATE INDEX {entity_type.value.lower()}_namespace IF NOT EXISTS FOR (e:{entity_type.value}) ON (e.ns)")
+        for rel_type in RelType:
+            tx.run(f"CREATE INDEX {rel_type.value.lower()}_declarator IF NOT EXISTS FOR ()-[r:{rel_type.value}]-() ON (r.declarator)")
+            tx.run(f"CREATE INDEX {rel_type.value.lower()}_declarator_uid IF NOT EXISTS FOR ()-[r:{rel_type.value}]-() ON (r.declarator, r.uid)")
+
     @sn_read
     @staticmethod
     def query_declarations(declarator: str, tx: ManagedTransaction=None) -> Set[Relation]:
         """Query a declarator to obtain the set of all declarations made by it."""
 
-        results = tx.run("MATCH (e1)-[r {declarator: $declarator}]->(e2) "
+        results = tx.run(_namespace_match("e1") + "MATCH (e1)-[r {declarator: $declarator}]->(e2) "
                         "RETURN e1.name AS ent1, labels(e1)[0] AS ent1_type, type(r) AS relation_type, r.name AS relation, e2.name AS ent2, labels(e2)[0] AS ent2_type, r.not AS not", declarator=declarator)
         
         return {Relation(
@@ -139,10 +683,77 @@ class KnowledgeBase:
             ent2=result.value("ent2"),
             ent2_type=EntityType(result.value("ent2_type")),
             name=result.value("relation"),
-            type_=result.value("relation_type"),
+            type_=RelType(result.value("relation_type")),
             not_=result.value("not")
         ) for result in results}
 
+    def stream_declarations(self, declarator: str, fetch_size: int=1000) -> Iterator[Declaration]:
+        """Iterate over all declarations made by a declarator, as `Declaration` tuples, without holding them all in memory.
+        Records are fetched from the database `fetch_size` at a time, as they're iterated. \n
+        The declarations are read in a single auto-commit transaction, so the iterator should be consumed or closed promptly.
+        """
+
+        return self._stream("stream_declarations", fetch_size,
+                            _namespace_match("e1") + "MATCH (e1)-[r {declarator: $declarator}]->(e2) "
+                            "RETURN e1.name, labels(e1)[0], e2.name, labels(e2)[0], r.name, type(r), r.not", declarator=declarator)
+
+    def stream_entity_names(self, fetch_size: int=10000) -> Iterator[str]:
+        """Iterate over the names of all entities, fetching them `fetch_size` at a time. See `stream_declarations`."""
+
+        return (name for name, in self._stream("stream_entity_names", fetch_size, _namespace_match("e") + "RETURN e.name"))
+
+    def _stream(self, method: str, fetch_size: int, query: str, **parameters) -> Iterator[tuple]:
+        """Iterate over the records of an auto-commit query, recording the call in the metrics of `method`."""
+
+        rows = 0
+        error = True
+        start = time.perf_counter()
+        try:
+            with self._session(fetch_size=fetch_size) as session:
+                self.metrics.session_opened()
+                for record in session.run(query, ns=self.namespace, **parameters):
+                    rows += 1
+                    yield tuple(record)
+            error = False
+        except GeneratorExit:
+            # Closed before being consumed
+            error = False
+            raise
+        finally:
+            self.metrics.record(method, time.perf_counter() - start, rows, 1, 0, error)
+
+    @sn_read
+    @staticmethod
+    def count_entities(tx: ManagedTransaction=None) -> int:
+        """Number of entities in the knowledge base."""
+
+        return tx.run(_namespace_match("e") + "RETURN count(e)").single()[0]
+
+    @sn_read
+    @staticmethod
+    def query_declarations_page(declarator: str, after: Tuple[str, str]=None, limit: int=1000,
+                                tx: ManagedTransaction=None) -> Tuple[List[Declaration], Union[Tuple[str, str], None]]:
+        """Query a page of at most `limit` declarations made by a declarator, as `Declaration` tuples. \n
+        Pages are ordered by the type and id of each relation, so that paging resumes right after the previous page (`after`)
+        even if declarations are added or removed in the meantime. Each type is read in the order of its declarator and id
+        index, so each page is read in time proportional to its size. \n
+        Output: `(declarations, after)`, where `after` is the key to pass to query the next page, or `None` after the last page
+        """
+
+        rel_types = [rel_type.value for rel_type in RelType]
+        after_type, after_uid = after if after is not None else (rel_types[0], "")
+        page = []
+        for rel_type in rel_types[rel_types.index(after_type):]:
+            results = tx.run(f"MATCH (e1 {{ns: $ns}})-[r:{rel_type} {{declarator: $declarator}}]->(e2) WHERE r.uid > $after "
+                             "WITH e1, r, e2 ORDER BY r.uid LIMIT $limit "
+                             "RETURN r.uid, e1.name, labels(e1)[0], e2.name, labels(e2)[0], r.name, type(r), r.not",
+                             declarator=declarator, after=after_uid if rel_type == after_type else "", limit=limit - len(page))
+            page.extend(tuple(record) for record in results)
+            if len(page) == limit:
+                break
+
+        return [row[1:] for row in page], ((page[-1][6], page[-1][0]) if len(page) == limit else None)
+
     @sn_read
     @staticmethod
     def query_declarators(relation: Relation, tx: ManagedTransaction=None) -> Set[str]:
@@ -150,8 +761,8 @@ class KnowledgeBase:
 
         e1_label, e2_label, rel_type = KnowledgeBase._return_optional_labels(relation)
 
-        results = tx.run(f"MATCH (e1{e1_label} {{name: $ent1}})-[r{rel_type} {{name: $relation, not: $not_}}]->(e2{e2_label} {{name: $ent2}}) "
-                        "RETURN r.declarator AS declarator", ent1=relation.ent1, relation=relation.name, ent2=relation.ent2, not_=relation.not_)
+        results = tx.run(f"MATCH (e1{e1_label} {{ns: $ns, key: $ent1}})-[r{rel_type} {{name: $relation, not: $not_}}]->(e2{e2_label} {{ns: $ns, key: $ent2}}) "
+                        "RETURN r.declarator AS declarator", ent1=canonical_key(relation.ent1), relation=relation.name, ent2=canonical_key(relation.ent2), not_=relation.not_)
         
         return {result.value("declarator") for result in results}
 
@@ -162,8 +773,8 @@ class KnowledgeBase:
         Output: `{((relation_name, relation_type), {entity2, entity3}), (...)}`
         """
         
-        results = tx.run("MATCH (eIn {name: $entIn})-[r]->(eOut)"
-                        "RETURN r.name AS relation, type(r) AS relation_type, eOut.name AS other_entity", entIn=ent)
+        results = tx.run("MATCH (eIn {ns: $ns, key: $entIn})-[r]->(eOut) "
+                        "RETURN r.name AS relation, type(r) AS relation_type, eOut.name AS other_entity", entIn=canonical_key(ent))
 
         result_dict = {}
         for result in results:
@@ -183,41 +794,126 @@ class KnowledgeBase:
     def query_local_relation(ent:str, relation:str, relation_type:RelType, tx: ManagedTransaction=None) -> Set[str]:
         """Query an entity to obtain all target entities of a specific relation locally."""
         
-        results = tx.run(f"MATCH (e {{name: $ent}})-[r:{relation_type.value} {{name: $relation}}]->(e2) "
-                        "RETURN e2.name AS entity", ent=ent, relation=relation)
+        results = tx.run(f"MATCH (e {{ns: $ns, key: $ent}})-[r:{relation_type.value} {{name: $relation}}]->(e2) "
+                        "RETURN e2.name AS entity", ent=canonical_key(ent), relation=relation)
         
         return {result.value("entity") for result in results}
 
-    @sn_read
-    @staticmethod
-    def query_inheritance_relation(ent: str, relation: str, declarator: str=None, tx: ManagedTransaction=None) ->  Dict[str, Tuple[Set[Tuple[str, bool]], int]]:
+    def query_inheritance_relation(self, ent: str, relation: str, declarator: str=None) ->  Dict[str, Tuple[Set[Tuple[str, bool]], int]]:
         """Query the specified attribute of an entity as well as attributes inherited from INHERITS relations. \n
         A declarator can be optionally provided to only consider relations declared by it (doesn't filter INHERITS relations). \n
         The output is a dictionary with each entity as the key, and the characteristics, truth values and inheritance length as the values."""
-        
+
+        if self._unknown(ent):
+            return {}
+        if self.inherited_view is not None:
+            return self._ranked_answers(self.inherited_view.ranked(ent, relation, declarator))
+        if self.taxonomy is None:
+            return self._query_inheritance_relation(ent, relation, declarator)
+
+        distances = self._ancestor_distances(ent)
+        characteristics = {}
+        for subject_key, subject, _, characteristic, _, negated in self._query_relations_of(list(distances), relation, declarator):
+            characteristics.setdefault((subject_key, subject), set()).add((characteristic, not negated))
+
+        return {subject: (frozenset(values), distances[subject_key]) for (subject_key, subject), values in characteristics.items()}
+
+    def _ancestor_distances(self, ent: str, type_: EntityType=None) -> Dict[str, int]:
+        """Keys of the entities named `ent` and their ancestors in the taxonomy, along with their inheritance length."""
+
+        return {**{canonical_key(name): distance for name, distance in self.taxonomy.ancestors(ent, type_).items()}, canonical_key(ent): 0}
+
+    @sn_read
+    @staticmethod
+    def _query_inheritance_relation(ent: str, relation: str, declarator: str=None, tx: ManagedTransaction=None) ->  Dict[str, Tuple[Set[Tuple[str, bool]], int]]:
         declarator_filter = f", declarator: '{declarator}'" if declarator is not None else ""
 
         results = tx.run(
-            f"MATCH (ent1 {{name:$ent}}) "
+            f"MATCH (ent1 {{ns: $ns, key:$ent}}) "
             f"MATCH (ent1)-[r {{name:$relation {declarator_filter}}}]->(ent2) "
             "RETURN ent1.name AS subject, collect(ent2.name) AS characteristics, collect(r.not) AS nots, 0 AS distance "
             "UNION "
-            f"MATCH p = (ent1 {{name:$ent}})-[:{RelType.INHERITS.value} *1..]->(ascn) "
+            f"MATCH p = (ent1 {{ns: $ns, key:$ent}})-[:{RelType.INHERITS.value} *1..]->(ascn) "
             f"MATCH (ascn)-[r {{name:$relation {declarator_filter}}}]->(ent2) "
-            "RETURN ascn.name AS subject, collect(ent2.name) AS characteristics, collect(r.not) AS nots, length(p) AS distance", ent=ent, relation=relation
+            "RETURN ascn.name AS subject, collect(ent2.name) AS characteristics, collect(r.not) AS nots, length(p) AS distance", ent=canonical_key(ent), relation=relation
         )
         
         return {result.value('subject'):(frozenset(zip(result.value('characteristics'), [not n for n in result.value('nots')])), result.value('distance')) for result in results}
 
+    def query_inheritance_relation_page(self, ent: str, relation: str, after: int=None, limit: int=10,
+                                        declarator: str=None) -> Tuple[Dict[str, Tuple[Set[Tuple[str, bool]], int]], Union[int, None]]:
+        """Query the best `limit` answers of `query_inheritance_relation`, ranked by inheritance length and then by the
+        number of declarators of each answer, so that entities with many ancestors or characteristics are answered in bounded time. 
+
+        Output: `(answers, after)`, with the answers in the format of `query_inheritance_relation`, and `after` being
+        the value to pass to query the next answers, or `None` after the last ones. Since `after` is the number of answers
+        already returned, declarations made in the meantime may shift the following pages.
+        """
+
+        if self._unknown(ent):
+            return {}, None
+
+        skip = after if after is not None else 0
+        if self.inherited_view is not None:
+            rows = self.inherited_view.ranked(ent, relation, declarator)[skip:skip + limit + 1]
+        else:
+            rows = self.query_ranked_inheritance_relation(ent, relation, declarator, skip, limit + 1)
+
+        return self._ranked_answers(rows[:limit]), skip + limit if len(rows) > limit else None
+
+    def query_ranked_inheritance_relation(self, ent: str, relation: str, declarator: str=None, skip: int=0,
+                                          limit: int=None) -> List[Tuple[str, str, bool, int]]:
+        """Query the answers of `query_inheritance_relation_page` from the database, as `(subject, characteristic, not, distance)`
+        rows in rank order, skipping the first `skip` ones and returning at most `limit` (all, if `None`)."""
+
+        if self.taxonomy is None:
+            return self._query_ranked_relation(ent, relation, declarator, skip, limit)
+        return self._query_ranked_relations_of(self._ancestor_distances(ent), relation, declarator, skip, limit)
+
     @sn_read
     @staticmethod
-    def query_descendants_relation(ent: str, relation: str, relation_type: RelType=None, not_: bool=False, tx: ManagedTransaction=None) -> Set[str]:
+    def _query_ranked_relation(ent: str, relation: str, declarator: str, skip: int, limit: int, tx: ManagedTransaction=None) -> List[Tuple[str, str, bool, int]]:
+        results = tx.run("CALL { "
+                         "MATCH (e1 {ns: $ns, key: $ent}) RETURN e1, 0 AS distance "
+                         "UNION "
+                         f"MATCH p = ({{ns: $ns, key: $ent}})-[:{RelType.INHERITS.value} *1..]->(e1) RETURN e1, length(p) AS distance "
+                         "} "
+                         "WITH e1, min(distance) AS distance " + _ranked_relations(limit is not None),
+                         ent=canonical_key(ent), relation=relation, declarator=declarator, skip=skip, limit=limit)
+
+        return [tuple(record) for record in results]
+
+    @sn_read
+    @staticmethod
+    def _query_ranked_relations_of(distances: Dict[str, int], relation: str, declarator: str, skip: int, limit: int,
+                                   tx: ManagedTransaction=None) -> List[Tuple[str, str, bool, int]]:
+        results = tx.run(_namespace_match("e1", "e1.key IN $keys") +
+                         "WITH e1, $distances[e1.key] AS distance " + _ranked_relations(limit is not None),
+                         keys=list(distances), distances=distances, relation=relation, declarator=declarator, skip=skip, limit=limit)
+
+        return [tuple(record) for record in results]
+
+    def query_descendants_relation(self, ent: str, relation: str, relation_type: RelType=None, not_: bool=False) -> Set[str]:
         """Query the specified relation of an entity's descendants, obtaining all target entities. Relation type is optional."""
 
+        if self._unknown(ent):
+            return set()
+        if self.taxonomy is None:
+            return self._query_descendants_relation(ent, relation, relation_type, not_)
+
+        descendants = self.taxonomy.descendants(ent)
+        if len(descendants) == 0:
+            return set()
+        return {characteristic for _, _, _, characteristic, type_, negated in self._query_relations_of([canonical_key(name) for name in descendants], relation)
+                if negated == not_ and (relation_type is None or type_ == relation_type.value)}
+
+    @sn_read
+    @staticmethod
+    def _query_descendants_relation(ent: str, relation: str, relation_type: RelType=None, not_: bool=False, tx: ManagedTransaction=None) -> Set[str]:
         rel_label = f':{relation_type.value}' if relation_type is not None else ''
 
-        results = tx.run(f"MATCH (eOut)<-[{rel_label} {{name: $relation, not: $not_}}]-(desc)-[r:{RelType.INHERITS.value} *1..]->(eIn {{name: $entIn}}) "
-                        "RETURN eOut.name AS other_entity", relation=relation, entIn=ent, not_=not_)
+        results = tx.run(f"MATCH (eOut)<-[{rel_label} {{name: $relation, not: $not_}}]-(desc)-[r:{RelType.INHERITS.value} *1..]->(eIn {{ns: $ns, key: $entIn}}) "
+                        "RETURN eOut.name AS other_entity", relation=relation, entIn=canonical_key(ent), not_=not_)
 
         return {result.value("other_entity") for result in results}
 
@@ -229,53 +925,236 @@ class KnowledgeBase:
         """
         return KnowledgeBase._tx_assert_relation_exists(relation, tx, declarator)
 
-    @sn_read
-    @staticmethod
-    def assert_relation_inheritance(relation: Relation, declarator: str=None, tx: ManagedTransaction=None) -> Set[Tuple[str, int]]:
+    def assert_relation_inheritance(self, relation: Relation, declarator: str=None) -> Set[Tuple[str, int]]:
         """Assert whether or not `relation` exists in the knowledge base, with inheritance. Types are optional. \n
         A declarator can be optionally provided to only consider relations declared by it (doesn't filter INHERITS relations). \n
         The output is the set of parent entities on which the relation exists and how long the inheritance chain is.
         """
 
+        if self._unknown(relation.ent1) or self._unknown(relation.ent2):
+            return set()
+        if self.taxonomy is None:
+            return self._assert_relation_inheritance(relation, declarator)
+
+        key1, key2 = canonical_key(relation.ent1), canonical_key(relation.ent2)
+        ancestors = {canonical_key(name): distance for name, distance in self.taxonomy.ancestors(relation.ent1, relation.ent1_type).items()}
+        output = set()
+        for subject_key, subject, subject_type, characteristic, type_, negated in self._query_relations_of([key1, *ancestors], relation.name, declarator):
+            if canonical_key(characteristic) != key2 or negated != relation.not_:
+                continue
+            # The entity and relation types only apply to the entity's own relations
+            if (subject_key == key1 and (relation.ent1_type is None or subject_type == relation.ent1_type.value)
+                    and (relation.type_ is None or type_ == relation.type_.value)):
+                output.add((subject, 0))
+            if subject_key in ancestors:
+                output.add((subject, ancestors[subject_key]))
+        return output
+
+    @sn_read
+    @staticmethod
+    def _assert_relation_inheritance(relation: Relation, declarator: str=None, tx: ManagedTransaction=None) -> Set[Tuple[str, int]]:
         e1_label, e2_label, rel_label = KnowledgeBase._return_optional_labels(relation)
         declarator_filter = f", declarator: '{declarator}'" if declarator is not None else ""
 
         results = tx.run(
-            f"MATCH (ent1{e1_label} {{name:$ent1}})-[r{rel_label} {{name:$relation, not: $not_ {declarator_filter}}}]->(ent2{e2_label} {{name: $ent2}}) "
+            f"MATCH (ent1{e1_label} {{ns: $ns, key:$ent1}})-[r{rel_label} {{name:$relation, not: $not_ {declarator_filter}}}]->(ent2{e2_label} {{ns: $ns, key: $ent2}}) "
             "RETURN ent1.name AS subject, 0 AS distance "
             "UNION "
-            f"MATCH p = (ent1{e1_label} {{name:$ent1}})-[:{RelType.INHERITS.value} *1..]->(ascn) "
-            f"MATCH (ascn)-[r {{name:$relation, not: $not_ {declarator_filter}}}]->(ent2{e2_label} {{name: $ent2}}) "
-            "RETURN ascn.name AS subject, length(p) AS distance", ent1=relation.ent1, ent2=relation.ent2, relation=relation.name, not_=relation.not_
+            f"MATCH p = (ent1{e1_label} {{ns: $ns, key:$ent1}})-[:{RelType.INHERITS.value} *1..]->(ascn) "
+            f"MATCH (ascn)-[r {{name:$relation, not: $not_ {declarator_filter}}}]->(ent2{e2_label} {{ns: $ns, key: $ent2}}) "
+            "RETURN ascn.name AS subject, length(p) AS distance", ent1=canonical_key(relation.ent1), ent2=canonical_key(relation.ent2), relation=relation.name, not_=relation.not_
         )
 
         return {(result.value("subject"), result.value("distance")) for result in results}
 
+    @sn_read
+    @staticmethod
+    def _query_relations_of(keys: List[str], relation: str, declarator: str=None, tx: ManagedTransaction=None) -> List[Tuple[str, str, str, str, str, bool]]:
+        """Relations named `relation` of the entities with the keys `keys`, looked up in the key indexes. \n
+        Output: `[(subject_key, subject, subject_type, characteristic, relation_type, not), ...]`
+        """
+
+        results = tx.run(_namespace_match("e1", "e1.key IN $keys") +
+                         "MATCH (e1)-[r {name: $relation}]->(e2) WHERE $declarator IS NULL OR r.declarator = $declarator "
+                         "RETURN e1.key, e1.name, labels(e1)[0], e2.name, type(r), r.not", keys=keys, relation=relation, declarator=declarator)
+
+        return [tuple(record) for record in results]
+
+    @sn_read
+    @staticmethod
+    def query_inheritance_relations(tx: ManagedTransaction=None) -> List[Tuple[str, str, str, str]]:
+        """Query all INHERITS relations, to copy the taxonomy. \n
+        Output: `[(ent1, ent1_type, ent2, declarator), ...]`
+        """
+
+        results = tx.run(_namespace_match("e1") + f"MATCH (e1)-[r:{RelType.INHERITS.value}]->(e2) RETURN e1.name, labels(e1)[0], e2.name, r.declarator")
+
+        return [tuple(record) for record in results]
+
     @sn_read
     @staticmethod
     def get_all_declarators(tx: ManagedTransaction=None) -> Set[str]:
         """Get all unique declarators of knowledge."""
 
-        results = tx.run(f"MATCH ()-[r]->() RETURN DISTINCT r.declarator AS declarator")
+        results = tx.run(_namespace_match("e") + "MATCH (e)-[r]->() RETURN DISTINCT r.declarator AS declarator")
 
         return {result.value("declarator") for result in results}
 
+    def migrate_keys(self, batch_size: int=1000) -> int:
+        while self._namespace_entities(batch_size) == batch_size:
+            pass
+        while self._identify_relations(batch_size) == batch_size:
+            pass
+        return super().migrate_keys(batch_size)
+
+    migrate_keys.__doc__ = KnowledgeBaseCommon.migrate_keys.__doc__ + """ \n
+        Entities written before namespaces existed are moved to this knowledge base's namespace first, and relations
+        written before relations had ids are given one, so that they're paged by `query_declarations_page`."""
+
+    @sn_write
+    @staticmethod
+    def _namespace_entities(batch_size: int, tx: ManagedTransaction=None) -> int:
+        """Tag up to `batch_size` entities without a namespace with this knowledge base's namespace."""
+
+        result = tx.run("MATCH (e) WHERE e.ns IS NULL WITH e LIMIT $batch_size SET e.ns = $ns RETURN count(e)", batch_size=batch_size)
+        return result.single()[0]
+
+    @sn_write
+    @staticmethod
+    def _identify_relations(batch_size: int, tx: ManagedTransaction=None) -> int:
+        """Set an id on up to `batch_size` relations that have none."""
+
+        identified = 0
+        for rel_type in RelType:
+            result = tx.run(f"MATCH ()-[r:{rel_type.value}]->() WHERE r.uid IS NULL WITH r LIMIT $batch_size SET r.uid = randomUUID() RETURN count(r)",
+                            batch_size=batch_size - identified)
+            identified += result.single()[0]
+            if identified == batch_size:
+                break
+        return identified
+
+    @sn_write
+    @staticmethod
+    def _key_entities(batch_size: int, tx: ManagedTransaction=None) -> Tuple[int, int]:
+        """Key up to `batch_size` entities without a key, merging them into the entities which already have it.
+        Returns the number of entities processed and merged."""
+
+        rows = [tuple(record) for record in tx.run(_namespace_match("e", "e.key IS NULL") + "RETURN elementId(e), labels(e)[0], e.name LIMIT $batch_size",
+                                                   batch_size=batch_size)]
+
+        # The first entity of each key and type in the batch keeps its name, unless another entity already has the key
+        keepers: Dict[Tuple[str, str], str] = {}
+        for entity_type in EntityType:
+            keys = list({canonical_key(name) for _, label, name in rows if label == entity_type.value})
+            results = tx.run(f"UNWIND $keys AS key MATCH (e:{entity_type.value} {{ns: $ns, key: key}}) RETURN key, elementId(e)", keys=keys)
+            keepers.update(((key, entity_type.value), id_) for key, id_ in results)
+
+        keyed, merges = [], []
+        for id_, label, name in rows:
+            keeper = keepers.setdefault((canonical_key(name), label), id_)
+            if keeper == id_:
+                keyed.append({"id": id_, "key": canonical_key(name)})
+            else:
+                merges.append({"duplicate": id_, "keeper": keeper})
+
+        tx.run("UNWIND $keyed AS row MATCH (e) WHERE elementId(e) = row.id SET e.key = row.key", keyed=keyed)
+        if len(merges) > 0:
+            KnowledgeBase._tx_merge_entities(merges, tx)
+        return len(rows), len(merges)
+
+    @sn_write
+    @staticmethod
+    def _rekey_entities(entity_type: EntityType, after: str, batch_size: int, tx: ManagedTransaction=None) -> Tuple[Union[str, None], int]:
+        """Set the canonical key of up to `batch_size` entities of `entity_type` whose key comes after `after`, merging
+        them into the entities which already have it. Returns the key to pass to process the next entities, or `None`
+        after the last ones, and the number of merged entities."""
+
+        rows = [tuple(record) for record in tx.run(f"MATCH (e:{entity_type.value} {{ns: $ns}}) WHERE e.key > $after "
+                                                   "RETURN elementId(e), e.key, e.name ORDER BY e.key LIMIT $batch_size",
+                                                   after=after, batch_size=batch_size)]
+        stale = [(id_, canonical_key(name)) for id_, key, name in rows if canonical_key(name) != key]
+
+        merges = []
+        if len(stale) > 0:
+            results = tx.run(f"UNWIND $keys AS key MATCH (e:{entity_type.value} {{ns: $ns, key: key}}) RETURN key, elementId(e)",
+                             keys=list({key for _, key in stale}))
+            keepers = {key: id_ for key, id_ in results}
+
+            keyed = []
+            for id_, key in stale:
+                keeper = keepers.setdefault(key, id_)
+                if keeper == id_:
+                    keyed.append({"id": id_, "key": key})
+                else:
+                    merges.append({"duplicate": id_, "keeper": keeper})
+
+            tx.run("UNWIND $keyed AS row MATCH (e) WHERE elementId(e) = row.id SET e.key = row.key", keyed=keyed)
+            if len(merges) > 0:
+                KnowledgeBase._tx_merge_entities(merges, tx)
+
+        return (rows[-1][1] if len(rows) == batch_size else None), len(merges)
+
+    @staticmethod
+    def _tx_merge_entities(merges: List[dict], tx: ManagedTransaction):
+        """Move the relations of each `merge["duplicate"]` entity to `merge["keeper"]`, and delete the duplicates.
+        Relations which the keeper already has are deleted instead."""
+
+        for rel_type in RelType:
+            tx.run("UNWIND $merges AS m "
+                   "MATCH (d) WHERE elementId(d) = m.duplicate MATCH (k) WHERE elementId(k) = m.keeper "
+                   f"CALL {{ WITH d, k MATCH (d)-[r:{rel_type.value}]->(other) "
+                   f"MERGE (k)-[m:{rel_type.value} {{declarator: r.declarator, name: r.name, not: r.not}}]->(other) ON CREATE SET m.uid = r.uid DELETE r }} "
+                   f"CALL {{ WITH d, k MATCH (other)-[r:{rel_type.value}]->(d) "
+                   f"MERGE (other)-[m:{rel_type.value} {{declarator: r.declarator, name: r.name, not: r.not}}]->(k) ON CREATE SET m.uid = r.uid DELETE r }}",
+                   merges=merges)
+        tx.run("UNWIND $merges AS m MATCH (d) WHERE elementId(d) = m.duplicate DETACH DELETE d", merges=merges)
+
+    @sn_write
+    @staticmethod
+    def _delete_relations(batch_size: int, tx: ManagedTransaction=None) -> int:
+        result = tx.run(_namespace_match("e") + "MATCH (e)-[r]->() WITH r LIMIT $batch_size DELETE r RETURN count(r)", batch_size=batch_size)
+        return result.single()[0]
+
+    @sn_write
+    @staticmethod
+    def _purge_relations(declarator: str, batch_size: int, tx: ManagedTransaction=None) -> int:
+        # Relations are matched by type, so that the declarator indexes are used
+        deleted = 0
+        for rel_type in RelType:
+            result = tx.run(f"MATCH ({{ns: $ns}})-[r:{rel_type.value} {{declarator: $declarator}}]->() WITH r LIMIT $batch_size DELETE r RETURN count(r)",
+                            declarator=declarator, batch_size=batch_size - deleted)
+            deleted += result.single()[0]
+            if deleted == batch_size:
+                break
+        return deleted
+
     @sn_write
     @staticmethod
-    def delete_all(tx: ManagedTransaction=None):
-        """Clean the knowledge base."""
+    def _delete_orphans(batch_size: int, tx: ManagedTransaction=None) -> int:
+        """Delete entities without relations, which are left behind by deleted relations."""
 
-        result = tx.run("MATCH (a) -[r]-> () DELETE a, r")
-        result = tx.run("MATCH (a) DELETE a")
-        return result.single()
+        result = tx.run(_namespace_match("a", "NOT (a)--()") + "WITH a LIMIT $batch_size DELETE a RETURN count(a)", batch_size=batch_size)
+        return result.single()[0]
     
     @staticmethod
     def _tx_assert_relation_exists(relation: Relation, tx: ManagedTransaction, declarator: str=None) -> bool:
         e1_label, e2_label, rel_label = KnowledgeBase._return_optional_labels(relation)
         declarator_filter = f", declarator: '{declarator}'" if declarator is not None else ""
-        results = tx.run(f"RETURN exists(({e1_label} {{name: $ent1}})-[{rel_label} {{name: $relation, not: $not_ {declarator_filter}}}]->({e2_label} {{name: $ent2}})) AS relation_exists", ent1=relation.ent1, relation=relation.name, not_=relation.not_, ent2=relation.ent2)
+        results = tx.run(f"RETURN exists(({e1_label} {{ns: $ns, key: $ent1}})-[{rel_label} {{name: $relation, not: $not_ {declarator_filter}}}]->({e2_label} {{ns: $ns, key: $ent2}})) AS relation_exists",
+                         ent1=canonical_key(relation.ent1), relation=relation.name, not_=relation.not_, ent2=canonical_key(relation.ent2))
         return results.single().value("relation_exists")
 
+    @staticmethod
+    def _validate_declaration(relation: Relation):
+        if relation.ent1_type is None or relation.ent2_type is None or relation.type_ is None:
+            raise ValueError("Relation and entity types shold not be None.")
+        
+        if relation.type_ == RelType.INHERITS and relation.ent2_type != EntityType.TYPE:
+            raise ValueError("Can only inherit from types entities.")
+        
+        if relation.type_ == RelType.INHERITS and relation.not_:
+            raise ValueError("'Inherits' relations can't be negated.")
+
     @staticmethod
     def _return_optional_labels(relation: Relation) -> Tuple[str, str, str]:
         e1_label = f':{relation.ent1_type.value}' if relation.ent1_type is not None else ''
@@ -286,7 +1165,7 @@ class KnowledgeBase:
 
 
 if __name__ == "__main__":
-    kb = KnowledgeBase("bolt://localhost:7687", "neo4j", "Sussy_baka123321") # Security just sent a hug :)
+    kb = KnowledgeBase() # Connection settings are read from the NEO4J_* environment variables
     kb.delete_all() # Clear all data, to have a clean testing sandbox
     
     kb.add_knowledge("Lucius", Relation("Diogo", EntityType.INSTANCE, "cringe", EntityType.TYPE, "is", RelType.OTHER))
@@ -0,0 +1,149 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Histogram of observations over fixed buckets. The last bucket holds observations above every bound."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """Cumulative counts of each bucket, as `(upper_bound, count)` pairs ending with `(inf, count)`."""
+
+        output = []
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            output.append((bound, total))
+        return output
+
+
+class MethodMetrics:
+    __slots__ = ("calls", "errors", "rows", "statements", "retries", "latency")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.statements = 0
+        self.retries = 0
+        self.latency = Histogram()
+
+
+class KnowledgeBaseMetrics:
+    """Metrics of the calls to a knowledge base's methods, collected by the `sn_read` and `sn_write` decorators.
+
+    For each method, the number of calls, failed calls, records returned by the database, statements run,
+    transaction retries and a latency histogram are kept. The number of sessions opened is kept as well.
+    Records and statements only count the last attempt of a call, not the attempts retried by the driver.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods: Dict[str, MethodMetrics] = {}
+        self._sessions = 0
+
+    def session_opened(self):
+        with self._lock:
+            self._sessions += 1
+
+    def record(self, method: str, elapsed: float, rows: int, statements: int, retries: int, error: bool=False):
+        with self._lock:
+            metrics = self._methods.get(method)
+            if metrics is None:
+                metrics = self._methods[method] = MethodMetrics()
+            metrics.calls += 1
+            metrics.errors += error
+            metrics.rows += rows
+            metrics.statements += statements
+            metrics.retries += retries
+            metrics.latency.observe(elapsed)
+
+    def reset(self):
+        with self._lock:
+            self._methods = {}
+            self._sessions = 0
+
+    def snapshot(self) -> dict:
+        """Copy of the current metrics. \n
+        Output: `{"sessions": ..., "methods": {method: {"calls": ..., "errors": ..., "rows": ..., "statements": ..., "retries": ...,
+        "latency_sum_s": ..., "latency_buckets": [(upper_bound_s, cumulative_count), ...]}}}`
+        """
+
+        with self._lock:
+            return {
+                "sessions": self._sessions,
+                "methods": {method: {
+                    "calls": metrics.calls,
+                    "errors": metrics.errors,
+                    "rows": metrics.rows,
+                    "statements": metrics.statements,
+                    "retries": metrics.retries,
+                    "latency_sum_s": metrics.latency.sum,
+                    "latency_buckets": metrics.latency.cumulative(),
+                } for method, metrics in self._methods.items()},
+            }
+
+    def prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+
+        snapshot = self.snapshot()
+        lines = [
+            "# TYPE sn_kb_sessions_total counter",
+            f"sn_kb_sessions_total {snapshot['sessions']}",
+        ]
+
+        for name, key in [("calls", "calls"), ("errors", "errors"), ("rows", "rows"), ("statements", "statements"), ("retries", "retries")]:
+            lines.append(f"# TYPE sn_kb_{name}_total counter")
+            lines.extend(f'sn_kb_{name}_total{{method="{method}"}} {metrics[key]}' for method, metrics in snapshot["methods"].items())
+
+        lines.append("# TYPE sn_kb_latency_seconds histogram")
+        for method, metrics in snapshot["methods"].items():
+            for bound, count in metrics["latency_buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'sn_kb_latency_seconds_bucket{{method="{method}",le="{le}"}} {count}')
+            lines.append(f'sn_kb_latency_seconds_sum{{method="{method}"}} {metrics["latency_sum_s"]}')
+            lines.append(f'sn_kb_latency_seconds_count{{method="{method}"}} {metrics["calls"]}')
+
+        return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(metrics: KnowledgeBaseMetrics, host: str="localhost", port: int=9464) -> ThreadingHTTPServer:
+    """Expose `metrics` in the Prometheus text format at `http://host:port/metrics`, from a daemon thread.
+    Call `shutdown` on the returned server to stop it."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="sn-metrics", daemon=True).start()
+    return server
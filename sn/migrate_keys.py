@@ -0,0 +1,27 @@
+import argparse
+
+from sn.kb import KnowledgeBase
+from sn.sqlite_kb import SQLiteKnowledgeBase
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Set the canonical key of the entities written before keys existed, "
+                                                 "merging the entities whose names only differ in case, whitespace or number.")
+    parser.add_argument("--sqlite", default=None, metavar="PATH", help="migrate this SQLite database instead of the Neo4j one")
+    parser.add_argument("--batch-size", type=int, default=1000, help="entities per transaction")
+    parser.add_argument("--uri", default=None, help="defaults to NEO4J_URI, or bolt://localhost:7687")
+    parser.add_argument("--db-user", default=None, help="defaults to NEO4J_USER, or neo4j")
+    parser.add_argument("--db-password", default=None, help="defaults to NEO4J_PASSWORD")
+    parser.add_argument("--namespace", default=None, help="slice of the database to use, defaults to SN_NAMESPACE, or default")
+    args = parser.parse_args()
+
+    kb = SQLiteKnowledgeBase(args.sqlite) if args.sqlite is not None else KnowledgeBase(args.uri, args.db_user, args.db_password, namespace=args.namespace)
+    try:
+        merged = kb.migrate_keys(args.batch_size)
+    finally:
+        kb.close()
+    print(f"Merged {merged} duplicate entities.")
+
+
+if __name__ == "__main__":
+    main()
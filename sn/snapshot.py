@@ -0,0 +1,197 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from sn.kb import EntityType, RelType, Relation
+
+
+# File layout (little-endian):
+# - header: magic, number of strings, size of the string blob, number of entities, number of relations
+# - 4-byte columns: string offsets (strings + 1), entity names, relation ent1, ent2, name and declarator
+# - 1-byte columns: entity types, relation types and relation polarities
+# - string blob: every string encoded as UTF-8, back to back
+MAGIC = b"SNSNAP01"
+_HEADER = struct.Struct("<8sIIII")
+
+# Types are stored as their index in these lists
+ENTITY_TYPES = [EntityType.TYPE, EntityType.INSTANCE]
+_ENTITY_TYPE_CODES = {entity_type: code for code, entity_type in enumerate(ENTITY_TYPES)}
+REL_TYPES = [RelType.INHERITS, RelType.OTHER]
+_REL_TYPE_CODES = {rel_type: code for code, rel_type in enumerate(REL_TYPES)}
+
+
+class SnapshotBuilder:
+    """Incremental construction of a `Snapshot`, interning entities and strings as declarations are added.
+    Declarations are added as they are, so they shouldn't conflict with each other."""
+
+    def __init__(self):
+        self._strings: Dict[str, int] = {}
+        self._entities: Dict[Tuple[str, EntityType], int] = {}
+        self.entity_names, self.entity_types = array("i"), array("B")
+        self.ent1, self.ent2, self.names, self.declarators = array("i"), array("i"), array("i"), array("i")
+        self.types, self.nots = array("B"), array("B")
+
+    def add(self, declarator: str, relation: Relation):
+        self.ent1.append(self._entity(relation.ent1, relation.ent1_type))
+        self.ent2.append(self._entity(relation.ent2, relation.ent2_type))
+        self.names.append(self._string(relation.name))
+        self.declarators.append(self._string(declarator))
+        self.types.append(_REL_TYPE_CODES[relation.type_])
+        self.nots.append(relation.not_)
+
+    def build(self) -> 'Snapshot':
+        return Snapshot(list(self._strings), self.entity_names, self.entity_types, self.ent1, self.ent2,
+                        self.names, self.declarators, self.types, self.nots)
+
+    def _string(self, string: str) -> int:
+        string_id = self._strings.get(string)
+        if string_id is None:
+            string_id = self._strings[string] = len(self._strings)
+        return string_id
+
+    def _entity(self, name: str, entity_type: EntityType) -> int:
+        key = (name, entity_type)
+        entity_id = self._entities.get(key)
+        if entity_id is None:
+            entity_id = self._entities[key] = len(self._entities)
+            self.entity_names.append(self._string(name))
+            self.entity_types.append(_ENTITY_TYPE_CODES[entity_type])
+        return entity_id
+
+
+class Snapshot:
+    """Compact columnar copy of a knowledge base's declarations.
+
+    Strings (entity, relation and declarator names) are interned in a single table, entities are stored once,
+    and relations are stored as columns of integer ids. Snapshots read from a file are memory-mapped, so the
+    columns are only paged in as they're accessed. Create them with `SnapshotBuilder`, `from_declarations` or `read`.
+    """
+
+    def __init__(self, strings, entity_names, entity_types, ent1, ent2, names, declarators, types, nots,
+                 mapping: mmap.mmap=None, views: List[memoryview]=None):
+        self.strings = strings
+        self.entity_names = entity_names
+        self.entity_types = entity_types
+        self.ent1 = ent1
+        self.ent2 = ent2
+        self.names = names
+        self.declarators = declarators
+        self.types = types
+        self.nots = nots
+        self._mapping = mapping
+        self._views = views if views is not None else []
+
+    @staticmethod
+    def from_declarations(declarations: Iterable[Tuple[str, Relation]]) -> 'Snapshot':
+        """Snapshot of `(declarator, relation)` declarations, where a later declaration of a relation replaces
+        an earlier declaration of its inverse by the same declarator, as with `add_knowledge`."""
+
+        latest = {}
+        for declarator, relation in declarations:
+            latest[declarator, relation.inverse() if relation.not_ else relation] = relation
+
+        builder = SnapshotBuilder()
+        for (declarator, _), relation in latest.items():
+            builder.add(declarator, relation)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return len(self.ent1)
+
+    def entities(self) -> Iterator[Tuple[str, EntityType]]:
+        """All `(name, type)` entities of the snapshot, in the order of their ids."""
+
+        strings = self.strings
+        for name, entity_type in zip(self.entity_names, self.entity_types):
+            yield strings[name], ENTITY_TYPES[entity_type]
+
+    def declarations(self) -> Iterator[Tuple[str, Relation]]:
+        """All `(declarator, relation)` declarations of the snapshot."""
+
+        strings = self.strings
+        entities = list(self.entities())
+        for ent1, ent2, name, declarator, type_, not_ in zip(self.ent1, self.ent2, self.names, self.declarators, self.types, self.nots):
+            (ent1_name, ent1_type), (ent2_name, ent2_type) = entities[ent1], entities[ent2]
+            yield strings[declarator], Relation(ent1_name, ent1_type, ent2_name, ent2_type, strings[name], REL_TYPES[type_], bool(not_))
+
+    def write(self, path: str):
+        """Write the snapshot to `path`, atomically."""
+
+        blob = bytearray()
+        offsets = array("I", [0])
+        for string in self.strings:
+            blob += string.encode("utf-8")
+            offsets.append(len(blob))
+
+        columns = [offsets] + [array(column.typecode if isinstance(column, array) else column.format, column) for column in
+                               (self.entity_names, self.ent1, self.ent2, self.names, self.declarators, self.entity_types, self.types, self.nots)]
+
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, len(self.strings), len(blob), len(self.entity_names), len(self)))
+            for column in columns:
+                if sys.byteorder == "big" and column.itemsize > 1:
+                    column.byteswap()
+                column.tofile(f)
+            f.write(blob)
+        os.replace(temporary, path)
+
+    @staticmethod
+    def read(path: str) -> 'Snapshot':
+        """Memory-map the snapshot written to `path`. Call `close` once it's no longer needed."""
+
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, strings_n, blob_size, entities_n, relations_n = _HEADER.unpack_from(mapping)
+        if magic != MAGIC:
+            mapping.close()
+            raise ValueError(f"{path} isn't a knowledge base snapshot.")
+
+        views = [memoryview(mapping)]
+        position = _HEADER.size
+
+        def column(typecode: str, n: int):
+            nonlocal position
+            size = struct.calcsize(typecode) * n
+            views.append(views[0][position:position + size])
+            position += size
+            if sys.byteorder == "big" and size > n:
+                swapped = array(typecode)
+                swapped.frombytes(views[-1])
+                swapped.byteswap()
+                return swapped
+            views.append(views[-1].cast(typecode))
+            return views[-1]
+
+        offsets = column("I", strings_n + 1)
+        entity_names = column("i", entities_n)
+        ent1, ent2, names, declarators = (column("i", relations_n) for _ in range(4))
+        entity_types = column("B", entities_n)
+        types, nots = column("B", relations_n), column("B", relations_n)
+
+        # Strings are decoded upfront, since they're accessed randomly
+        blob = bytes(views[0][position:position + blob_size])
+        strings: List[str] = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(strings_n)]
+
+        return Snapshot(strings, entity_names, entity_types, ent1, ent2, names, declarators, types, nots, mapping, views)
+
+    def close(self):
+        """Release the memory map of a snapshot obtained with `read`."""
+
+        if self._mapping is not None:
+            # The memory map can only be closed once no view of it remains
+            for view in reversed(self._views):
+                view.release()
+            self._views = []
+            self._mapping.close()
+            self._mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
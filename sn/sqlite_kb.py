@@ -0,0 +1,683 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Union
+
+from sn.kb import ADD, Change, Declaration, EntityType, KnowledgeBase, KnowledgeBaseCommon, RelType, Relation, canonical_key
+from sn.snapshot import ENTITY_TYPES, REL_TYPES, Snapshot, SnapshotBuilder
+from sn.tracing import tracer
+
+
+# Bound on the length of inheritance chains, so that recursive queries terminate on cyclic taxonomies
+MAX_INHERITANCE_DEPTH = 64
+
+# Version of `canonical_key` which computed the keys of a database, kept as its `user_version`.
+# Databases keyed by an earlier version are migrated when opened
+KEYS_VERSION = 1
+
+SCHEMA = """
+-- Entities are identified by the canonical key of their name (see `canonical_key`), which is NULL in databases
+-- created before keys until they're migrated
+CREATE TABLE IF NOT EXISTS entity (
+    id          INTEGER PRIMARY KEY,
+    name        TEXT NOT NULL,
+    key         TEXT,
+    type        TEXT NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS entity_key ON entity (key, type);
+
+CREATE TABLE IF NOT EXISTS declarator (
+    id          INTEGER PRIMARY KEY,
+    name        TEXT NOT NULL UNIQUE
+);
+
+-- The primary key covers lookups by (ent1, name, negated), and the secondary indexes include it,
+-- so that all queries are answered from indexes alone
+CREATE TABLE IF NOT EXISTS relation (
+    ent1        INTEGER NOT NULL REFERENCES entity (id),
+    name        TEXT NOT NULL,
+    negated     INTEGER NOT NULL,
+    type        TEXT NOT NULL,
+    ent2        INTEGER NOT NULL REFERENCES entity (id),
+    declarator  INTEGER NOT NULL REFERENCES declarator (id),
+    PRIMARY KEY (ent1, name, negated, type, ent2, declarator)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS relation_declarator ON relation (declarator);
+CREATE INDEX IF NOT EXISTS relation_ent2 ON relation (ent2, type);
+"""
+
+# Ancestors of the entities with the key `:ent` (optionally of type `:ent_type`), along with the length of each inheritance chain
+_ANCESTORS = f"""
+WITH RECURSIVE ancestors (id, distance) AS (
+    SELECT id, 0 FROM entity WHERE key = :ent AND (:ent_type IS NULL OR type = :ent_type)
+    UNION
+    SELECT r.ent2, a.distance + 1 FROM ancestors a
+    JOIN relation r ON r.ent1 = a.id AND r.type = '{RelType.INHERITS.value}'
+    WHERE a.distance < {MAX_INHERITANCE_DEPTH}
+)
+"""
+
+# Descendants of the entities with the key `:ent`, excluding themselves
+_DESCENDANTS = f"""
+WITH RECURSIVE descendants (id) AS (
+    SELECT r.ent1 FROM entity e
+    JOIN relation r ON r.ent2 = e.id AND r.type = '{RelType.INHERITS.value}'
+    WHERE e.key = :ent
+    UNION
+    SELECT r.ent1 FROM descendants d
+    JOIN relation r ON r.ent2 = d.id AND r.type = '{RelType.INHERITS.value}'
+)
+"""
+
+
+class _SQLiteTransaction:
+    """Connection wrapper that counts the statements run and rows returned, for the knowledge base metrics,
+    and collects the changes to publish once the transaction is committed (see `KnowledgeBase`'s `_Transaction`)."""
+
+    __slots__ = ("connection", "statements", "rows", "changes")
+
+    def __init__(self, connection: sqlite3.Connection, changes: Union[List[Change], None]):
+        self.connection = connection
+        self.statements = 0
+        self.rows = 0
+        self.changes = changes
+
+    def publish(self, change: Change):
+        if self.changes is not None:
+            self.changes.append(change)
+
+    def run(self, sql: str, parameters: Union[dict, tuple]=()) -> List[tuple]:
+        self.statements += 1
+        rows = self.connection.execute(sql, parameters).fetchall()
+        self.rows += len(rows)
+        return rows
+
+    def stream(self, sql: str, parameters: Union[dict, tuple]=()) -> Iterator[tuple]:
+        """Same as `run`, but the rows are fetched as they're iterated."""
+
+        self.statements += 1
+        for row in self.connection.execute(sql, parameters):
+            self.rows += 1
+            yield row
+
+    def run_many(self, sql: str, parameters: Iterable[Union[dict, tuple]]):
+        self.statements += 1
+        self.connection.executemany(sql, parameters)
+
+    def run_changes(self, sql: str, parameters: Union[dict, tuple]=()) -> int:
+        """Run a statement that returns no rows, returning the number of rows it modified."""
+
+        self.statements += 1
+        return self.connection.execute(sql, parameters).rowcount
+
+
+def _sqlite_transaction(method, write: bool):
+    name = method.__name__
+    span_name = f"kb.{name}"
+
+    def wrapper(self: 'SQLiteKnowledgeBase', *args, **kwargs):
+        with self._publishing(write):
+            with tracer.span(span_name) as span:
+                tx = _SQLiteTransaction(self._connection(), [] if self.has_listeners() else None)
+                error = True
+                start = time.perf_counter()
+                try:
+                    # Writers take the database lock upfront, instead of failing to upgrade a read lock
+                    tx.connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+                    try:
+                        result = method(*args, **kwargs, tx=tx)
+                    except BaseException:
+                        tx.connection.rollback()
+                        raise
+                    tx.connection.commit()
+                    error = False
+                finally:
+                    self.metrics.record(name, time.perf_counter() - start, tx.rows, tx.statements, 0, error)
+                    if tracer.enabled:
+                        span.add("statements", tx.statements)
+                        span.add("rows", tx.rows)
+
+            if tx.changes:
+                self.publish(tx.changes)
+        return result
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+# Decorator for read operations
+def sqlite_read(read_method):
+    return _sqlite_transaction(read_method, write=False)
+
+# Decorator for write operations
+def sqlite_write(write_method):
+    return _sqlite_transaction(write_method, write=True)
+
+
+class SQLiteKnowledgeBase(KnowledgeBaseCommon):
+    """Semantic network stored in an embedded SQLite database, with the same interface as `KnowledgeBase`.
+
+    Entities, declarators and relations are stored in normalised tables with integer ids, and inheritance chains
+    are resolved with recursive queries. The database is in WAL mode, so readers aren't blocked by a writer.
+    Each thread uses its own connection, so the knowledge base can be shared between threads.
+
+    Parameters
+    ----------
+    path : str
+        The database file, which is created if it doesn't exist
+    timeout : float = 30.0
+        Seconds to wait for the lock of a concurrent writer
+    """
+
+    def __init__(self, path: str, timeout: float=30.0):
+        super().__init__()
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode = WAL")
+        columns = [column for _, column, *_ in connection.execute("PRAGMA table_info(entity)")]
+        if len(columns) > 0 and "key" not in columns:
+            connection.execute("ALTER TABLE entity ADD COLUMN key TEXT")
+        connection.executescript(SCHEMA)
+        if (connection.execute("PRAGMA user_version").fetchone()[0] < KEYS_VERSION
+                or connection.execute("SELECT EXISTS (SELECT 1 FROM entity WHERE key IS NULL)").fetchone()[0]):
+            self.migrate_keys()
+            connection.execute(f"PRAGMA user_version = {KEYS_VERSION}")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _connect(self) -> sqlite3.Connection:
+        # Transactions are started explicitly by the decorators
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA synchronous = NORMAL")
+        self.metrics.session_opened()
+        return connection
+
+    def close(self):
+        super().close()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    # ------------------------ Query Methods --------------------------
+    # Same as `KnowledgeBase`'s. Any value passed to the `tx` argument is ignored.
+
+    @sqlite_write
+    @staticmethod
+    def add_knowledge(declarator: str, relation: Relation, tx: _SQLiteTransaction=None):
+        """`declarator` states that `relation.ent1` has a `relation.name` with `relation.ent2`. See `KnowledgeBase.add_knowledge`."""
+
+        KnowledgeBase._validate_declaration(relation)
+        replaced = SQLiteKnowledgeBase._tx_declare(tx, SQLiteKnowledgeBase._tx_declarator_id(tx, declarator), relation, {})
+        tx.publish(Change(ADD, declarator, relation, replaced))
+        return relation.ent1
+
+    @sqlite_write
+    @staticmethod
+    def add_knowledge_batch(declarator: str, relations: Iterable[Relation], tx: _SQLiteTransaction=None) -> int:
+        """`declarator` states all `relations` in a single transaction, as if `add_knowledge` was called for each one in order. \n
+        Returns the number of declared relations.
+        """
+
+        declarations = {}
+        for relation in relations:
+            KnowledgeBase._validate_declaration(relation)
+            declarations[relation.inverse() if relation.not_ else relation] = relation
+
+        declarator_id = SQLiteKnowledgeBase._tx_declarator_id(tx, declarator)
+        entity_ids = {}
+        for relation in declarations.values():
+            replaced = SQLiteKnowledgeBase._tx_declare(tx, declarator_id, relation, entity_ids)
+            tx.publish(Change(ADD, declarator, relation, replaced))
+
+        return len(declarations)
+
+    @sqlite_read
+    @staticmethod
+    def export_snapshot(path: str, tx: _SQLiteTransaction=None) -> int:
+        """Write every declaration of the knowledge base to a snapshot file at `path` (see `sn.snapshot`).
+        Returns the number of declarations."""
+
+        results = tx.stream("SELECT d.name, e1.name, e1.type, e2.name, e2.type, r.name, r.type, r.negated FROM relation r "
+                            "JOIN declarator d ON d.id = r.declarator "
+                            "JOIN entity e1 ON e1.id = r.ent1 "
+                            "JOIN entity e2 ON e2.id = r.ent2")
+
+        builder = SnapshotBuilder()
+        for declarator, ent1, ent1_type, ent2, ent2_type, name, type_, negated in results:
+            builder.add(declarator, Relation(ent1, EntityType(ent1_type), ent2, EntityType(ent2_type), name, RelType(type_), bool(negated)))
+
+        snapshot = builder.build()
+        snapshot.write(path)
+        return len(snapshot)
+
+    @sqlite_write
+    @staticmethod
+    def import_snapshot(path: str, tx: _SQLiteTransaction=None) -> int:
+        """Declare every declaration of the snapshot at `path`, written by `export_snapshot`, in a single transaction.
+        The snapshot's ids are mapped to the database's ids directly, without creating a `Relation` per declaration.
+        As with `add_knowledge`, declarations replace the declarations of their inverses. Returns the number of declarations."""
+
+        with Snapshot.read(path) as snapshot:
+            # There are no inverse declarations to replace in an empty knowledge base
+            empty = not tx.run("SELECT EXISTS (SELECT 1 FROM relation)")[0][0]
+            strings = snapshot.strings
+            entities = [(strings[name], canonical_key(strings[name]), ENTITY_TYPES[entity_type].value)
+                        for name, entity_type in zip(snapshot.entity_names, snapshot.entity_types)]
+            declarators = {strings[declarator] for declarator in set(snapshot.declarators)}
+
+            tx.run_many("INSERT OR IGNORE INTO entity (name, key, type) VALUES (?, ?, ?)", entities)
+            tx.run_many("INSERT OR IGNORE INTO declarator (name) VALUES (?)", ((declarator,) for declarator in declarators))
+
+            entity_ids = {(key, entity_type): entity_id for entity_id, key, entity_type in tx.stream("SELECT id, key, type FROM entity")}
+            entity_ids = [entity_ids[key, entity_type] for _, key, entity_type in entities]
+            declarator_ids = {name: declarator_id for declarator_id, name in tx.stream("SELECT id, name FROM declarator")}
+            declarator_ids = {string_id: declarator_ids[strings[string_id]] for string_id in set(snapshot.declarators)}
+
+            rows = [(entity_ids[ent1], strings[name], not_, REL_TYPES[type_].value, entity_ids[ent2], declarator_ids[declarator])
+                    for ent1, ent2, name, declarator, type_, not_ in
+                    zip(snapshot.ent1, snapshot.ent2, snapshot.names, snapshot.declarators, snapshot.types, snapshot.nots)]
+
+            if tx.changes is not None:
+                # Listeners need to know which inverse declarations were replaced, so they're deleted one by one
+                for row, (declarator, relation) in zip(rows, snapshot.declarations()):
+                    replaced = not empty and tx.run_changes("DELETE FROM relation WHERE ent1 = ? AND name = ? AND negated = NOT ? AND type = ? AND ent2 = ? AND declarator = ?", row) > 0
+                    tx.changes.append(Change(ADD, declarator, relation, replaced))
+            elif not empty:
+                tx.run_many("DELETE FROM relation WHERE ent1 = ? AND name = ? AND negated = NOT ? AND type = ? AND ent2 = ? AND declarator = ?", rows)
+            tx.run_many("INSERT OR IGNORE INTO relation (ent1, name, negated, type, ent2, declarator) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+            return len(snapshot)
+
+    @sqlite_read
+    @staticmethod
+    def query_declarations(declarator: str, tx: _SQLiteTransaction=None) -> Set[Relation]:
+        """Query a declarator to obtain the set of all declarations made by it."""
+
+        results = tx.run("SELECT e1.name, e1.type, r.type, r.name, e2.name, e2.type, r.negated FROM declarator d "
+                         "JOIN relation r ON r.declarator = d.id "
+                         "JOIN entity e1 ON e1.id = r.ent1 "
+                         "JOIN entity e2 ON e2.id = r.ent2 "
+                         "WHERE d.name = ?", (declarator,))
+
+        return {Relation(
+            ent1=ent1,
+            ent1_type=EntityType(ent1_type),
+            ent2=ent2,
+            ent2_type=EntityType(ent2_type),
+            name=name,
+            type_=RelType(type_),
+            not_=bool(negated)
+        ) for ent1, ent1_type, type_, name, ent2, ent2_type, negated in results}
+
+    def stream_declarations(self, declarator: str, fetch_size: int=1000) -> Iterator[Declaration]:
+        """Iterate over all declarations made by a declarator, as `Declaration` tuples, without holding them all in memory.
+        See `KnowledgeBase.stream_declarations`. \n
+        The declarations are read from a connection of their own, so other methods can be called while iterating.
+        """
+
+        rows = 0
+        error = True
+        start = time.perf_counter()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN")
+            cursor = connection.execute("SELECT e1.name, e1.type, e2.name, e2.type, r.name, r.type, r.negated FROM declarator d "
+                                        "JOIN relation r ON r.declarator = d.id "
+                                        "JOIN entity e1 ON e1.id = r.ent1 "
+                                        "JOIN entity e2 ON e2.id = r.ent2 "
+                                        "WHERE d.name = ?", (declarator,))
+            while True:
+                batch = cursor.fetchmany(fetch_size)
+                if len(batch) == 0:
+                    break
+                rows += len(batch)
+                for ent1, ent1_type, ent2, ent2_type, name, type_, negated in batch:
+                    yield ent1, ent1_type, ent2, ent2_type, name, type_, bool(negated)
+            error = False
+        except GeneratorExit:
+            # Closed before being consumed
+            error = False
+            raise
+        finally:
+            connection.close()
+            self.metrics.record("stream_declarations", time.perf_counter() - start, rows, 1, 0, error)
+
+    def stream_entity_names(self, fetch_size: int=10000) -> Iterator[str]:
+        """Iterate over the names of all entities, fetching them `fetch_size` at a time. See `stream_declarations`."""
+
+        connection = self._connect()
+        try:
+            cursor = connection.execute("SELECT name FROM entity")
+            while True:
+                batch = cursor.fetchmany(fetch_size)
+                if len(batch) == 0:
+                    break
+                for name, in batch:
+                    yield name
+        finally:
+            connection.close()
+
+    @sqlite_read
+    @staticmethod
+    def count_entities(tx: _SQLiteTransaction=None) -> int:
+        """Number of entities in the knowledge base."""
+
+        return tx.run("SELECT count(*) FROM entity")[0][0]
+
+    @sqlite_read
+    @staticmethod
+    def query_declarations_page(declarator: str, after: tuple=None, limit: int=1000, tx: _SQLiteTransaction=None) -> Tuple[List[Declaration], Union[tuple, None]]:
+        """Query a page of at most `limit` declarations made by a declarator, as `Declaration` tuples. See `KnowledgeBase.query_declarations_page`. \n
+        Pages follow the declarator index, so each page is read in time proportional to its size.
+        """
+
+        results = tx.run("SELECT r.ent1, r.name, r.negated, r.type, r.ent2, e1.name, e1.type, e2.name, e2.type, r.name, r.type, r.negated FROM relation r "
+                         "JOIN entity e1 ON e1.id = r.ent1 "
+                         "JOIN entity e2 ON e2.id = r.ent2 "
+                         f"WHERE r.declarator = (SELECT id FROM declarator WHERE name = ?) {'AND (r.ent1, r.name, r.negated, r.type, r.ent2) > (?, ?, ?, ?, ?) ' if after is not None else ''}"
+                         "ORDER BY r.ent1, r.name, r.negated, r.type, r.ent2 LIMIT ?",
+                         (declarator, *(after or ()), limit))
+
+        return ([(ent1, ent1_type, ent2, ent2_type, name, type_, bool(negated)) for *_, ent1, ent1_type, ent2, ent2_type, name, type_, negated in results],
+                tuple(results[-1][:5]) if len(results) == limit else None)
+
+    @sqlite_read
+    @staticmethod
+    def query_declarators(relation: Relation, tx: _SQLiteTransaction=None) -> Set[str]:
+        """Obtain all declarators that declared the given relation. Types are optional."""
+
+        results = tx.run("SELECT DISTINCT d.name FROM entity e1 "
+                         "JOIN relation r ON r.ent1 = e1.id AND r.name = :relation AND r.negated = :not_ AND (:type IS NULL OR r.type = :type) "
+                         "JOIN entity e2 ON e2.id = r.ent2 AND e2.key = :ent2 AND (:ent2_type IS NULL OR e2.type = :ent2_type) "
+                         "JOIN declarator d ON d.id = r.declarator "
+                         "WHERE e1.key = :ent1 AND (:ent1_type IS NULL OR e1.type = :ent1_type)",
+                         SQLiteKnowledgeBase._relation_parameters(relation))
+
+        return {declarator for declarator, in results}
+
+    @sqlite_read
+    @staticmethod
+    def query_local(ent: str, tx: _SQLiteTransaction=None) -> Set[Tuple[Tuple[str, str], Set[str]]]:
+        """Query an entity to obtain all relations and target entities locally. \n
+        Output: `{((relation_name, relation_type), {entity2, entity3}), (...)}`
+        """
+
+        results = tx.run("SELECT r.name, r.type, e2.name FROM entity e1 "
+                         "JOIN relation r ON r.ent1 = e1.id "
+                         "JOIN entity e2 ON e2.id = r.ent2 "
+                         "WHERE e1.key = ?", (canonical_key(ent),))
+
+        result_dict = {}
+        for relation, relation_type, other_entity in results:
+            result_dict.setdefault((relation, relation_type), set()).add(other_entity)
+
+        return {(k, frozenset(v)) for k, v in result_dict.items()}
+
+    @sqlite_read
+    @staticmethod
+    def query_local_relation(ent: str, relation: str, relation_type: RelType, tx: _SQLiteTransaction=None) -> Set[str]:
+        """Query an entity to obtain all target entities of a specific relation locally."""
+
+        results = tx.run("SELECT e2.name FROM entity e1 "
+                         "JOIN relation r ON r.ent1 = e1.id AND r.name = ? AND r.type = ? "
+                         "JOIN entity e2 ON e2.id = r.ent2 "
+                         "WHERE e1.key = ?", (relation, relation_type.value, canonical_key(ent)))
+
+        return {entity for entity, in results}
+
+    @sqlite_read
+    @staticmethod
+    def query_inheritance_relation(ent: str, relation: str, declarator: str=None, tx: _SQLiteTransaction=None) -> Dict[str, Tuple[Set[Tuple[str, bool]], int]]:
+        """Query the specified attribute of an entity as well as attributes inherited from INHERITS relations. \n
+        A declarator can be optionally provided to only consider relations declared by it (doesn't filter INHERITS relations). \n
+        The output is a dictionary with each entity as the key, and the characteristics, truth values and inheritance length as the values.
+        If an ancestor is reached through several inheritance chains, the shortest one is considered."""
+
+        results = tx.run(_ANCESTORS +
+                         "SELECT s.name, MIN(a.distance), e2.name, r.negated FROM ancestors a "
+                         "JOIN relation r ON r.ent1 = a.id AND r.name = :relation "
+                         "JOIN entity s ON s.id = a.id "
+                         "JOIN entity e2 ON e2.id = r.ent2 "
+                         "JOIN declarator d ON d.id = r.declarator AND (:declarator IS NULL OR d.name = :declarator) "
+                         "GROUP BY s.name, e2.name, r.negated",
+                         {"ent": canonical_key(ent), "ent_type": None, "relation": relation, "declarator": declarator})
+
+        characteristics = {}
+        distances = {}
+        for subject, distance, characteristic, negated in results:
+            characteristics.setdefault(subject, set()).add((characteristic, not negated))
+            distances[subject] = min(distance, distances.get(subject, distance))
+
+        return {subject: (frozenset(values), distances[subject]) for subject, values in characteristics.items()}
+
+    @sqlite_read
+    @staticmethod
+    def query_inheritance_relation_page(ent: str, relation: str, after: int=None, limit: int=10, declarator: str=None,
+                                        tx: _SQLiteTransaction=None) -> Tuple[Dict[str, Tuple[Set[Tuple[str, bool]], int]], Union[int, None]]:
+        """Query the best `limit` answers of `query_inheritance_relation`. See `KnowledgeBase.query_inheritance_relation_page`."""
+
+        skip = after if after is not None else 0
+        rows = SQLiteKnowledgeBase._tx_ranked_rows(tx, ent, relation, declarator, skip, limit + 1)
+
+        return SQLiteKnowledgeBase._ranked_answers(rows[:limit]), skip + limit if len(rows) > limit else None
+
+    @sqlite_read
+    @staticmethod
+    def query_ranked_inheritance_relation(ent: str, relation: str, declarator: str=None, skip: int=0, limit: int=None,
+                                          tx: _SQLiteTransaction=None) -> List[Tuple[str, str, bool, int]]:
+        """Query the answers of `query_inheritance_relation_page` as rows in rank order. See `KnowledgeBase.query_ranked_inheritance_relation`."""
+
+        return SQLiteKnowledgeBase._tx_ranked_rows(tx, ent, relation, declarator, skip, limit)
+
+    @staticmethod
+    def _tx_ranked_rows(tx: _SQLiteTransaction, ent: str, relation: str, declarator: str, skip: int, limit: Union[int, None]) -> List[Tuple[str, str, bool, int]]:
+        results = tx.run(_ANCESTORS +
+                         "SELECT s.name, e2.name, r.negated, MIN(a.distance) AS distance, COUNT(DISTINCT r.declarator) AS support FROM ancestors a "
+                         "JOIN relation r ON r.ent1 = a.id AND r.name = :relation "
+                         "JOIN entity s ON s.id = a.id "
+                         "JOIN entity e2 ON e2.id = r.ent2 "
+                         "JOIN declarator d ON d.id = r.declarator AND (:declarator IS NULL OR d.name = :declarator) "
+                         "GROUP BY s.name, e2.name, r.negated "
+                         "ORDER BY distance, support DESC, s.name, e2.name, r.negated LIMIT :limit OFFSET :skip",
+                         # A negative limit returns every row
+                         {"ent": canonical_key(ent), "ent_type": None, "relation": relation, "declarator": declarator,
+                          "skip": skip, "limit": limit if limit is not None else -1})
+
+        return [(subject, characteristic, bool(negated), distance) for subject, characteristic, negated, distance, _ in results]
+
+    @sqlite_read
+    @staticmethod
+    def query_descendants_relation(ent: str, relation: str, relation_type: RelType=None, not_: bool=False, tx: _SQLiteTransaction=None) -> Set[str]:
+        """Query the specified relation of an entity's descendants, obtaining all target entities. Relation type is optional."""
+
+        results = tx.run(_DESCENDANTS +
+                         "SELECT DISTINCT e2.name FROM descendants d "
+                         "JOIN relation r ON r.ent1 = d.id AND r.name = :relation AND r.negated = :not_ AND (:type IS NULL OR r.type = :type) "
+                         "JOIN entity e2 ON e2.id = r.ent2",
+                         {"ent": canonical_key(ent), "relation": relation, "not_": not_,
+                          "type": relation_type.value if relation_type is not None else None})
+
+        return {entity for entity, in results}
+
+    @sqlite_read
+    @staticmethod
+    def assert_relation(relation: Relation, declarator: str=None, tx: _SQLiteTransaction=None) -> bool:
+        """Assert whether or not `relation` exists in the knowledge base. Types are optional. \n
+        A declarator can be optionally provided to only consider relations declared by it.
+        """
+        return SQLiteKnowledgeBase._tx_assert_relation_exists(relation, tx, declarator)
+
+    @sqlite_read
+    @staticmethod
+    def assert_relation_inheritance(relation: Relation, declarator: str=None, tx: _SQLiteTransaction=None) -> Set[Tuple[str, int]]:
+        """Assert whether or not `relation` exists in the knowledge base, with inheritance. Types are optional. \n
+        A declarator can be optionally provided to only consider relations declared by it (doesn't filter INHERITS relations). \n
+        The output is the set of parent entities on which the relation exists and how long the inheritance chain is.
+        """
+
+        parameters = SQLiteKnowledgeBase._relation_parameters(relation)
+        parameters.update(ent=parameters["ent1"], ent_type=parameters["ent1_type"], declarator=declarator)
+
+        # As in `KnowledgeBase`, the relation type only applies to the entity's own relations
+        results = tx.run(_ANCESTORS +
+                         "SELECT DISTINCT s.name, a.distance FROM ancestors a "
+                         "JOIN relation r ON r.ent1 = a.id AND r.name = :relation AND r.negated = :not_ AND (a.distance > 0 OR :type IS NULL OR r.type = :type) "
+                         "JOIN entity e2 ON e2.id = r.ent2 AND e2.key = :ent2 AND (:ent2_type IS NULL OR e2.type = :ent2_type) "
+                         "JOIN declarator d ON d.id = r.declarator AND (:declarator IS NULL OR d.name = :declarator) "
+                         "JOIN entity s ON s.id = a.id", parameters)
+
+        return set(results)
+
+    @sqlite_read
+    @staticmethod
+    def query_inheritance_relations(tx: _SQLiteTransaction=None) -> List[Tuple[str, str, str, str]]:
+        """Query all INHERITS relations, to copy the taxonomy. See `KnowledgeBase.query_inheritance_relations`."""
+
+        return tx.run("SELECT e1.name, e1.type, e2.name, d.name FROM relation r "
+                      "JOIN entity e1 ON e1.id = r.ent1 "
+                      "JOIN entity e2 ON e2.id = r.ent2 "
+                      "JOIN declarator d ON d.id = r.declarator "
+                      f"WHERE r.type = '{RelType.INHERITS.value}'")
+
+    @sqlite_read
+    @staticmethod
+    def get_all_declarators(tx: _SQLiteTransaction=None) -> Set[str]:
+        """Get all unique declarators of knowledge."""
+
+        results = tx.run("SELECT name FROM declarator d WHERE EXISTS (SELECT 1 FROM relation r WHERE r.declarator = d.id)")
+
+        return {declarator for declarator, in results}
+
+    @sqlite_write
+    @staticmethod
+    def _delete_relations(batch_size: int, tx: _SQLiteTransaction=None) -> int:
+        deleted = tx.run_changes("DELETE FROM relation WHERE (ent1, name, negated, type, ent2, declarator) IN "
+                                 "(SELECT ent1, name, negated, type, ent2, declarator FROM relation LIMIT ?)", (batch_size,))
+        if deleted < batch_size:
+            tx.run_changes("DELETE FROM declarator")
+        return deleted
+
+    @sqlite_write
+    @staticmethod
+    def _purge_relations(declarator: str, batch_size: int, tx: _SQLiteTransaction=None) -> int:
+        deleted = tx.run_changes("DELETE FROM relation WHERE declarator = (SELECT id FROM declarator WHERE name = :declarator) "
+                                 "AND (ent1, name, negated, type, ent2) IN (SELECT r.ent1, r.name, r.negated, r.type, r.ent2 FROM declarator d "
+                                 "JOIN relation r ON r.declarator = d.id WHERE d.name = :declarator LIMIT :batch_size)",
+                                 {"declarator": declarator, "batch_size": batch_size})
+        if deleted < batch_size:
+            tx.run_changes("DELETE FROM declarator WHERE name = ?", (declarator,))
+        return deleted
+
+    @sqlite_write
+    @staticmethod
+    def _delete_orphans(batch_size: int, tx: _SQLiteTransaction=None) -> int:
+        """Delete entities without relations, which are left behind by deleted relations."""
+
+        return tx.run_changes("DELETE FROM entity WHERE id IN (SELECT id FROM entity e "
+                              "WHERE NOT EXISTS (SELECT 1 FROM relation r WHERE r.ent1 = e.id) "
+                              "AND NOT EXISTS (SELECT 1 FROM relation r WHERE r.ent2 = e.id) LIMIT ?)", (batch_size,))
+
+    @sqlite_write
+    @staticmethod
+    def _key_entities(batch_size: int, tx: _SQLiteTransaction=None) -> Tuple[int, int]:
+        """Key up to `batch_size` entities without a key, merging them into the entities which already have it.
+        Returns the number of entities processed and merged. See `KnowledgeBaseCommon.migrate_keys`."""
+
+        rows = tx.run("SELECT id, name, type FROM entity WHERE key IS NULL LIMIT ?", (batch_size,))
+        merged = sum(SQLiteKnowledgeBase._tx_set_key(entity_id, canonical_key(name), type_, tx) for entity_id, name, type_ in rows)
+        return len(rows), merged
+
+    @sqlite_write
+    @staticmethod
+    def _rekey_entities(entity_type: EntityType, after: str, batch_size: int, tx: _SQLiteTransaction=None) -> Tuple[Union[str, None], int]:
+        """Set the canonical key of up to `batch_size` entities of `entity_type` whose key comes after `after`, merging
+        them into the entities which already have it. See `KnowledgeBase._rekey_entities`."""
+
+        rows = tx.run("SELECT id, key, name FROM entity WHERE key > ? AND type = ? ORDER BY key LIMIT ?", (after, entity_type.value, batch_size))
+        merged = sum(SQLiteKnowledgeBase._tx_set_key(entity_id, canonical_key(name), entity_type.value, tx)
+                     for entity_id, key, name in rows if canonical_key(name) != key)
+        return (rows[-1][1] if len(rows) == batch_size else None), merged
+
+    @staticmethod
+    def _tx_set_key(entity_id: int, key: str, type_: str, tx: _SQLiteTransaction) -> bool:
+        """Set the key of an entity, or merge it into the entity which already has the key. Returns whether it was merged."""
+
+        keepers = tx.run("SELECT id FROM entity WHERE key = ? AND type = ?", (key, type_))
+        if len(keepers) == 0:
+            tx.run_changes("UPDATE entity SET key = ? WHERE id = ?", (key, entity_id))
+            return False
+
+        # Relations which the keeper already has are left behind, and deleted along with the entity
+        keeper = keepers[0][0]
+        tx.run_changes("UPDATE OR IGNORE relation SET ent1 = ? WHERE ent1 = ?", (keeper, entity_id))
+        tx.run_changes("UPDATE OR IGNORE relation SET ent2 = ? WHERE ent2 = ?", (keeper, entity_id))
+        tx.run_changes("DELETE FROM relation WHERE ent1 = :id OR ent2 = :id", {"id": entity_id})
+        tx.run_changes("DELETE FROM entity WHERE id = ?", (entity_id,))
+        return True
+
+    @staticmethod
+    def _tx_assert_relation_exists(relation: Relation, tx: _SQLiteTransaction, declarator: str=None) -> bool:
+        parameters = SQLiteKnowledgeBase._relation_parameters(relation)
+        parameters["declarator"] = declarator
+        results = tx.run("SELECT EXISTS (SELECT 1 FROM entity e1 "
+                         "JOIN relation r ON r.ent1 = e1.id AND r.name = :relation AND r.negated = :not_ AND (:type IS NULL OR r.type = :type) "
+                         "JOIN entity e2 ON e2.id = r.ent2 AND e2.key = :ent2 AND (:ent2_type IS NULL OR e2.type = :ent2_type) "
+                         "JOIN declarator d ON d.id = r.declarator AND (:declarator IS NULL OR d.name = :declarator) "
+                         "WHERE e1.key = :ent1 AND (:ent1_type IS NULL OR e1.type = :ent1_type))", parameters)
+        return bool(results[0][0])
+
+    @staticmethod
+    def _tx_declare(tx: _SQLiteTransaction, declarator_id: int, relation: Relation, entity_ids: Dict[Tuple[str, EntityType], int]) -> bool:
+        """Declare a validated relation, replacing the declaration of its inverse. Returns whether the inverse was declared."""
+
+        ent1 = SQLiteKnowledgeBase._tx_entity_id(tx, relation.ent1, relation.ent1_type, entity_ids)
+        ent2 = SQLiteKnowledgeBase._tx_entity_id(tx, relation.ent2, relation.ent2_type, entity_ids)
+
+        replaced = tx.run_changes("DELETE FROM relation WHERE ent1 = ? AND name = ? AND negated = ? AND type = ? AND ent2 = ? AND declarator = ?",
+                                  (ent1, relation.name, not relation.not_, relation.type_.value, ent2, declarator_id))
+        tx.run("INSERT OR IGNORE INTO relation (ent1, name, negated, type, ent2, declarator) VALUES (?, ?, ?, ?, ?, ?)",
+               (ent1, relation.name, relation.not_, relation.type_.value, ent2, declarator_id))
+        return replaced > 0
+
+    @staticmethod
+    def _tx_entity_id(tx: _SQLiteTransaction, name: str, type_: EntityType, entity_ids: Dict[Tuple[str, EntityType], int]) -> int:
+        key = canonical_key(name)
+        if (key, type_) not in entity_ids:
+            tx.run("INSERT OR IGNORE INTO entity (name, key, type) VALUES (?, ?, ?)", (name, key, type_.value))
+            entity_ids[key, type_] = tx.run("SELECT id FROM entity WHERE key = ? AND type = ?", (key, type_.value))[0][0]
+        return entity_ids[key, type_]
+
+    @staticmethod
+    def _tx_declarator_id(tx: _SQLiteTransaction, declarator: str) -> int:
+        tx.run("INSERT OR IGNORE INTO declarator (name) VALUES (?)", (declarator,))
+        return tx.run("SELECT id FROM declarator WHERE name = ?", (declarator,))[0][0]
+
+    @staticmethod
+    def _relation_parameters(relation: Relation) -> dict:
+        """Query parameters of a relation, with the keys of its entities, and whose types are `None` if they're optional."""
+
+        return {
+            "ent1": canonical_key(relation.ent1),
+            "ent1_type": relation.ent1_type.value if relation.ent1_type is not None else None,
+            "ent2": canonical_key(relation.ent2),
+            "ent2_type": relation.ent2_type.value if relation.ent2_type is not None else None,
+            "relation": relation.name,
+            "type": relation.type_.value if relation.type_ is not None else None,
+            "not_": relation.not_,
+        }
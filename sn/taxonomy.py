@@ -0,0 +1,125 @@
+import threading
+from typing import Dict, Iterable, Set, Tuple, Union
+
+from sn.kb import ADD, DELETE_ALL, PURGE, Change, EntityType, RelType, canonical_key
+
+# Entities of the taxonomy, as `(key, type)` (see `canonical_key`)
+Node = Tuple[str, EntityType]
+
+
+class Taxonomy:
+    """In-process copy of a knowledge base's INHERITS relations, to resolve ancestors and descendants without traversing the database.
+
+    It's loaded with `load` and kept current as a knowledge base listener (`kb.add_listener(taxonomy.apply)`), so it only
+    sees the writes made through this process. Ancestor and descendant maps are computed once per entity and cached until
+    the taxonomy changes, which is rare compared to the questions that use them.
+    """
+
+    def __init__(self):
+        self._clear()
+        self._lock = threading.Lock()
+
+    def _clear(self):
+        # Declarators of each `(child, parent)` relation, so that a relation is only removed once no declarator declares it
+        self._declarators: Dict[Tuple[Node, Node], Set[str]] = {}
+        self._parents: Dict[Node, Set[Node]] = {}
+        self._children: Dict[Node, Set[Node]] = {}
+        self._keys: Dict[str, Set[Node]] = {}
+        # Name of each entity, as first declared
+        self._names: Dict[Node, str] = {}
+
+        self._ancestors: Dict[Tuple[str, Union[EntityType, None]], Dict[str, int]] = {}
+        self._descendants: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def load(kb) -> 'Taxonomy':
+        """Copy the INHERITS relations of `kb`."""
+
+        taxonomy = Taxonomy()
+        with taxonomy._lock:
+            for child, child_type, parent, declarator in kb.query_inheritance_relations():
+                taxonomy._add(child, EntityType(child_type), parent, EntityType.TYPE, declarator)
+        return taxonomy
+
+    def apply(self, change: Change):
+        """Apply a change written to the knowledge base. Can be used as a knowledge base listener."""
+
+        with self._lock:
+            if change.operation == DELETE_ALL:
+                self._clear()
+            elif change.operation == PURGE:
+                for edge, declarators in list(self._declarators.items()):
+                    if change.declarator in declarators:
+                        self._remove(edge, change.declarator)
+            elif change.operation == ADD and change.relation.type_ == RelType.INHERITS:
+                relation = change.relation
+                self._add(relation.ent1, relation.ent1_type, relation.ent2, relation.ent2_type, change.declarator)
+
+    def ancestors(self, name: str, type_: EntityType=None) -> Dict[str, int]:
+        """Names of the ancestors of the entities named `name` (of type `type_`, if provided), along with the length
+        of the shortest inheritance chain to each one. The entities themselves aren't included, unless they're their own ancestors."""
+
+        key = canonical_key(name)
+        with self._lock:
+            if key not in self._keys:
+                # Not cached, since most unknown entities are asked about once
+                return {}
+            ancestors = self._ancestors.get((key, type_))
+            if ancestors is None:
+                ancestors = self._ancestors[key, type_] = self._breadth_first(
+                    {node for node in self._keys[key] if type_ is None or node[1] == type_}, self._parents)
+            return ancestors
+
+    def descendants(self, name: str) -> Set[str]:
+        """Names of the descendants of the entities named `name`. The entities themselves aren't included, unless they're their own descendants."""
+
+        key = canonical_key(name)
+        with self._lock:
+            if key not in self._keys:
+                return set()
+            descendants = self._descendants.get(key)
+            if descendants is None:
+                descendants = self._descendants[key] = set(self._breadth_first(self._keys[key], self._children))
+            return descendants
+
+    def __len__(self) -> int:
+        return len(self._declarators)
+
+    def _breadth_first(self, start: Iterable[Node], neighbours: Dict[Node, Set[Node]]) -> Dict[str, int]:
+        distances: Dict[str, int] = {}
+        visited = set()
+        frontier = set(start)
+        distance = 0
+        while len(frontier) > 0:
+            distance += 1
+            frontier = {neighbour for node in frontier for neighbour in neighbours.get(node, ()) if neighbour not in visited}
+            visited |= frontier
+            for node in frontier:
+                distances.setdefault(self._names[node], distance)
+        return distances
+
+    def _add(self, child_name: str, child_type: EntityType, parent_name: str, parent_type: EntityType, declarator: str):
+        child, parent = (canonical_key(child_name), child_type), (canonical_key(parent_name), parent_type)
+        declarators = self._declarators.setdefault((child, parent), set())
+        if len(declarators) == 0:
+            self._parents.setdefault(child, set()).add(parent)
+            self._children.setdefault(parent, set()).add(child)
+            for node, name in ((child, child_name), (parent, parent_name)):
+                self._keys.setdefault(node[0], set()).add(node)
+                self._names.setdefault(node, name)
+            self._invalidate()
+        declarators.add(declarator)
+
+    def _remove(self, edge: Tuple[Node, Node], declarator: str):
+        declarators = self._declarators[edge]
+        declarators.discard(declarator)
+        if len(declarators) == 0:
+            child, parent = edge
+            del self._declarators[edge]
+            self._parents[child].discard(parent)
+            self._children[parent].discard(child)
+            self._invalidate()
+
+    def _invalidate(self):
+        self._ancestors = {}
+        self._descendants = {}
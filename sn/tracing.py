@@ -0,0 +1,189 @@
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Dict, Union
+
+
+class Span:
+    """A timed operation, possibly nested in another one. Attributes are written along with the span."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes")
+
+    def __init__(self, name: str, trace_id: str, span_id: str, parent_id: Union[str, None], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+
+    def add(self, attribute: str, value: int=1):
+        self.attributes[attribute] = self.attributes.get(attribute, 0) + value
+
+
+# Span handed out while tracing is disabled, whose attributes are discarded
+_NO_SPAN = Span("", "", "", None, {})
+
+_current_span: ContextVar[Union[Span, None]] = ContextVar("_current_span", default=None)
+
+
+class Tracer:
+    """Opt-in tracer, which writes nested spans as JSON lines to a file.
+
+    Each span record contains its name, identifiers (`trace`, `span` and `parent`), start time (epoch seconds),
+    duration (milliseconds) and attributes. Cypher templates are identified by a short hash of their text,
+    which is written once per template as a `{"template": ..., "cypher": ...}` record.
+
+    While disabled, traced functions are called directly, at the cost of a single attribute check. Knowledge base
+    calls still count their statements and rows, for the metrics of `KnowledgeBase.stats`, but build no span.
+
+    Parameters
+    ----------
+    path : str = None
+        The file to append spans to. If `None`, tracing is disabled until `enable` is called
+    """
+
+    def __init__(self, path: str=None):
+        self._output = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._templates: Dict[str, str] = {}
+        if path:
+            self.enable(path)
+
+    @property
+    def enabled(self) -> bool:
+        return self._output is not None
+
+    def enable(self, path: str):
+        """Start writing spans to `path`."""
+
+        self.disable()
+        self._output = open(path, "a", buffering=1)
+
+    def disable(self):
+        output, self._output = self._output, None
+        if output is not None:
+            output.close()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time the enclosed block as a span named `name`, nested in the current span if there is one."""
+
+        if not self.enabled:
+            yield _NO_SPAN
+            return
+
+        parent = _current_span.get()
+        span_id = f"{os.getpid():x}-{next(self._ids):x}"
+        span = Span(name, parent.trace_id if parent is not None else span_id, span_id,
+                    parent.span_id if parent is not None else None, attributes)
+
+        token = _current_span.set(span)
+        start = time.time()
+        start_counter = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start_counter
+            _current_span.reset(token)
+            self._write({
+                "name": span.name,
+                "trace": span.trace_id,
+                "span": span.span_id,
+                "parent": span.parent_id,
+                "start": start,
+                "duration_ms": duration * 1000,
+                "attributes": span.attributes,
+            })
+
+    def traced(self, name: str=None):
+        """Decorator that traces every call of the decorated function as a span, named after the function by default."""
+
+        def decorator(function):
+            span_name = name if name is not None else f"{function.__module__}.{function.__qualname__}"
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.span(span_name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def template(self, cypher: str) -> str:
+        """Identifier of a Cypher template, whose text is written the first time it's seen."""
+
+        template_id = hashlib.sha1(cypher.encode()).hexdigest()[:12]
+        with self._lock:
+            if template_id not in self._templates:
+                self._templates[template_id] = cypher
+                self._write_locked({"template": template_id, "cypher": cypher})
+        return template_id
+
+    def _write(self, record: dict):
+        with self._lock:
+            self._write_locked(record)
+
+    def _write_locked(self, record: dict):
+        output = self._output
+        if output is not None:
+            output.write(json.dumps(record, default=str) + "\n")
+
+
+class TracedTransaction:
+    """Transaction proxy that counts the statements of the Cypher run in it and the rows they return, as `statements`
+    and `rows`. Their templates are also recorded as an attribute of `span`, if a `span` and a `tracer` are given."""
+
+    __slots__ = ("_tx", "_span", "_tracer", "statements", "rows")
+
+    def __init__(self, tx, span: Span=None, tracer: Tracer=None):
+        self._tx = tx
+        self._span = span
+        self._tracer = tracer
+        self.statements = 0
+        self.rows = 0
+
+    def run(self, query: str, *args, **kwargs):
+        if self._tracer is not None and self._span is not None:
+            self._span.attributes.setdefault("templates", []).append(self._tracer.template(query))
+        self.statements += 1
+        return _TracedResult(self._tx.run(query, *args, **kwargs), self)
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
+
+class _TracedResult:
+    __slots__ = ("_result", "_transaction")
+
+    def __init__(self, result, transaction: TracedTransaction):
+        self._result = result
+        self._transaction = transaction
+
+    def __iter__(self):
+        for record in self._result:
+            self._transaction.rows += 1
+            yield record
+
+    def single(self, *args, **kwargs):
+        record = self._result.single(*args, **kwargs)
+        if record is not None:
+            self._transaction.rows += 1
+        return record
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+
+# Tracer shared by the semantic network and the chatbot, enabled by setting the `SN_TRACE_FILE` environment variable
+tracer = Tracer(os.environ.get("SN_TRACE_FILE"))
@@ -0,0 +1,152 @@
+import threading
+import time
+from typing import Iterable, List, Tuple, Union
+
+from sn.kb import KnowledgeBase, Relation
+
+
+class WriteBehindKnowledgeBase:
+    """Proxy of a knowledge base whose declarations are acknowledged immediately and written later, in batches.
+
+    `add_knowledge` and `add_knowledge_batch` only validate and queue declarations. A background thread writes them,
+    coalesced into one `add_knowledge_batch` per run of consecutive declarations by the same declarator, once
+    `max_pending` declarations are queued or `flush_interval` seconds have passed since the last write.
+
+    Every other method (queries, deletes, snapshots, ...) waits for the declarations being written and writes the queued
+    ones before being called, so that reads in this process always see their own writes. Declarations are durable once
+    `flush` or `close` return. If the background thread fails to write, the declarations are kept queued and retried,
+    and the error is kept in `error` until a later write succeeds. Calls which write the queued declarations themselves
+    raise the errors of their own writes.
+
+    Parameters
+    ----------
+    knowledge_base : KnowledgeBase
+        The knowledge base to write to, which is closed along with the proxy
+    flush_interval : float = 0.5
+        Maximum seconds a declaration waits before being written
+    max_pending : int = 1000
+        Number of queued declarations which triggers a write before `flush_interval` elapses
+    """
+
+    def __init__(self, knowledge_base: KnowledgeBase, flush_interval: float=0.5, max_pending: int=1000):
+        self._kb = knowledge_base
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+
+        self._pending: List[Tuple[str, Relation]] = []
+        self._error: Union[Exception, None] = None
+        self._closed = False
+        # Guards the queue, and wakes up the flusher
+        self._queued = threading.Condition()
+        # Serializes writes, so that declarations are written in the order they were queued
+        self._flush_lock = threading.Lock()
+
+        self._flusher = threading.Thread(target=self._run_flusher, name="sn-write-behind", daemon=True)
+        self._flusher.start()
+
+    def add_knowledge(self, declarator: str, relation: Relation):
+        """Queue a declaration. See `KnowledgeBase.add_knowledge`."""
+
+        KnowledgeBase._validate_declaration(relation)
+        self._queue([(declarator, relation)])
+        return relation.ent1
+
+    def add_knowledge_batch(self, declarator: str, relations: Iterable[Relation]) -> int:
+        """Queue declarations. See `KnowledgeBase.add_knowledge_batch`."""
+
+        declarations = []
+        for relation in relations:
+            KnowledgeBase._validate_declaration(relation)
+            declarations.append((declarator, relation))
+        self._queue(declarations)
+        return len(declarations)
+
+    def pending(self) -> int:
+        """Number of declarations which were queued but not written yet."""
+
+        with self._queued:
+            return len(self._pending)
+
+    @property
+    def error(self) -> Union[Exception, None]:
+        """Error of the last background write, if it failed and no write succeeded since."""
+
+        with self._queued:
+            return self._error
+
+    def flush(self):
+        """Write every declaration queued before the call, returning once they're committed."""
+
+        self._flush()
+
+    def close(self):
+        """Write the queued declarations, stop the background thread and close the knowledge base."""
+
+        with self._queued:
+            self._closed = True
+            self._queued.notify_all()
+        self._flusher.join()
+        try:
+            self.flush()
+        finally:
+            self._kb.close()
+
+    def __getattr__(self, name):
+        attribute = getattr(self._kb, name)
+        if not callable(attribute):
+            return attribute
+
+        def flushed(*args, **kwargs):
+            # Even if nothing is queued, the flusher may be writing declarations taken off the queue
+            self._flush()
+            return attribute(*args, **kwargs)
+        return flushed
+
+    def _queue(self, declarations: List[Tuple[str, Relation]]):
+        with self._queued:
+            if self._closed:
+                raise RuntimeError("The knowledge base is closed.")
+            self._pending.extend(declarations)
+            if len(self._pending) >= self._max_pending:
+                self._queued.notify_all()
+
+    def _flush(self):
+        with self._flush_lock:
+            with self._queued:
+                declarations, self._pending = self._pending, []
+
+            start = 0
+            try:
+                while start < len(declarations):
+                    declarator = declarations[start][0]
+                    end = start + 1
+                    while end < len(declarations) and declarations[end][0] == declarator:
+                        end += 1
+                    self._kb.add_knowledge_batch(declarator, [relation for _, relation in declarations[start:end]])
+                    start = end
+            except BaseException:
+                # Only the declarations that weren't written are queued again
+                with self._queued:
+                    self._pending[:0] = declarations[start:]
+                raise
+
+            if len(declarations) > 0:
+                with self._queued:
+                    self._error = None
+
+    def _run_flusher(self):
+        while True:
+            with self._queued:
+                deadline = time.monotonic() + self._flush_interval
+                self._queued.wait_for(lambda: self._closed or len(self._pending) >= self._max_pending or time.monotonic() >= deadline,
+                                      timeout=self._flush_interval)
+                if self._closed:
+                    return
+                if len(self._pending) == 0:
+                    continue
+
+            try:
+                self._flush()
+            except Exception as e:
+                with self._queued:
+                    self._error = e
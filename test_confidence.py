@@ -1,6 +1,7 @@
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
-from test_knowledge_base import initialize_knowledge_base
+from test_knowledge_base import initialize_knowledge_base, listening
 from sn.kb import EntityType, KnowledgeBase, RelType, Relation
 from sn.confidence import ConfidenceTable
 
@@ -95,3 +96,53 @@ def test_confidence_of_bare_non_static_disagreement_at_half(initialize_knowledge
 
     assert ct.get_relation_confidence(relation_not) == 0.5
     assert ct.get_relation_confidence(relation) == 0.5
+
+def test_purged_declarator_is_forgotten(data_disagreements, confidence_table):
+    """Purging a declarator updates the confidence table as if the declarator had never declared anything"""
+
+    kb, relations_with_inverses = data_disagreements
+    kb: KnowledgeBase
+    ct: ConfidenceTable = confidence_table
+
+    for declarator in kb.get_all_declarators():
+        ct.register_declarator(declarator)
+    ct.update_confidences()
+    # Martinho disagrees with Lucius and Diogo
+    confidence_before = ct.get_relation_confidence(relations_with_inverses[0])
+
+    with listening(kb, ct.on_change):
+        kb.purge_declarator("Martinho")
+
+    expected_ct = ConfidenceTable(kb)
+    for declarator in kb.get_all_declarators():
+        expected_ct.register_declarator(declarator)
+    expected_ct.update_confidences()
+
+    assert "Martinho" not in kb.get_all_declarators()
+    for relation in relations_with_inverses:
+        assert ct.get_relation_confidence(relation) == expected_ct.get_relation_confidence(relation)
+    assert ct.get_relation_confidence(relations_with_inverses[0]) > confidence_before
+
+def test_concurrent_confidence_updates(data_disagreements, confidence_table):
+    """Confidences updated and read from several threads at once, as the chatbot server does, match a sequential update"""
+
+    kb, relations_with_inverses = data_disagreements
+    kb: KnowledgeBase
+    ct: ConfidenceTable = confidence_table
+
+    def update(declarator):
+        ct.register_declarator(declarator)
+        ct.update_confidences()
+        return [ct.get_relation_confidence(relation) for relation in relations_with_inverses]
+
+    declarators = sorted(kb.get_all_declarators())
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(update, declarators * 8))
+
+    expected_ct = ConfidenceTable(kb)
+    for declarator in declarators:
+        expected_ct.register_declarator(declarator)
+    expected_ct.update_confidences()
+
+    for relation in relations_with_inverses:
+        assert ct.get_relation_confidence(relation) == expected_ct.get_relation_confidence(relation)
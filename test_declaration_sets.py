@@ -0,0 +1,70 @@
+import pytest
+from test_knowledge_base import EXAMPLE_DATA, example_data, example_snapshot, initialize_knowledge_base, listening
+from sn.declaration_sets import DeclarationSets
+from sn.kb import EntityType, KnowledgeBase, RelType, Relation
+
+@pytest.fixture()
+def declaration_sets(example_data):
+
+    kb: KnowledgeBase = example_data
+    declaration_sets = DeclarationSets(kb)
+
+    with listening(kb, declaration_sets.apply):
+        yield kb, declaration_sets
+
+def test_declared(declaration_sets):
+
+    kb, declaration_sets = declaration_sets
+
+    for declarator in ["Lucius", "Diogo", "Martinho", "nobody"]:
+        for _, relation in EXAMPLE_DATA:
+            for query in [relation, relation.inverse(), Relation(relation.ent1.upper(), None, relation.ent2, None, relation.name, None, relation.not_)]:
+                assert declaration_sets.declared(declarator, query) == kb.assert_relation(query, declarator=declarator)
+
+    assert declaration_sets.stats() == {"declarators": 4, "declarations": len(EXAMPLE_DATA), "hits": 4 * 3 * len(EXAMPLE_DATA) - 4, "misses": 4}
+
+def test_declaration_sets_follow_writes(declaration_sets):
+
+    kb, declaration_sets = declaration_sets
+    relation = Relation("Diogo", EntityType.INSTANCE, "cringe", EntityType.TYPE, "is", RelType.OTHER)
+    assert declaration_sets.declared("Lucius", relation)
+
+    kb.add_knowledge("Lucius", relation.inverse())
+    assert not declaration_sets.declared("Lucius", relation)
+    assert declaration_sets.declared("Lucius", relation.inverse())
+
+    # Recorded before being written, as with a write-behind knowledge base
+    declaration_sets.add("Lucius", [Relation("Lucius", EntityType.INSTANCE, "beans", EntityType.TYPE, "likes", RelType.OTHER)])
+    assert declaration_sets.declared("Lucius", Relation("lucius", None, "bean", None, "likes", None))
+
+    kb.purge_declarator("Lucius")
+    assert not declaration_sets.declared("Lucius", relation.inverse())
+
+def test_large_declarators_are_queried(declaration_sets):
+
+    kb, _ = declaration_sets
+    declaration_sets = DeclarationSets(kb, max_declarations=2, max_declarators=1)
+    relation = Relation("Diogo", None, "chips", None, "eats", None)
+
+    assert declaration_sets.declared("Diogo", relation)
+    assert declaration_sets.declared("Martinho", Relation("person", None, "mammal", None, "is", None))
+    # Diogo has more declarations than held, and Martinho replaced him as the most recent declarator
+    assert declaration_sets.stats()["declarators"] == 1
+    assert declaration_sets.declared("Diogo", relation)
+    assert declaration_sets.stats()["misses"] == 3
+
+def test_held_declarations_are_bounded(declaration_sets):
+
+    kb, _ = declaration_sets
+    declaration_sets = DeclarationSets(kb, max_held_declarations=8)
+
+    with listening(kb, declaration_sets.apply):
+        assert declaration_sets.declared("Lucius", Relation("mammal", None, "animal", None, "is", None))
+        # Martinho's 2 declarations and Lucius' 7 aren't held together
+        assert declaration_sets.declared("Martinho", Relation("person", None, "mammal", None, "is", None))
+        assert declaration_sets.stats()["declarators"] == 1 and declaration_sets.stats()["declarations"] == 2
+
+        kb.add_knowledge("Martinho", Relation("Martinho", EntityType.INSTANCE, "beans", EntityType.TYPE, "likes", RelType.OTHER))
+        assert declaration_sets.stats()["declarations"] == 3
+        assert declaration_sets.declared("Lucius", Relation("mammal", None, "animal", None, "is", None))
+        assert declaration_sets.stats() == {"declarators": 1, "declarations": 7, "hits": 0, "misses": 3}
@@ -0,0 +1,131 @@
+import threading
+
+import pytest
+
+from nlp.main import init
+from nlp.engine import AnswerEngine, STAGES
+
+
+class KnowledgeBaseMock():
+    """Knowledge base mock with an empty knowledge base's answers, besides Diogo liking beans."""
+
+    def __init__(self):
+        self.batches = []
+
+    def add_knowledge(self, declarator, relation):
+        return relation.ent1
+
+    def add_knowledge_batch(self, declarator, relations):
+        self.batches.append(list(relations))
+        return len(relations)
+
+    def get_all_declarators(self):
+        return set()
+
+    def add_listener(self, listener):
+        pass
+
+    def query_declarations(self, declarator):
+        return set()
+
+    def stream_declarations(self, declarator):
+        return iter(())
+
+    def query_declarators(self, relation):
+        return {"Lucius"} if not relation.not_ else set()
+
+    def assert_relation(self, relation, declarator=None):
+        return False
+
+    def assert_relation_inheritance(self, relation, declarator=None):
+        return set()
+
+    def query_inheritance_relation_page(self, ent, relation, after=None, limit=10, declarator=None):
+        answers = [{"Diogo": (frozenset({("beans", True)}), 0)}, {"Diogo": (frozenset({("rice", True)}), 0)}]
+        page = after if after is not None else 0
+        return answers[page], (page + 1 if page + 1 < len(answers) else None)
+
+@pytest.fixture(scope="module")
+def kb():
+    yield KnowledgeBaseMock()
+
+@pytest.fixture(scope="module")
+def engine(kb):
+    engine = AnswerEngine(kb, init())
+    engine.confidence_table.register_declarator("Lucius", static_confidence=1.0)
+    yield engine
+
+@pytest.fixture
+def user():
+    yield "CC"
+
+def test_tell(user, engine):
+    answer = engine.handle(user, "Diogo likes playing games")
+
+    assert answer.understood
+    assert not answer.question
+    assert len(answer.triples) == 1
+    assert answer.kb_calls >= 1
+
+def test_ask_open_question(user, engine):
+    answer = engine.handle(user, "What does Diogo like?")
+
+    assert answer.understood
+    assert answer.question
+    assert answer.confidence == 1.0
+    assert "beans" in answer.response
+
+def test_ask_unknown(user, engine):
+    answer = engine.handle(user, "Does Diogo like rice?")
+
+    assert answer.question
+    assert answer.confidence is None
+
+def test_timings(user, engine):
+    answer = engine.handle(user, "What does Diogo like?")
+
+    assert set(answer.timings.keys()) == set(STAGES)
+    assert all(elapsed >= 0 for elapsed in answer.timings.values())
+    # query_inheritance_relation_page and query_declarators for the relation and its inverse, since the user's declarations are loaded
+    assert answer.kb_calls == 3
+
+def test_ask_more(user, engine):
+    answer = engine.handle(user, "What does Diogo like?")
+
+    assert answer.after is not None
+    assert "among others" in answer.response
+
+    more = engine.more(user, answer)
+
+    assert more.understood
+    assert "rice" in more.response
+    assert more.after is None
+    assert more.kb_calls == 3
+
+def test_several_sentences(user, kb, engine):
+    batches = len(kb.batches)
+
+    answer = engine.handle(user, "Diogo likes bananas. The dog eats meat. What does Diogo like?")
+
+    assert [sentence.question for sentence in answer.sentences] == [False, False, True]
+    assert all(sentence.understood for sentence in answer.sentences)
+    # Both statements are declared together, before answering the question
+    assert len(kb.batches) == batches + 1
+    assert len(kb.batches[-1]) == 2
+    assert "beans" in answer.response
+    assert answer.response.startswith(answer.sentences[0].response)
+
+def test_deferred_confidence_updates(user, kb):
+    engine = AnswerEngine(kb, init(), defer_confidence_updates=True)
+    updated = threading.Event()
+    update_confidences = engine.confidence_table.update_confidences
+    engine.confidence_table.update_confidences = lambda: (update_confidences(), updated.set())
+    try:
+        answer = engine.handle(user, "Diogo likes bananas")
+
+        assert answer.understood
+        # Only the declaration, since the confidences are updated in the background
+        assert answer.kb_calls == 1
+        assert updated.wait(5)
+    finally:
+        engine.close()
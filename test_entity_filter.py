@@ -0,0 +1,56 @@
+from test_knowledge_base import EXAMPLE_DATA, example_data, example_snapshot, initialize_knowledge_base
+from test_metrics import FakeDriver
+from sn.entity_filter import EntityFilter
+from sn.kb import ADD, DELETE_ALL, Change, EntityType, KnowledgeBase, RelType, Relation
+
+def test_no_false_negatives():
+
+    entity_filter = EntityFilter(capacity=1000, error_rate=0.01)
+    names = [f"entity {i}" for i in range(1000)]
+    entity_filter.update(names)
+
+    assert all(entity_filter.might_contain(name) for name in names)
+
+def test_false_positive_rate():
+
+    entity_filter = EntityFilter(capacity=1000, error_rate=0.01)
+    entity_filter.update(f"entity {i}" for i in range(1000))
+
+    false_positives = sum(entity_filter.might_contain(f"unknown {i}") for i in range(10000))
+
+    assert 0.002 < entity_filter.false_positive_rate() < 0.02
+    assert false_positives / 10000 < 0.02
+    assert entity_filter.stats()["negatives"] == 10000 - false_positives
+
+def test_filter_follows_writes():
+
+    entity_filter = EntityFilter()
+    relation = Relation("Diogo", EntityType.INSTANCE, "person", EntityType.TYPE, "is", RelType.INHERITS)
+
+    entity_filter.apply(Change(ADD, "Lucius", relation))
+    assert entity_filter.might_contain("Diogo") and entity_filter.might_contain("person")
+
+    entity_filter.apply(Change(DELETE_ALL))
+    assert not entity_filter.might_contain("Diogo")
+
+def test_load(example_data):
+
+    entity_filter = EntityFilter.load(example_data)
+
+    for _, relation in EXAMPLE_DATA:
+        assert entity_filter.might_contain(relation.ent1)
+        assert entity_filter.might_contain(relation.ent2)
+
+def test_unknown_entities_skip_the_database():
+
+    kb = KnowledgeBase(driver=FakeDriver(), create_indexes=False)
+    kb.entity_filter = EntityFilter()
+    kb.entity_filter.add("Diogo")
+
+    assert kb.query_inheritance_relation("Lucius", "eats") == {}
+    assert kb.assert_relation_inheritance(Relation("Diogo", None, "Lucius", None, "likes", None)) == set()
+    assert kb.query_descendants_relation("Lucius", "eats") == set()
+
+    stats = kb.stats()
+    assert stats["sessions"] == 0
+    assert stats["entity_filter"]["negatives"] == 3
@@ -0,0 +1,112 @@
+import pytest
+
+from nlp.main import add_knowledge, init, query_knowledge
+from nlp.fast_path import FastPathParser
+
+
+class KnowledgeBaseRecorder():
+    """Knowledge base mock that records the calls made to it, answering queries with fixed data."""
+
+    def __init__(self):
+        self.calls = []
+
+    def add_knowledge_batch(self, declarator, relations):
+        self.calls.append(("add_knowledge_batch", declarator, list(relations)))
+
+    def assert_relation_inheritance(self, relation, declarator=None):
+        self.calls.append(("assert_relation_inheritance", relation, declarator))
+        return {(relation.ent1, 0)}
+
+    def query_inheritance_relation_page(self, ent, relation, after=None, limit=10, declarator=None):
+        self.calls.append(("query_inheritance_relation_page", ent, relation, after, limit, declarator))
+        return {ent: (frozenset({("beans", True)}), 0)}, None
+
+
+# Sentences which fit a statement template
+FAST_STATEMENTS = [
+    "Diogo is a person",
+    "Diogo likes bananas",
+    "The dog eats meat",
+]
+
+# Sentences of `test_nlp.py`, which don't fit any template
+SLOW_STATEMENTS = [
+    "Diogo likes playing games",
+    "Diogo likes making games",
+    "Diogo likes eating bananas",
+    "Diogo's favorite dish is pasta",
+    "Lucius likes Dinis's green house",
+    "Lucius doesn't like Dinis's green house",
+    "The director is 65 years old",
+    "Diogo's book looks like Dinis's book",
+]
+
+# Sentences of `test_nlp_questions.py`, as well as the simple templates, all of which fit a question template
+QUESTIONS = [
+    "What does Diogo like?",
+    "Does Diogo like rice?",
+    "Does Diogo eat bananas?",
+    "What does the dog eat?",
+]
+
+@pytest.fixture(scope="module")
+def nlp():
+    nlp = init()
+    yield nlp
+
+@pytest.fixture(scope="module")
+def fast_path(nlp):
+    yield FastPathParser(nlp)
+
+@pytest.fixture
+def user():
+    yield "CC"
+
+def stringify(content):
+    return tuple(str(value) for value in content)
+
+@pytest.mark.parametrize("text", FAST_STATEMENTS)
+def test_statement_same_triples(user, nlp, fast_path, text):
+    kb_slow = KnowledgeBaseRecorder()
+    kb_fast = KnowledgeBaseRecorder()
+
+    slow_result = add_knowledge(user, nlp(text), kb_slow)
+    fast_result = fast_path.add_knowledge(user, fast_path.parse(text), kb_fast)
+
+    assert fast_result is not None
+    assert fast_result == slow_result
+    assert [t.not_ for t in fast_result] == [t.not_ for t in slow_result]
+    assert kb_fast.calls == kb_slow.calls
+
+@pytest.mark.parametrize("text", QUESTIONS)
+def test_question_same_queries(user, nlp, fast_path, text):
+    kb_slow = KnowledgeBaseRecorder()
+    kb_fast = KnowledgeBaseRecorder()
+
+    slow_content, slow_bool_query = query_knowledge(user, nlp(text), kb_slow)
+    fast_result = fast_path.query_knowledge(user, fast_path.parse(text), kb_fast)
+
+    assert fast_result is not None
+    fast_content, fast_bool_query = fast_result
+    assert fast_bool_query == slow_bool_query
+    assert stringify(fast_content) == stringify(slow_content)
+    assert kb_fast.calls == kb_slow.calls
+
+@pytest.mark.parametrize("text", FAST_STATEMENTS)
+def test_statement_templates_use_fast_path(user, fast_path, text):
+    fast_path_hits = fast_path.fast_path_hits
+
+    assert fast_path.add_knowledge(user, fast_path.parse(text), KnowledgeBaseRecorder()) is not None
+    assert fast_path.fast_path_hits == fast_path_hits + 1
+
+@pytest.mark.parametrize("text", SLOW_STATEMENTS)
+def test_complex_sentences_use_slow_path(user, fast_path, text):
+    slow_path_hits = fast_path.slow_path_hits
+    kb = KnowledgeBaseRecorder()
+
+    doc = fast_path.parse(text)
+
+    assert fast_path.add_knowledge(user, doc, kb) is None
+    assert kb.calls == []
+    assert fast_path.slow_path_hits == slow_path_hits + 1
+    assert add_knowledge(user, fast_path.complete(doc), kb)
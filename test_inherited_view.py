@@ -0,0 +1,62 @@
+import pytest
+from test_knowledge_base import example_data, example_snapshot, initialize_knowledge_base, listening
+from sn.inherited_view import InheritedView
+from sn.kb import EntityType, KnowledgeBase, RelType, Relation
+
+@pytest.fixture()
+def view(example_data):
+
+    kb: KnowledgeBase = example_data
+    view = InheritedView(kb)
+
+    with listening(kb, view.apply):
+        yield kb, view
+
+def test_view_matches_queries(view):
+
+    kb, view = view
+
+    for ent, relation, declarator in [("Diogo", "eats", None), ("Diogo", "eats", "Lucius"), ("person", "drinks", None), ("Lucius", "likes", None)]:
+        assert kb._ranked_answers(view.ranked(ent, relation, declarator)) == kb.query_inheritance_relation(ent, relation, declarator)
+        assert view.ranked(ent, relation, declarator) == kb.query_ranked_inheritance_relation(ent, relation, declarator)
+
+    assert view.stats() == {"entries": 4, "hits": 4, "misses": 4}
+    assert view.ranked("nobody", "eats") == []
+    assert view.check() == []
+
+def test_view_follows_writes(view):
+
+    kb, view = view
+    view.ranked("Diogo", "eats")
+    view.ranked("Lucius", "eats")
+    view.ranked("person", "eats")
+
+    # Attributes fan out to the entries of the descendants
+    kb.add_knowledge("Martinho", Relation("mammal", EntityType.TYPE, "fish", EntityType.TYPE, "eats", RelType.OTHER))
+    assert len(view) == 0
+    assert ("mammal", "fish", False, 2) in view.ranked("Diogo", "eats")
+
+    # INHERITS relations invalidate every entry of the subtree
+    view.ranked("person", "eats")
+    kb.add_knowledge("Martinho", Relation("person", EntityType.TYPE, "eater", EntityType.TYPE, "is", RelType.INHERITS))
+    kb.add_knowledge("Martinho", Relation("eater", EntityType.TYPE, "everything", EntityType.TYPE, "eats", RelType.OTHER))
+    assert ("eater", "everything", False, 2) in view.ranked("Diogo", "eats")
+    assert view.check() == []
+
+    kb.purge_declarator("Martinho")
+    assert len(view) == 0
+    assert view.ranked("Diogo", "eats") == kb.query_ranked_inheritance_relation("Diogo", "eats")
+
+def test_check_finds_stale_entries(view):
+
+    kb, view = view
+    view.ranked("Diogo", "eats")
+
+    # Written without notifying the view, as if by another process
+    kb.remove_listener(view.apply)
+    kb.add_knowledge("Martinho", Relation("Diogo", EntityType.INSTANCE, "fish", EntityType.TYPE, "eats", RelType.OTHER))
+    kb.add_listener(view.apply)
+
+    assert view.check() == [("Diogo", "eats", None)]
+    assert view.check() == []
+    assert ("Diogo", "fish", False, 0) in view.ranked("Diogo", "eats")
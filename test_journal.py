@@ -0,0 +1,133 @@
+import threading
+
+import pytest
+from test_knowledge_base import EXAMPLE_DATA, initialize_knowledge_base, listening
+from sn.confidence import ConfidenceTable
+from sn.journal import Journal
+from sn.kb import ADD, DELETE_ALL, Change, EntityType, KnowledgeBase, RelType, Relation
+from sn.sqlite_kb import SQLiteKnowledgeBase
+
+@pytest.fixture()
+def journaled_kb(initialize_knowledge_base, tmp_path):
+
+    kb: KnowledgeBase = initialize_knowledge_base
+    journal = Journal(str(tmp_path / "kb.journal"))
+
+    with listening(kb, journal.append):
+        yield kb, journal
+
+    kb.delete_all()
+    journal.close()
+
+def test_journal_records_writes(journaled_kb):
+
+    kb, journal = journaled_kb
+    relation = Relation("Diogo", EntityType.INSTANCE, "cringe", EntityType.TYPE, "is", RelType.OTHER)
+
+    kb.add_knowledge("Lucius", relation)
+    kb.add_knowledge("Lucius", relation.inverse())
+    kb.add_knowledge_batch("Diogo", [relation, relation.inverse()])
+    kb.delete_all()
+
+    records = [(record.seq, record.operation, record.declarator, record.relation, record.replaced_inverse) for record in journal.records()]
+
+    assert records == [
+        (1, ADD, "Lucius", relation, False),
+        (2, ADD, "Lucius", relation.inverse(), True),
+        (3, ADD, "Diogo", relation.inverse(), False),
+        (4, DELETE_ALL, None, None, False),
+    ]
+    assert journal.last_seq == 4
+
+def test_replay_rebuilds_knowledge_base(journaled_kb, tmp_path):
+
+    kb, journal = journaled_kb
+    for declarator, relation in EXAMPLE_DATA:
+        kb.add_knowledge(declarator, relation)
+
+    replica = SQLiteKnowledgeBase(str(tmp_path / "replica.sqlite"))
+    try:
+        assert journal.replay(replica) == len(EXAMPLE_DATA)
+
+        assert replica.get_all_declarators() == kb.get_all_declarators()
+        for declarator in kb.get_all_declarators():
+            assert replica.query_declarations(declarator) == set(kb.query_declarations(declarator))
+    finally:
+        replica.close()
+
+def test_subscribe(journaled_kb):
+
+    kb, journal = journaled_kb
+    relation = Relation("Diogo", EntityType.INSTANCE, "person", EntityType.TYPE, "is", RelType.INHERITS)
+    kb.add_knowledge("Lucius", relation)
+
+    subscription = journal.subscribe(from_seq=2)
+    assert subscription.poll() == []
+
+    kb.add_knowledge("Diogo", relation)
+    assert [(record.seq, record.declarator) for record in subscription.poll()] == [(2, "Diogo")]
+    assert subscription.poll() == []
+
+    # Iterating blocks until records are appended
+    followed = []
+    def follow():
+        for record in subscription:
+            followed.append(record.seq)
+            if record.seq == 3:
+                break
+    follower = threading.Thread(target=follow)
+    follower.start()
+    kb.add_knowledge("Martinho", relation)
+    follower.join(timeout=5)
+
+    assert followed == [3]
+    subscription.close()
+
+def test_partial_record_is_discarded(tmp_path):
+
+    path = str(tmp_path / "kb.journal")
+    relation = Relation("Diogo", EntityType.INSTANCE, "person", EntityType.TYPE, "is", RelType.INHERITS)
+    with Journal(path) as journal:
+        journal.append(Change(ADD, "Lucius", relation))
+        journal.append(Change(ADD, "Diogo", relation))
+
+    with open(path, "a") as f:
+        f.write('[3, "add", "Mart')
+
+    with Journal(path) as journal:
+        assert journal.last_seq == 2
+        assert journal.append(Change(ADD, "Martinho", relation)) == 3
+        assert [record.declarator for record in journal.records()] == ["Lucius", "Diogo", "Martinho"]
+
+def test_confidence_from_journal(journaled_kb):
+
+    kb, journal = journaled_kb
+    for declarator, relation in EXAMPLE_DATA:
+        kb.add_knowledge(declarator, relation)
+
+    tables = [ConfidenceTable(kb), ConfidenceTable(kb, journal=journal)]
+    for ct in tables:
+        for declarator in kb.get_all_declarators():
+            ct.register_declarator(declarator)
+        ct.update_confidences()
+
+    for _, relation in EXAMPLE_DATA:
+        for query in [relation, relation.inverse(), Relation(relation.ent1, None, relation.ent2, None, relation.name, None, relation.not_)]:
+            assert tables[0].get_relation_confidence(query) == tables[1].get_relation_confidence(query)
+
+def test_confidence_from_journal_compares_keys(journaled_kb):
+
+    kb, journal = journaled_kb
+    kb.add_knowledge("Wikipedia", Relation("person", EntityType.TYPE, "Beans", EntityType.TYPE, "eats", RelType.OTHER))
+    kb.add_knowledge("Diogo", Relation("People", EntityType.TYPE, "bean", EntityType.TYPE, "eats", RelType.OTHER))
+
+    tables = [ConfidenceTable(kb), ConfidenceTable(kb, journal=journal)]
+    for ct in tables:
+        ct.register_declarator("Wikipedia", static_confidence=1.0)
+        ct.register_declarator("Diogo")
+        ct.update_confidences()
+
+    query = Relation("persons", None, "beans", None, "eats", None)
+    assert [ct._query_declarators(query) for ct in tables] == [{"Wikipedia", "Diogo"}] * 2
+    assert [ct.get_relation_confidence(query) for ct in tables] == [1.0, 1.0]
+    assert tables[0]._confidences["Diogo"] == tables[1]._confidences["Diogo"] == 0.75
@@ -1,9 +1,35 @@
-import pytest
-from sn.kb import EntityType, KnowledgeBase, RelType, Relation
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-@pytest.fixture(scope="module", autouse=True)
-def initialize_knowledge_base():
-    kb = KnowledgeBase("bolt://localhost:7687", "neo4j", "Sussy_baka123321")
+import pytest
+from sn.kb import EntityType, KnowledgeBase, RelType, Relation, canonical_key
+from sn.sqlite_kb import SQLiteKnowledgeBase
+from sn.snapshot import Snapshot
+
+def module_namespace(request) -> str:
+    """Namespace of a test module, unique per pytest-xdist worker, so that test runs can share a Neo4j server."""
+
+    return f"test_{request.module.__name__}_{os.environ.get('PYTEST_XDIST_WORKER', 'main')}"
+
+@contextmanager
+def listening(kb: KnowledgeBase, listener):
+    """Notify `listener` of the changes written to `kb` within the block."""
+
+    kb.add_listener(listener)
+    try:
+        yield
+    finally:
+        kb.remove_listener(listener)
+
+@pytest.fixture(scope="module", params=["neo4j", "sqlite"])
+def initialize_knowledge_base(request, tmp_path_factory):
+    if request.param == "sqlite":
+        kb = SQLiteKnowledgeBase(str(tmp_path_factory.mktemp("kb") / "kb.sqlite"))
+    else:
+        kb = KnowledgeBase(password=os.environ.get("NEO4J_PASSWORD"), namespace=module_namespace(request))
     kb.delete_all()
     
     yield kb
@@ -11,27 +37,37 @@ def initialize_knowledge_base():
     kb.delete_all()
     kb.close()
 
+EXAMPLE_DATA = [
+    ("Lucius", Relation("Diogo", EntityType.INSTANCE, "cringe", EntityType.TYPE, "is", RelType.OTHER)),
+    ("Lucius", Relation("Diogo", EntityType.INSTANCE, "person", EntityType.TYPE, "is" , RelType.INHERITS)),
+    ("Lucius", Relation("Lucius", EntityType.INSTANCE, "person", EntityType.TYPE, "is" , RelType.INHERITS)),
+    ("Lucius", Relation("Diogo", EntityType.INSTANCE, "working", EntityType.TYPE, "is", RelType.OTHER)),
+    ("Diogo", Relation("Lucius", EntityType.INSTANCE, "bad declarator", EntityType.TYPE, "is", RelType.OTHER)),
+    ("Diogo", Relation("Lucius", EntityType.INSTANCE, "mushrooms", EntityType.TYPE, "likes", RelType.OTHER)),
+    ("Diogo", Relation("Lucius", EntityType.INSTANCE, "shotos", EntityType.TYPE, "likes", RelType.OTHER)),
+    ("Martinho", Relation("person", EntityType.TYPE, "mammal", EntityType.TYPE, "is", RelType.INHERITS)),
+    ("Lucius", Relation("mammal", EntityType.TYPE, "animal", EntityType.TYPE, "is", RelType.INHERITS)),
+    ("Martinho", Relation("Diogo", EntityType.INSTANCE, "cringe", EntityType.TYPE, "is", RelType.OTHER, not_=True)),
+
+    ("Diogo", Relation("person", EntityType.TYPE, "food", EntityType.TYPE, "eats", RelType.OTHER)),
+    ("Diogo", Relation("person", EntityType.TYPE, "beans", EntityType.TYPE, "eats", RelType.OTHER)),
+    ("Diogo", Relation("Diogo", EntityType.INSTANCE, "chips", EntityType.TYPE, "eats", RelType.OTHER)),
+    ("Lucius", Relation("mammal", EntityType.TYPE, "banana", EntityType.TYPE, "eats", RelType.OTHER)),
+    ("Lucius", Relation("animal", EntityType.TYPE, "water", EntityType.TYPE, "drinks", RelType.OTHER)),
+]
+
+@pytest.fixture(scope="module")
+def example_snapshot(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("snapshot") / "example.snapshot")
+    Snapshot.from_declarations(EXAMPLE_DATA).write(path)
+    yield path
+
 @pytest.fixture()
-def example_data(initialize_knowledge_base):
+def example_data(initialize_knowledge_base, example_snapshot):
 
     kb: KnowledgeBase = initialize_knowledge_base
 
-    kb.add_knowledge("Lucius", Relation("Diogo", EntityType.INSTANCE, "cringe", EntityType.TYPE, "is", RelType.OTHER))
-    kb.add_knowledge("Lucius", Relation("Diogo", EntityType.INSTANCE, "person", EntityType.TYPE, "is" , RelType.INHERITS))
-    kb.add_knowledge("Lucius", Relation("Lucius", EntityType.INSTANCE, "person", EntityType.TYPE, "is" , RelType.INHERITS))
-    kb.add_knowledge("Lucius", Relation("Diogo", EntityType.INSTANCE, "working", EntityType.TYPE, "is", RelType.OTHER))
-    kb.add_knowledge("Diogo", Relation("Lucius", EntityType.INSTANCE, "bad declarator", EntityType.TYPE, "is", RelType.OTHER))
-    kb.add_knowledge("Diogo", Relation("Lucius", EntityType.INSTANCE, "mushrooms", EntityType.TYPE, "likes", RelType.OTHER))
-    kb.add_knowledge("Diogo", Relation("Lucius", EntityType.INSTANCE, "shotos", EntityType.TYPE, "likes", RelType.OTHER))
-    kb.add_knowledge("Martinho", Relation("person", EntityType.TYPE, "mammal", EntityType.TYPE, "is", RelType.INHERITS))
-    kb.add_knowledge("Lucius", Relation("mammal", EntityType.TYPE, "animal", EntityType.TYPE, "is", RelType.INHERITS))
-    kb.add_knowledge("Martinho", Relation("Diogo", EntityType.INSTANCE, "cringe", EntityType.TYPE, "is", RelType.OTHER, not_=True))
-    
-    kb.add_knowledge("Diogo", Relation("person", EntityType.TYPE, "food", EntityType.TYPE, "eats", RelType.OTHER))
-    kb.add_knowledge("Diogo", Relation("person", EntityType.TYPE, "beans", EntityType.TYPE, "eats", RelType.OTHER))
-    kb.add_knowledge("Diogo", Relation("Diogo", EntityType.INSTANCE, "chips", EntityType.TYPE, "eats", RelType.OTHER))
-    kb.add_knowledge("Lucius", Relation("mammal", EntityType.TYPE, "banana", EntityType.TYPE, "eats", RelType.OTHER))
-    kb.add_knowledge("Lucius", Relation("animal", EntityType.TYPE, "water", EntityType.TYPE, "drinks", RelType.OTHER))
+    kb.import_snapshot(example_snapshot)
     
     yield kb
 
@@ -65,6 +101,27 @@ def test_diogo_eats_with_declarator(example_data):
     assert kb_output == output
 
 
+def test_diogo_eats_ranked(example_data):
+
+    kb: KnowledgeBase = example_data
+
+    kb.add_knowledge("Martinho", Relation("person", EntityType.TYPE, "food", EntityType.TYPE, "eats", RelType.OTHER))
+
+    pages = []
+    after = None
+    while True:
+        page, after = kb.query_inheritance_relation_page("Diogo", "eats", after=after, limit=2)
+        pages.append(page)
+        if after is None:
+            break
+
+    # Closest ancestors first, then the answers with most declarators
+    assert pages == [
+        {"Diogo": ({("chips", True)}, 0), "person": ({("food", True)}, 1)},
+        {"person": ({("beans", True)}, 1), "mammal": ({("banana", True)}, 2)},
+    ]
+
+
 def test_query_local(example_data):
 
     kb: KnowledgeBase = example_data
@@ -105,4 +162,195 @@ def test_no_conflicting_declarations(initialize_knowledge_base):
     kb.add_knowledge('Lucius', Relation('Lucius', EntityType.INSTANCE, 'Dinis\'s green house', EntityType.INSTANCE, 'like', RelType.OTHER, not_=True))
     kb.add_knowledge('Lucius', Relation('Lucius', EntityType.INSTANCE, 'Dinis\'s green house', EntityType.INSTANCE, 'like', RelType.OTHER, not_=False))
 
-    assert len(kb.query_declarations('Lucius')) == 1
\ No newline at end of file
+    assert len(kb.query_declarations('Lucius')) == 1
+
+def test_canonical_keys(initialize_knowledge_base):
+
+    kb: KnowledgeBase = initialize_knowledge_base
+
+    kb.add_knowledge("Lucius", Relation("person", EntityType.TYPE, "Beans", EntityType.TYPE, "eats", RelType.OTHER))
+    kb.add_knowledge("Diogo", Relation("People", EntityType.TYPE, "beans", EntityType.TYPE, "eats", RelType.OTHER))
+    kb.add_knowledge("Diogo", Relation("Beans ", EntityType.TYPE, "legume", EntityType.TYPE, "is", RelType.INHERITS))
+
+    assert kb.query_declarators(Relation("Person", None, "bean", None, "eats", None)) == {"Lucius", "Diogo"}
+    assert kb.query_local_relation("person", "eats", RelType.OTHER) == {"Beans"}
+    assert kb.query_inheritance_relation("BEANS", "is") == {"Beans": ({("legume", True)}, 0)}
+    assert kb.assert_relation_inheritance(Relation("bean", EntityType.TYPE, "legumes", EntityType.TYPE, "is", RelType.INHERITS)) == {("Beans", 0)}
+
+    kb.delete_all()
+
+def test_canonical_key_plurals():
+
+    for singular, plural in [("boss", "bosses"), ("dress", "dresses"), ("bus", "buses"), ("bean", "beans"), ("person", "people"),
+                             ("glass", "glasses"), ("favorite dish", "favorite dishes")]:
+        assert canonical_key(singular) == canonical_key(plural) == singular
+    for word in ["Lucius", "physics", "analysis", "status", "species"]:
+        assert canonical_key(word) == word.lower()
+    for name in ["Bosses", "beans", "Lucius", "people", "children", "mice", "dresses", "physics"]:
+        assert canonical_key(canonical_key(name)) == canonical_key(name)
+
+def test_migrate_keys(tmp_path):
+
+    path = str(tmp_path / "kb.sqlite")
+    # Database written before entities had keys, with "Beans" and "beans" as different entities
+    with sqlite3.connect(path) as connection:
+        connection.executescript(
+            "CREATE TABLE entity (id INTEGER PRIMARY KEY, name TEXT NOT NULL, type TEXT NOT NULL, UNIQUE (name, type));"
+            "CREATE TABLE declarator (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);"
+            "CREATE TABLE relation (ent1 INTEGER NOT NULL, name TEXT NOT NULL, negated INTEGER NOT NULL, type TEXT NOT NULL, "
+            "ent2 INTEGER NOT NULL, declarator INTEGER NOT NULL, PRIMARY KEY (ent1, name, negated, type, ent2, declarator)) WITHOUT ROWID;"
+            "INSERT INTO entity VALUES (1, 'person', 'Type'), (2, 'Beans', 'Type'), (3, 'beans', 'Type'), (4, 'legume', 'Type');"
+            "INSERT INTO declarator VALUES (1, 'Lucius'), (2, 'Diogo');"
+            "INSERT INTO relation VALUES (1, 'eats', 0, 'Other', 2, 1), (1, 'eats', 0, 'Other', 3, 1), (1, 'eats', 0, 'Other', 3, 2), "
+            "(3, 'is', 0, 'Inherits', 4, 2);")
+    connection.close()
+
+    kb = SQLiteKnowledgeBase(path)
+    try:
+        assert kb.count_entities() == 3
+        assert kb.query_declarations("Lucius") == {Relation("person", EntityType.TYPE, "Beans", EntityType.TYPE, "eats", RelType.OTHER)}
+        assert kb.query_declarations("Diogo") == {
+            Relation("person", EntityType.TYPE, "Beans", EntityType.TYPE, "eats", RelType.OTHER),
+            Relation("Beans", EntityType.TYPE, "legume", EntityType.TYPE, "is", RelType.INHERITS),
+        }
+
+        kb.add_knowledge("Martinho", Relation("bean", EntityType.TYPE, "food", EntityType.TYPE, "is", RelType.INHERITS))
+        assert kb.query_local_relation("beans", "is", RelType.INHERITS) == {"legume", "food"}
+        assert kb.migrate_keys() == 0
+    finally:
+        kb.close()
+
+def test_rekey_entities(tmp_path):
+
+    path = str(tmp_path / "kb.sqlite")
+    # Database keyed by a version of `canonical_key` which singularized "boss" into "bos"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(
+            "CREATE TABLE entity (id INTEGER PRIMARY KEY, name TEXT NOT NULL, key TEXT, type TEXT NOT NULL);"
+            "CREATE TABLE declarator (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);"
+            "CREATE TABLE relation (ent1 INTEGER NOT NULL, name TEXT NOT NULL, negated INTEGER NOT NULL, type TEXT NOT NULL, "
+            "ent2 INTEGER NOT NULL, declarator INTEGER NOT NULL, PRIMARY KEY (ent1, name, negated, type, ent2, declarator)) WITHOUT ROWID;"
+            "INSERT INTO entity VALUES (1, 'boss', 'bos', 'Type'), (2, 'bosses', 'boss', 'Type'), (3, 'person', 'person', 'Type');"
+            "INSERT INTO declarator VALUES (1, 'Lucius'), (2, 'Diogo');"
+            "INSERT INTO relation VALUES (1, 'is', 0, 'Inherits', 3, 1), (2, 'is', 0, 'Inherits', 3, 2);")
+    connection.close()
+
+    kb = SQLiteKnowledgeBase(path)
+    try:
+        assert kb.count_entities() == 2
+        assert kb.query_declarators(Relation("boss", None, "person", None, "is", None)) == {"Lucius", "Diogo"}
+        assert kb.migrate_keys() == 0
+    finally:
+        kb.close()
+
+def test_namespaces(initialize_knowledge_base):
+
+    kb: KnowledgeBase = initialize_knowledge_base
+    if isinstance(kb, SQLiteKnowledgeBase):
+        pytest.skip("SQLite knowledge bases are separated by their files")
+
+    other = KnowledgeBase(password=os.environ.get("NEO4J_PASSWORD"), namespace=kb.namespace + "_other")
+    try:
+        relation = Relation("Diogo", EntityType.INSTANCE, "beans", EntityType.TYPE, "eats", RelType.OTHER)
+        kb.add_knowledge("Lucius", relation)
+        other.add_knowledge("Diogo", relation.inverse())
+
+        assert kb.query_declarators(relation) == {"Lucius"}
+        assert other.query_declarators(relation) == set()
+        assert other.get_all_declarators() == {"Diogo"}
+
+        other.delete_all()
+        assert kb.count_entities() == 2
+        assert other.count_entities() == 0
+    finally:
+        other.delete_all()
+        other.close()
+        kb.delete_all()
+
+def test_warm_up(initialize_knowledge_base):
+
+    kb: KnowledgeBase = initialize_knowledge_base
+    if isinstance(kb, SQLiteKnowledgeBase):
+        pytest.skip("Only the Neo4j knowledge base holds a connection pool")
+
+    kb.warm_up(connections=2)
+
+    assert kb.stats()["methods"]["query_inheritance_relation_page"]["errors"] == 0
+
+def test_snapshot_round_trip(initialize_knowledge_base, tmp_path):
+
+    kb: KnowledgeBase = initialize_knowledge_base
+    kb.delete_all()
+
+    for declarator, relation in EXAMPLE_DATA:
+        kb.add_knowledge(declarator, relation)
+    declarations = {declarator: kb.query_declarations(declarator) for declarator in kb.get_all_declarators()}
+
+    assert kb.export_snapshot(str(tmp_path / "kb.snapshot")) == len(EXAMPLE_DATA)
+
+    kb.delete_all()
+
+    assert kb.import_snapshot(str(tmp_path / "kb.snapshot")) == len(EXAMPLE_DATA)
+    assert {declarator: kb.query_declarations(declarator) for declarator in kb.get_all_declarators()} == declarations
+
+    kb.delete_all()
+
+def test_purge_declarator(example_data):
+
+    kb: KnowledgeBase = example_data
+    purged = []
+
+    with listening(kb, purged.append):
+        assert kb.purge_declarator("Diogo", batch_size=4) == len([declarator for declarator, _ in EXAMPLE_DATA if declarator == "Diogo"])
+
+    assert [(change.operation, change.declarator) for change in purged] == [("purge", "Diogo")]
+    assert kb.get_all_declarators() == {"Lucius", "Martinho"}
+    assert kb.query_declarations("Diogo") == set()
+    assert kb.query_local_relation("Lucius", "likes", RelType.OTHER) == set()
+    assert kb.query_local_relation("Diogo", "is", RelType.OTHER) == {"cringe", "working"}
+
+def test_changes_published_in_commit_order(initialize_knowledge_base):
+
+    kb: KnowledgeBase = initialize_knowledge_base
+    published = []
+
+    def listener(change):
+        # Slow listener, which records how many entities were committed by the time each change is published
+        time.sleep(0.01)
+        published.append(kb.count_entities())
+
+    try:
+        with listening(kb, listener), ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: kb.add_knowledge("Lucius", Relation(f"thing{i}", EntityType.TYPE, f"property{i}", EntityType.TYPE, "is", RelType.OTHER)),
+                              range(16)))
+    finally:
+        kb.delete_all()
+
+    assert published == list(range(2, 34, 2))
+
+def test_delete_all_in_batches(example_data):
+
+    kb: KnowledgeBase = example_data
+    kb.delete_all(batch_size=4)
+
+    assert kb.get_all_declarators() == set()
+    assert kb.query_local("Diogo") == set()
+
+def test_stream_declarations(example_data):
+
+    kb: KnowledgeBase = example_data
+
+    for declarator in kb.get_all_declarators():
+        declarations = {(relation.ent1, relation.ent1_type.value, relation.ent2, relation.ent2_type.value, relation.name, relation.type_.value, relation.not_)
+                        for relation in kb.query_declarations(declarator)}
+
+        assert sorted(kb.stream_declarations(declarator, fetch_size=2)) == sorted(declarations)
+
+        pages, after = [], None
+        while True:
+            page, after = kb.query_declarations_page(declarator, after=after, limit=2)
+            assert len(page) <= 2
+            pages.extend(page)
+            if after is None:
+                break
+        assert sorted(pages) == sorted(declarations)
@@ -0,0 +1,125 @@
+import json
+import urllib.request
+
+import pytest
+
+from sn.kb import DriverConfig, KnowledgeBase, Relation
+from sn.tracing import tracer
+
+
+class FakeTransientError(Exception):
+    pass
+
+class FakeRecord(dict):
+    def value(self, key=0, default=None):
+        return self.get(key, default)
+
+class FakeSession:
+    """Session whose results contain `rows` records, and whose first `failures` transaction attempts fail and are retried."""
+
+    def __init__(self, rows, failures):
+        self.rows = rows
+        self.failures = failures
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def run(self, query, *args, **kwargs):
+        if self.failures > 0:
+            self.failures -= 1
+            raise FakeTransientError()
+        return iter([FakeRecord(declarator=f"user{i}") for i in range(self.rows)])
+
+    def execute_read(self, transaction_function, *args, **kwargs):
+        while True:
+            try:
+                return transaction_function(self, *args, **kwargs)
+            except FakeTransientError:
+                continue
+
+    execute_write = execute_read
+
+class FakeDriver:
+    def __init__(self, rows=0, failures=0):
+        self.rows = rows
+        self.failures = failures
+        self.session_configs = []
+
+    def session(self, **config):
+        self.session_configs.append(config)
+        return FakeSession(self.rows, self.failures)
+
+    def close(self):
+        pass
+
+def test_stats():
+    kb = KnowledgeBase(driver=FakeDriver(rows=3, failures=1), create_indexes=False)
+    kb.get_all_declarators()
+    kb.get_all_declarators()
+
+    stats = kb.stats()
+    method = stats["methods"]["get_all_declarators"]
+
+    assert stats["sessions"] == 2
+    assert (method["calls"], method["errors"], method["rows"], method["statements"], method["retries"]) == (2, 0, 6, 2, 2)
+    assert method["latency_buckets"][-1][1] == 2
+
+def test_traced_calls(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    kb = KnowledgeBase(driver=FakeDriver(rows=3, failures=1), create_indexes=False)
+
+    tracer.enable(str(path))
+    try:
+        kb.get_all_declarators()
+    finally:
+        tracer.disable()
+
+    with open(path) as f:
+        span, = [record for record in map(json.loads, f) if record.get("name") == "kb.get_all_declarators"]
+    method = kb.stats()["methods"]["get_all_declarators"]
+
+    # The span includes the failed attempt, unlike the metrics
+    assert (span["attributes"]["statements"], span["attributes"]["rows"], len(span["attributes"]["templates"])) == (2, 3, 2)
+    assert (method["statements"], method["rows"]) == (1, 3)
+
+def test_stats_errors():
+    kb = KnowledgeBase(driver=FakeDriver(), create_indexes=False)
+
+    with pytest.raises(ValueError):
+        kb.add_knowledge("Diogo", Relation("Diogo", None, "Person", None, "is", None))
+
+    assert kb.stats()["methods"]["add_knowledge"]["errors"] == 1
+
+def test_prometheus_endpoint():
+    kb = KnowledgeBase(driver=FakeDriver(rows=1), create_indexes=False)
+    kb.get_all_declarators()
+    kb.serve_metrics(port=0)
+
+    try:
+        host, port = kb._metrics_server.server_address
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            body = response.read().decode()
+    finally:
+        kb.close()
+
+    assert 'sn_kb_calls_total{method="get_all_declarators"} 1' in body
+    assert 'sn_kb_latency_seconds_bucket{method="get_all_declarators",le="+Inf"} 1' in body
+
+def test_driver_config(monkeypatch):
+    monkeypatch.setenv("NEO4J_PASSWORD", "secret")
+    monkeypatch.setenv("NEO4J_DATABASE", "knowledge")
+    monkeypatch.setenv("NEO4J_FETCH_SIZE", "200")
+    monkeypatch.setenv("NEO4J_KEEP_ALIVE", "false")
+
+    config = DriverConfig.from_env(uri="bolt://db:7687", user=None)
+    assert config == DriverConfig(uri="bolt://db:7687", password="secret", database="knowledge", fetch_size=200, keep_alive=False)
+
+    driver = FakeDriver()
+    kb = KnowledgeBase(password="other", driver=driver, create_indexes=False)
+    kb.get_all_declarators()
+
+    assert kb.config.password == "other"
+    assert driver.session_configs == [{"database": "knowledge", "fetch_size": 200}]
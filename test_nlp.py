@@ -9,6 +9,9 @@ class KnowledgeBaseMock(): #AQUI
     def add_knowledge(declarator, relation, tx):
         pass
 
+    def add_knowledge_batch(self, declarator, relations):
+        return len(relations)
+
 @pytest.fixture(autouse=True)
 def initialize_knowledge_base():
     kb = KnowledgeBaseMock()
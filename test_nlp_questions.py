@@ -1,12 +1,15 @@
+import os
+
 import pytest
 
 from sn.kb import KnowledgeBase, Relation, EntityType, RelType
 from nlp.objects import Triples, Entity
 from nlp.main import add_knowledge, init, query_knowledge
+from test_knowledge_base import module_namespace
 
 @pytest.fixture(autouse=True)
-def initialize_knowledge_base():
-    kb = KnowledgeBase("bolt://localhost:7687", "neo4j", "Sussy_baka123321")
+def initialize_knowledge_base(request):
+    kb = KnowledgeBase(password=os.environ.get("NEO4J_PASSWORD"), namespace=module_namespace(request))
     kb.delete_all()
     
     yield kb
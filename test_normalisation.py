@@ -0,0 +1,46 @@
+import pytest
+
+from nlp import normalisation
+from nlp.normalisation import singularize
+
+
+class TokenMock():
+    def __init__(self, text, tag_, lemma_):
+        self.text = text
+        self.tag_ = tag_
+        self.lemma_ = lemma_
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    normalisation.clear()
+    yield
+    normalisation.clear()
+
+def test_singularize_simple_entity():
+    assert singularize("bananas") == "banana"
+
+def test_compound_entity_untouched():
+    assert singularize("playing games") == "playing games"
+
+def test_recurring_words_hit_cache():
+    for _ in range(3):
+        singularize("beans")
+
+    stats = normalisation.stats()
+
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+def test_plural_token_lemma_reused():
+    assert singularize("Dogs", TokenMock("Dogs", "NNS", "dog")) == "Dog"
+    assert singularize("wolves", TokenMock("wolves", "NNS", "wolf")) == "wolf"
+
+    stats = normalisation.stats()
+
+    assert stats["lemma_reuses"] == 2
+    assert stats["misses"] == 0
+
+def test_non_plural_token_falls_back_to_textblob():
+    assert singularize("Diogo", TokenMock("Diogo", "NNP", "Diogo")) == "Diogo"
+    assert normalisation.stats()["misses"] == 1
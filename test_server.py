@@ -0,0 +1,59 @@
+import asyncio
+import json
+import os
+
+import pytest
+import spacy
+
+from nlp.server import ChatbotServer
+from test_engine import KnowledgeBaseMock
+
+
+def blank_pipeline() -> spacy.Language:
+    """Pipeline which only tokenizes, so that messages go through the server without the English model."""
+
+    return spacy.blank("en")
+
+async def exchange(path: str, messages: list) -> list:
+    """Send `messages` through a new connection to the server at `path`, returning the replies."""
+
+    reader, writer = await asyncio.open_unix_connection(path)
+    replies = []
+    for message in messages:
+        writer.write((message if isinstance(message, str) else json.dumps(message)).encode() + b"\n")
+        await writer.drain()
+        replies.append(json.loads(await reader.readline()))
+    writer.close()
+    await writer.wait_closed()
+    return replies
+
+async def serve_and_exchange(server: ChatbotServer, path: str, clients: list) -> list:
+    """Serve on `path` while each client's messages are exchanged concurrently."""
+
+    serving = asyncio.create_task(server.serve(unix_path=path))
+    try:
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        return await asyncio.gather(*(exchange(path, messages) for messages in clients))
+    finally:
+        serving.cancel()
+        try:
+            await serving
+        except asyncio.CancelledError:
+            pass
+
+@pytest.mark.parametrize("parse_processes", [0, 2])
+def test_round_trip(tmp_path, parse_processes):
+    server = ChatbotServer(KnowledgeBaseMock(), workers=4, parse_processes=parse_processes, nlp=blank_pipeline())
+    clients = [[{"user": f"user{i}", "text": f"What does user{i} like?"}, "not json", {"text": "Who am I?"}] for i in range(8)]
+
+    try:
+        replies = asyncio.run(serve_and_exchange(server, str(tmp_path / "chatbot.sock"), clients))
+    finally:
+        server.close()
+
+    for i, (answer, malformed, anonymous) in enumerate(replies):
+        assert answer["user"] == f"user{i}"
+        assert isinstance(answer["response"], str) and answer["elapsed"] > 0
+        assert answer["timings"]["parse"] > 0
+        assert "error" in malformed and "error" in anonymous
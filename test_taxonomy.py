@@ -0,0 +1,55 @@
+import pytest
+from test_knowledge_base import example_data, example_snapshot, initialize_knowledge_base, listening
+from sn.kb import EntityType, KnowledgeBase, RelType, Relation
+from sn.taxonomy import Taxonomy
+
+@pytest.fixture()
+def taxonomy(example_data):
+
+    kb: KnowledgeBase = example_data
+    taxonomy = Taxonomy.load(kb)
+
+    with listening(kb, taxonomy.apply):
+        yield kb, taxonomy
+
+def test_ancestors(taxonomy):
+
+    kb, taxonomy = taxonomy
+
+    assert taxonomy.ancestors("Diogo") == {"person": 1, "mammal": 2, "animal": 3}
+    assert taxonomy.ancestors("Diogo", EntityType.TYPE) == {}
+    assert taxonomy.ancestors("animal") == {}
+    assert taxonomy.ancestors("nobody") == {}
+    # Entities are looked up by their canonical keys
+    assert taxonomy.ancestors("diogo") == taxonomy.ancestors("Diogo")
+    assert taxonomy.descendants("Mammals") == taxonomy.descendants("mammal")
+
+    # Same as the database's inheritance chains
+    for subject, distance in kb.assert_relation_inheritance(Relation("Diogo", None, "water", None, "drinks", None)):
+        assert taxonomy.ancestors("Diogo")[subject] == distance
+
+def test_descendants(taxonomy):
+
+    _, taxonomy = taxonomy
+
+    assert taxonomy.descendants("mammal") == {"person", "Diogo", "Lucius"}
+    assert taxonomy.descendants("Diogo") == set()
+
+def test_taxonomy_follows_writes(taxonomy):
+
+    kb, taxonomy = taxonomy
+
+    kb.add_knowledge("Martinho", Relation("animal", EntityType.TYPE, "living being", EntityType.TYPE, "is", RelType.INHERITS))
+    kb.add_knowledge("Martinho", Relation("Diogo", EntityType.INSTANCE, "mammal", EntityType.TYPE, "is", RelType.INHERITS))
+    # Other relations aren't part of the taxonomy
+    kb.add_knowledge("Martinho", Relation("Diogo", EntityType.INSTANCE, "animal", EntityType.TYPE, "likes", RelType.OTHER))
+
+    assert taxonomy.ancestors("Diogo") == {"person": 1, "mammal": 1, "animal": 2, "living being": 3}
+
+    # person -> mammal was only declared by Martinho
+    kb.purge_declarator("Martinho")
+    assert taxonomy.ancestors("Diogo") == {"person": 1}
+    assert taxonomy.descendants("mammal") == set()
+
+    kb.delete_all()
+    assert len(taxonomy) == 0
@@ -0,0 +1,65 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+from sn.tracing import Tracer
+
+
+@pytest.fixture
+def tracer(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = Tracer(str(path))
+    yield tracer, path
+    tracer.disable()
+
+def read_spans(path):
+    with open(path) as f:
+        return [record for record in map(json.loads, f) if "name" in record]
+
+def test_nested_spans(tracer):
+    tracer, path = tracer
+
+    with tracer.span("outer"):
+        with tracer.span("inner") as span:
+            span.add("rows", 3)
+
+    inner, outer = read_spans(path)
+
+    assert (inner["name"], outer["name"]) == ("inner", "outer")
+    assert inner["parent"] == outer["span"]
+    assert inner["trace"] == outer["trace"] == outer["span"]
+    assert inner["attributes"] == {"rows": 3}
+    assert outer["duration_ms"] >= inner["duration_ms"]
+
+def test_traced_function_errors(tracer):
+    tracer, path = tracer
+
+    @tracer.traced("failing")
+    def failing():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        failing()
+
+    assert read_spans(path)[0]["attributes"] == {"error": "ValueError"}
+
+def test_disabled_tracer_writes_nothing(tracer):
+    tracer, path = tracer
+    tracer.disable()
+
+    @tracer.traced()
+    def double(x):
+        return 2 * x
+
+    assert double(2) == 4
+    assert read_spans(path) == []
+
+def test_templates_are_written_once(tracer):
+    tracer, path = tracer
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        template_ids = set(executor.map(lambda _: tracer.template("MATCH (e {ns: $ns}) RETURN e"), range(64)))
+
+    with open(path) as f:
+        templates = [record for record in map(json.loads, f) if "template" in record]
+    assert [record["template"] for record in templates] == list(template_ids)
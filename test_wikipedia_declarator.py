@@ -0,0 +1,46 @@
+import bz2
+import io
+
+from wikipedia_declarator import articles, declare_to_stdout, load_checkpoint, no_wiki_markup, numbered_articles, paragraphs, sentences
+
+
+DUMP = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">
+<page><title>Cat</title><ns>0</ns><revision><text>{{Infobox|a={{b}}}}The '''cat''' is a [[mammal|small mammal]].&lt;ref&gt;x&lt;/ref&gt; Cats like [[fish]].</text></revision></page>
+<page><title>Kitty</title><ns>0</ns><redirect title="Cat"/><revision><text>#REDIRECT [[Cat]]</text></revision></page>
+<page><title>Talk:Cat</title><ns>1</ns><revision><text>Cats are great.</text></revision></page>
+<page><title>Dog</title><ns>0</ns><revision><text>The dog is an animal.</text></revision></page>
+</mediawiki>
+"""
+
+def test_no_wiki_markup():
+    assert no_wiki_markup("{{a|{{b}}}}The '''cat''' likes [[fish|fishes]]<ref>x</ref>") == "The cat likes fishes"
+
+def test_sentences():
+    lines = ["Dogs are mammals.[1] Dogs like bones.", "", "Cats like fish."]
+
+    assert list(sentences(lines)) == ["Dogs are mammals", "Dogs like bones", "Cats like fish"]
+
+def test_paragraphs():
+    lines = ["Dogs are mammals.[1] Dogs like bones.", "  ", "Cats like fish."]
+
+    assert list(paragraphs(lines)) == ["Dogs are mammals. Dogs like bones.", "Cats like fish."]
+
+def test_dump_articles(tmp_path):
+    path = tmp_path / "dump.xml.bz2"
+    path.write_bytes(bz2.compress(DUMP.encode()))
+
+    output = [(title, list(sentences(lines))) for title, lines in articles(str(path))]
+
+    assert output == [("Cat", ["The cat is a small mammal", "Cats like fish"]), ("Dog", ["The dog is an animal"])]
+
+def test_resume_from_checkpoint(tmp_path):
+    path = tmp_path / "dump.xml"
+    path.write_text(DUMP)
+    checkpoint = str(tmp_path / "checkpoint.json")
+
+    declare_to_stdout(numbered_articles([articles(str(path))]), checkpoint, output=io.StringIO())
+    assert load_checkpoint(checkpoint) == 2
+
+    output = io.StringIO()
+    declare_to_stdout(numbered_articles([articles(str(path))], start=1), checkpoint, output=output)
+    assert output.getvalue().splitlines() == ["Wikipedia", "The dog is an animal", "q!"]
@@ -0,0 +1,128 @@
+import time
+import pytest
+from test_knowledge_base import EXAMPLE_DATA, initialize_knowledge_base
+from sn.kb import EntityType, KnowledgeBase, RelType, Relation
+from sn.write_behind import WriteBehindKnowledgeBase
+
+class FailingKnowledgeBase:
+    """Knowledge base whose first `failures` writes fail, and whose writes take `delay` seconds."""
+
+    def __init__(self, failures, delay=0):
+        self.failures = failures
+        self.delay = delay
+        self.batches = []
+
+    def add_knowledge_batch(self, declarator, relations):
+        time.sleep(self.delay)
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("Database unavailable")
+        self.batches.append((declarator, list(relations)))
+        return len(self.batches[-1][1])
+
+    def query_declarations(self, declarator):
+        return {relation for batch_declarator, relations in self.batches if batch_declarator == declarator for relation in relations}
+
+    def close(self):
+        pass
+
+@pytest.fixture()
+def write_behind_kb(initialize_knowledge_base):
+
+    kb: KnowledgeBase = initialize_knowledge_base
+    # Only written by flushes, unless a test waits for a minute
+    write_behind = WriteBehindKnowledgeBase(kb, flush_interval=60, max_pending=1000)
+
+    yield write_behind
+
+    write_behind.flush()
+    kb.delete_all()
+
+def test_reads_see_pending_writes(write_behind_kb):
+
+    kb = write_behind_kb
+    for declarator, relation in EXAMPLE_DATA:
+        kb.add_knowledge(declarator, relation)
+
+    assert kb.pending() == len(EXAMPLE_DATA)
+    assert kb.query_local_relation("Diogo", "eats", RelType.OTHER) == {"chips"}
+    assert kb.pending() == 0
+    assert kb.query_declarators(EXAMPLE_DATA[-1][1]) == {"Lucius"}
+
+def test_writes_are_coalesced(write_behind_kb):
+
+    kb = write_behind_kb
+    kb.metrics.reset()
+    for declarator, relation in EXAMPLE_DATA:
+        kb.add_knowledge(declarator, relation)
+    kb.flush()
+
+    calls = kb.stats()["methods"]
+    assert "add_knowledge" not in calls
+    # One batch per run of consecutive declarations by the same declarator
+    assert calls["add_knowledge_batch"]["calls"] == 7
+
+def test_invalid_declarations_are_rejected_immediately(write_behind_kb):
+
+    with pytest.raises(ValueError):
+        write_behind_kb.add_knowledge("Diogo", Relation("Diogo", None, "person", None, "is", None))
+    assert write_behind_kb.pending() == 0
+
+def test_failed_writes_are_retried():
+
+    kb = FailingKnowledgeBase(failures=1)
+    write_behind = WriteBehindKnowledgeBase(kb, flush_interval=60)
+    relation = Relation("Diogo", EntityType.INSTANCE, "person", EntityType.TYPE, "is", RelType.INHERITS)
+    write_behind.add_knowledge("Lucius", relation)
+
+    with pytest.raises(ConnectionError):
+        write_behind.flush()
+    assert write_behind.pending() == 1
+
+    write_behind.close()
+    assert kb.batches == [("Lucius", [relation])]
+
+def test_background_flush():
+
+    kb = FailingKnowledgeBase(failures=0)
+    write_behind = WriteBehindKnowledgeBase(kb, flush_interval=60, max_pending=2)
+    relation = Relation("Diogo", EntityType.INSTANCE, "person", EntityType.TYPE, "is", RelType.INHERITS)
+    write_behind.add_knowledge("Lucius", relation)
+    write_behind.add_knowledge("Diogo", relation)
+
+    for _ in range(500):
+        if write_behind.pending() == 0 and len(kb.batches) == 2:
+            break
+        time.sleep(0.01)
+
+    assert kb.batches == [("Lucius", [relation]), ("Diogo", [relation])]
+    write_behind.close()
+
+def test_reads_wait_for_background_flush():
+
+    kb = FailingKnowledgeBase(failures=0, delay=0.3)
+    write_behind = WriteBehindKnowledgeBase(kb, flush_interval=0.05)
+    relation = Relation("Diogo", EntityType.INSTANCE, "person", EntityType.TYPE, "is", RelType.INHERITS)
+    write_behind.add_knowledge("Lucius", relation)
+
+    # The flusher has taken the declaration off the queue, but hasn't written it yet
+    time.sleep(0.15)
+    assert write_behind.pending() == 0 and kb.batches == []
+    assert write_behind.query_declarations("Lucius") == {relation}
+    write_behind.close()
+
+def test_background_error_is_cleared_by_retry():
+
+    kb = FailingKnowledgeBase(failures=1)
+    write_behind = WriteBehindKnowledgeBase(kb, flush_interval=0.05)
+    relation = Relation("Diogo", EntityType.INSTANCE, "person", EntityType.TYPE, "is", RelType.INHERITS)
+    write_behind.add_knowledge("Lucius", relation)
+
+    for _ in range(500):
+        if len(kb.batches) == 1:
+            break
+        time.sleep(0.01)
+
+    assert write_behind.query_declarations("Lucius") == {relation}
+    assert write_behind.error is None
+    write_behind.close()
@@ -1,21 +1,67 @@
+import argparse
+import bz2
+import json
+import os
 import re
+import sys
+from typing import Iterable, Iterator, TextIO, Tuple
+from xml.etree.ElementTree import iterparse
+
+
+DECLARATOR = 'Wikipedia'
+
+_SENTENCE_END = re.compile(r'\.[ ]?')
+_REFERENCE = re.compile(r'\[\d+\][ ]?')
+# References within a paragraph, which keep the space separating them from the next sentence
+_INLINE_REFERENCE = re.compile(r'\[\d+\]')
+_BLANKLINES = re.compile(r'\n[\n]+')
+_TABS_OR_WHITESPACE = re.compile(r'\t| ([ ]+)')
+
+# MediaWiki markup
+_WIKI_COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+_WIKI_REF = re.compile(r'<ref[^>]*/>|<ref[^>]*>.*?</ref>', re.DOTALL | re.IGNORECASE)
+_WIKI_TEMPLATE = re.compile(r'\{\{[^{}]*\}\}')
+_WIKI_TABLE = re.compile(r'\{\|.*?\|\}', re.DOTALL)
+_WIKI_FILE_LINK = re.compile(r'\[\[(?:File|Image|Category):[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]', re.IGNORECASE)
+_WIKI_LINK = re.compile(r'\[\[(?:[^|\]]*\|)?([^\]]*)\]\]')
+_WIKI_EXTERNAL_LINK = re.compile(r'\[https?://[^\s\]]+ ?([^\]]*)\]')
+_WIKI_TAG = re.compile(r'<[^>]+>')
+_WIKI_EMPHASIS = re.compile(r"'{2,}")
+_WIKI_HEADING = re.compile(r'^=+.*?=+[ ]*$', re.MULTILINE)
+_WIKI_LIST = re.compile(r'^[*#:;]+[ ]*', re.MULTILINE)
 
 
 def separate_sentences(s: str) -> str:
-    return re.sub(r'\.[ ]?', '\n', s)
+    return _SENTENCE_END.sub('\n', s)
 
 def no_references(s: str) -> str:
-    return re.sub(r'\[\d+\][ ]?', '', s)
+    return _REFERENCE.sub('', s)
 
 def no_blanklines(s: str) -> str:
-    return re.sub(r'\n[\n]+', '\n', s)
+    return _BLANKLINES.sub('\n', s)
 
 def no_tabs_or_whitespace(s: str) -> str:
-    return re.sub(r'\t| ([ ]+)', '', s)
+    return _TABS_OR_WHITESPACE.sub('', s)
 
+def no_wiki_markup(s: str) -> str:
+    """Reduce MediaWiki markup to plain text. Nested templates are removed from the inside out."""
 
-if __name__ == '__main__':
-    dog = """The dog (Canis familiaris[4][5] or Canis lupus familiaris[5]) is a domesticated descendant of the wolf. Also called the domestic dog, it is derived from the extinct Pleistocene wolf,[6][7] and the modern wolf is the dog's nearest living relative.[8] Dogs were the first species to be domesticated[9][8] by hunter-gatherers over 15,000 years ago[7] before the development of agriculture.[1] Due to their long association with humans, dogs have expanded to a large number of domestic individuals[10] and gained the ability to thrive on a starch-rich diet that would be inadequate for other canids.[11]
+    s = _WIKI_COMMENT.sub('', s)
+    s = _WIKI_REF.sub('', s)
+    s, n = _WIKI_TEMPLATE.subn('', s)
+    while n > 0:
+        s, n = _WIKI_TEMPLATE.subn('', s)
+    s = _WIKI_TABLE.sub('', s)
+    s = _WIKI_FILE_LINK.sub('', s)
+    s = _WIKI_LINK.sub(r'\1', s)
+    s = _WIKI_EXTERNAL_LINK.sub(r'\1', s)
+    s = _WIKI_TAG.sub('', s)
+    s = _WIKI_EMPHASIS.sub('', s)
+    s = _WIKI_HEADING.sub('', s)
+    return _WIKI_LIST.sub('', s)
+
+
+DOG = """The dog (Canis familiaris[4][5] or Canis lupus familiaris[5]) is a domesticated descendant of the wolf. Also called the domestic dog, it is derived from the extinct Pleistocene wolf,[6][7] and the modern wolf is the dog's nearest living relative.[8] Dogs were the first species to be domesticated[9][8] by hunter-gatherers over 15,000 years ago[7] before the development of agriculture.[1] Due to their long association with humans, dogs have expanded to a large number of domestic individuals[10] and gained the ability to thrive on a starch-rich diet that would be inadequate for other canids.[11]
 The dog has been selectively bred over millennia for various behaviors, sensory capabilities, and physical attributes.[12] Dog breeds vary widely in shape, size, and color. They perform many roles for humans, such as hunting, herding, pulling loads, protection, assisting police and the military, companionship, therapy, and aiding disabled people. Over the millennia, dogs became uniquely adapted to human behavior, and the human-canine bond has been a topic of frequent study.[13] This influence on human society has given them the sobriquet of "man's best friend".[14]
 In 1758, the Swedish botanist and zoologist Carl Linnaeus published in his Systema Naturae, the two-word naming of species (binomial nomenclature). Canis is the Latin word meaning "dog",[15] and under this genus, he listed the domestic dog, the wolf, and the golden jackal. He classified the domestic dog as Canis familiaris and, on the next page, classified the grey wolf as Canis lupus.[2] Linnaeus considered the dog to be a separate species from the wolf because of its upturning tail (cauda recurvata), which is not found in any other canid.[16]
 In 1999, a study of mitochondrial DNA (mtDNA) indicated that the domestic dog may have originated from the grey wolf, with the dingo and New Guinea singing dog breeds having developed at a time when human communities were more isolated from each other.[17] In the third edition of Mammal Species of the World published in 2005, the mammalogist W. Christopher Wozencraft listed under the wolf Canis lupus its wild subspecies and proposed two additional subspecies, which formed the domestic dog clade: familiaris, as named by Linnaeus in 1758 and, dingo named by Meyer in 1793. Wozencraft included hallstromi (the New Guinea singing dog) as another name (junior synonym) for the dingo. Wozencraft referred to the mtDNA study as one of the guides informing his decision.[3] Mammalogists have noted the inclusion of familiaris and dingo together under the "domestic dog" clade[18] with some debating it.[19]
@@ -45,11 +91,192 @@ Neutering reduces problems caused by hypersexuality, especially in male dogs.[47
 A common breeding practice for pet dogs is mating between close relatives (e.g., between half and full siblings).[52] Inbreeding depression is considered to be due mainly to the expression of homozygous deleterious recessive mutations.[53] Outcrossing between unrelated individuals, including dogs of different breeds, results in the beneficial masking of deleterious recessive mutations in progeny.[54]
 In a study of seven dog breeds (the Bernese Mountain Dog, Basset Hound, Cairn Terrier, Brittany, German Shepherd Dog, Leonberger, and West Highland White Terrier), it was found that inbreeding decreases litter size and survival.[55] Another analysis of data on 42,855 Dachshund litters found that as the inbreeding coefficient increased, litter size decreased and the percentage of stillborn puppies increased, thus indicating inbreeding depression.[56] In a study of Boxer litters, 22% of puppies died before reaching 7 weeks of age. Stillbirth was the most frequent cause of death, followed by infection. Mortality due to infection increased significantly with increases in inbreeding.[57] 
 """
-    
-    print('Wikipedia')
-    print(
-        no_blanklines(
-        no_references(
-        separate_sentences(
-        dog))))
-    print('q!')
+
+
+# ------------------------ Article sources --------------------------
+# Each source lazily yields `(title, lines)` pairs, one per article, where `lines` is an iterable of raw text lines.
+
+def text_articles(path: str) -> Iterator[Tuple[str, Iterable[str]]]:
+    """A plaintext file is a single article, read line by line. Files ending in `.bz2` are decompressed on the fly."""
+
+    opener = bz2.open if path.endswith('.bz2') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        yield path, f
+
+def directory_articles(path: str) -> Iterator[Tuple[str, Iterable[str]]]:
+    """Every file of a directory (and its subdirectories) is an article, in lexicographic order."""
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+            yield from articles(os.path.join(root, file))
+
+def _wiki_lines(text: str) -> Iterator[str]:
+    """Lines of a page's wikitext, cleaned once the lines are first requested."""
+
+    yield from no_wiki_markup(text).splitlines()
+
+def dump_articles(path: str) -> Iterator[Tuple[str, Iterable[str]]]:
+    """Articles of a MediaWiki XML dump, optionally compressed with bz2. Redirects and non-article pages are skipped. \n
+    Pages are parsed one at a time and detached from the document afterwards, so memory usage doesn't grow with the size of the dump.
+    The markup of an article is only removed when its lines are iterated, so skipped articles aren't cleaned.
+    """
+
+    opener = bz2.open if path.endswith('.bz2') else open
+    with opener(path, 'rb') as f:
+        title, namespace, redirect, text = None, '0', False, None
+        root = None
+
+        for event, element in iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                continue
+
+            tag = element.tag.rsplit('}', 1)[-1]
+
+            if tag == 'title':
+                title = element.text
+            elif tag == 'ns':
+                namespace = element.text
+            elif tag == 'redirect':
+                redirect = True
+            elif tag == 'text':
+                text = element.text
+            elif tag == 'page':
+                if namespace == '0' and not redirect and text:
+                    yield title, _wiki_lines(text)
+                title, namespace, redirect, text = None, '0', False, None
+                # Parsed pages stay attached to the root element unless it's cleared as well
+                root.clear()
+
+def articles(path: str) -> Iterator[Tuple[str, Iterable[str]]]:
+    """Articles of a plaintext file, a directory or a MediaWiki XML dump (`.xml` or `.xml.bz2`)."""
+
+    if os.path.isdir(path):
+        return directory_articles(path)
+    if path.endswith('.xml') or path.endswith('.xml.bz2'):
+        return dump_articles(path)
+    return text_articles(path)
+
+
+# ------------------------ Processing stages --------------------------
+
+def sentences(lines: Iterable[str]) -> Iterator[str]:
+    """Clean and split lines into sentences, one line at a time."""
+
+    for line in lines:
+        for sentence in separate_sentences(no_references(line)).split('\n'):
+            if sentence.strip():
+                yield sentence
+
+def paragraphs(lines: Iterable[str]) -> Iterator[str]:
+    """Clean lines, each of which is a paragraph of one or more sentences."""
+
+    for line in lines:
+        paragraph = _INLINE_REFERENCE.sub('', line).strip()
+        if paragraph:
+            yield paragraph
+
+def numbered_articles(sources: Iterable[Iterator[Tuple[str, Iterable[str]]]], start: int=0) -> Iterator[Tuple[int, str, Iterable[str]]]:
+    """Number the articles of all sources, skipping the first `start` articles without cleaning them."""
+
+    number = 0
+    for source in sources:
+        for title, lines in source:
+            if number >= start:
+                yield number, title, lines
+            number += 1
+
+
+# ------------------------ Checkpoints --------------------------
+
+def load_checkpoint(path: str) -> int:
+    """Number of articles already processed according to the checkpoint file, or 0 if it doesn't exist."""
+
+    if path is None or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f)['articles']
+
+def save_checkpoint(path: str, articles: int, title: str):
+    """Atomically record that the first `articles` articles were processed, the last one being `title`."""
+
+    if path is None:
+        return
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump({'articles': articles, 'title': title}, f)
+    os.replace(temporary_path, path)
+
+
+# ------------------------ Sinks --------------------------
+
+def declare_to_stdout(numbered: Iterable[Tuple[int, str, Iterable[str]]], checkpoint: str=None, output: TextIO=None):
+    """Write sentences in the format expected by `nlp.main`: the declarator, one sentence per line and the quit command."""
+
+    output = output if output is not None else sys.stdout
+
+    print(DECLARATOR, file=output)
+    for number, title, lines in numbered:
+        for sentence in sentences(lines):
+            print(sentence, file=output)
+        output.flush()
+        save_checkpoint(checkpoint, number + 1, title)
+    print('q!', file=output)
+
+def declare_to_knowledge_base(numbered: Iterable[Tuple[int, str, Iterable[str]]], kb, checkpoint: str=None, batch_size: int=256):
+    """Parse paragraphs and write their knowledge straight into the knowledge base, in batches of at least `batch_size` relations.
+    Each paragraph is parsed once, and its sentences are found by the parser instead of split beforehand.
+    Sentences which can't be parsed are skipped. The checkpoint is only saved after an article's knowledge is written.
+    """
+
+    from nlp.main import init, extract_knowledge, knowledge_relations
+
+    nlp = init()
+
+    for number, title, lines in numbered:
+        relations = []
+        for doc in nlp.pipe(paragraphs(lines), batch_size=batch_size):
+            for sentence in doc.sents:
+                try:
+                    relations.extend(knowledge_relations(extract_knowledge(sentence)))
+                except Exception:
+                    continue
+            if len(relations) >= batch_size:
+                kb.add_knowledge_batch(DECLARATOR, relations)
+                relations = []
+        if len(relations) > 0:
+            kb.add_knowledge_batch(DECLARATOR, relations)
+        save_checkpoint(checkpoint, number + 1, title)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Declare knowledge from Wikipedia articles. Without inputs, the dog article is used.")
+    parser.add_argument('inputs', nargs='*', help="plaintext files, directories or MediaWiki XML dumps (.xml/.xml.bz2)")
+    parser.add_argument('--kb', action='store_true', help="write straight into the knowledge base instead of the standard output")
+    parser.add_argument('--checkpoint', default=None, help="file recording the last processed article, to resume from")
+    parser.add_argument('--batch-size', type=int, default=256, help="relations per knowledge base transaction")
+    parser.add_argument('--uri', default=None, help="defaults to NEO4J_URI, or bolt://localhost:7687")
+    parser.add_argument('--db-user', default=None, help="defaults to NEO4J_USER, or neo4j")
+    parser.add_argument('--db-password', default=None, help="defaults to NEO4J_PASSWORD")
+    parser.add_argument('--namespace', default=None, help="slice of the database to use, defaults to SN_NAMESPACE, or default")
+    args = parser.parse_args()
+
+    sources = [articles(path) for path in args.inputs] if args.inputs else [iter([('dog', DOG.splitlines())])]
+    numbered = numbered_articles(sources, start=load_checkpoint(args.checkpoint))
+
+    if args.kb:
+        from sn.kb import KnowledgeBase
+
+        kb = KnowledgeBase(args.uri, args.db_user, args.db_password, namespace=args.namespace)
+        try:
+            declare_to_knowledge_base(numbered, kb, args.checkpoint, args.batch_size)
+        finally:
+            kb.close()
+    else:
+        declare_to_stdout(numbered, args.checkpoint)
+
+
+if __name__ == '__main__':
+    main()